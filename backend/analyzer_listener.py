@@ -0,0 +1,658 @@
+"""
+Analyzer interface: receives results straight from instruments over TCP.
+
+Two listeners run in one asyncio process, separate from the API:
+  - ASTM E1381/E1394 (ENQ / framed records with checksums / EOT)
+  - HL7 v2 ORU^R01 over MLLP (<VT> message <FS><CR>, answered with an ACK)
+
+Bytes are parsed incrementally as they arrive. Each result is matched to its sample by
+barcode (or sample ID). Instrument codes are mapped to a test_code and parameter, using
+ANALYZER_CODES_FILE first and then the test catalog. All connections feed one queue, which
+is written in batches: draft results are upserted per (sample, test_name), flagged against
+the reference ranges and delta-checked, and the samples move to under_validation.
+
+Usage:
+    python analyzer_listener.py [--host 0.0.0.0] [--astm-port 5100] [--hl7-port 5200]
+
+ANALYZER_CODES_FILE is a JSON object of {"HGB": {"test_code": "CBC001", "parameter": "Hemoglobin"}};
+"HGB": "CBC001" is shorthand for a single-parameter test. See analyzer_simulator.py for a test client.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from server import (
+    TestResult, User, audit_writer, client, dashboard_counters, db, delta_checker, evaluate_results, log_audit,
+    test_catalog
+)
+
+logger = logging.getLogger("analyzer_listener")
+
+ANALYZER_HOST = os.environ.get('ANALYZER_HOST', '0.0.0.0')
+ANALYZER_ASTM_PORT = int(os.environ.get('ANALYZER_ASTM_PORT', '5100'))
+ANALYZER_HL7_PORT = int(os.environ.get('ANALYZER_HL7_PORT', '5200'))
+ANALYZER_CODES_FILE = os.environ.get('ANALYZER_CODES_FILE')
+ANALYZER_BATCH_SIZE = int(os.environ.get('ANALYZER_BATCH_SIZE', '500'))
+ANALYZER_QUEUE_SIZE = int(os.environ.get('ANALYZER_QUEUE_SIZE', '10000'))
+
+# Abnormal flags sent by analyzers (ASTM R-7, HL7 OBX-8); the reference-range engine overrides
+# them for parameters that have configured ranges
+ANALYZER_FLAGS = {"H": "high", ">": "high", "L": "low", "<": "low", "HH": "critical", "LL": "critical", "AA": "critical"}
+
+# Samples that are still in the lab move to under_validation once results arrive
+RESULT_PENDING_SAMPLE_STATUSES = ["collected", "received", "processing", "on_machine"]
+
+# ==================== ASTM ====================
+
+ENQ, STX, ETX, EOT, ACK, NAK, ETB = b"\x05", b"\x02", b"\x03", b"\x04", b"\x06", b"\x15", b"\x17"
+ASTM_MAX_FRAME = 247 + 7  # E1381 text limit plus STX, FN, ETX/ETB, checksum and CR LF
+
+
+def astm_checksum(frame: bytes) -> bytes:
+    """Modulo-256 sum of frame number through ETX/ETB, as two uppercase hex digits"""
+    return b"%02X" % (sum(frame) % 256)
+
+
+class ASTMReceiver:
+    """
+    Incremental E1381 link layer. feed() takes whatever bytes arrived and returns the
+    bytes to send back (ACK/NAK per frame) plus the record text of every completed
+    transmission (ENQ ... EOT). Partial frames stay buffered until the rest arrives.
+    Frame numbers (FN) run 1..7, 0, 1... from the ENQ: a frame repeating the last accepted
+    number is a retransmission after a lost ACK, so it is acknowledged again but not kept.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._text: List[str] = []
+        self._receiving = False
+        self._last_frame: Optional[int] = None  # FN of the last accepted frame, None right after ENQ
+        self.repeated = 0
+
+    def feed(self, data: bytes) -> Tuple[bytes, List[str]]:
+        self._buffer += data
+        replies = bytearray()
+        transmissions = []
+        while self._buffer:
+            first = self._buffer[:1]
+            if first == ENQ:
+                del self._buffer[0]
+                self._text = []
+                self._receiving = True
+                self._last_frame = None
+                replies += ACK
+            elif first == EOT:
+                del self._buffer[0]
+                if self._receiving and self._text:
+                    transmissions.append("".join(self._text))
+                self._text = []
+                self._receiving = False
+            elif first == STX:
+                end = next((i for i, byte in enumerate(self._buffer) if byte in (3, 0x17)), -1)
+                if end < 0:
+                    if len(self._buffer) > ASTM_MAX_FRAME:
+                        del self._buffer[0]
+                        replies += NAK
+                        continue
+                    break
+                if len(self._buffer) < end + 3:
+                    break
+                frame = bytes(self._buffer[1:end + 1])
+                checksum = bytes(self._buffer[end + 1:end + 3])
+                consumed = end + 3
+                if self._buffer[consumed:consumed + 2] == b"\r\n":
+                    consumed += 2
+                elif len(self._buffer) < consumed + 2:
+                    break
+                del self._buffer[:consumed]
+                if not self._receiving or checksum.upper() != astm_checksum(frame):
+                    replies += NAK
+                    continue
+                number = frame[0] - 0x30
+                expected = 1 if self._last_frame is None else (self._last_frame + 1) % 8
+                if number == expected:
+                    self._text.append(frame[1:-1].decode("latin-1"))
+                    self._last_frame = number
+                    replies += ACK
+                elif number == self._last_frame:
+                    self.repeated += 1
+                    replies += ACK
+                else:
+                    replies += NAK
+            else:
+                # Line noise between frames (stray CR/LF)
+                del self._buffer[0]
+        return bytes(replies), transmissions
+
+
+def _component(value: str, separator: str, index: int = 0) -> str:
+    parts = value.split(separator)
+    return parts[index].strip() if index < len(parts) else ""
+
+
+def parse_astm(text: str) -> List[Dict[str, Any]]:
+    """
+    E1394 records of one transmission -> messages, one per H record:
+    {"instrument": str, "results": [{"barcode", "code", "value", "unit", "ref_range", "flag"}]}.
+    Delimiters are taken from each H record.
+    """
+    messages = []
+    field, component = "|", "^"
+    message = None
+    barcode = ""
+    for record in re.split(r"[\r\n]+", text):
+        if not record:
+            continue
+        kind = record[:1].upper()
+        if kind == "H" and len(record) >= 5:
+            field, component = record[1], record[3]
+            fields = record.split(field)
+            message = {"instrument": _component(fields[4], component) if len(fields) > 4 else "", "results": []}
+            messages.append(message)
+            barcode = ""
+            continue
+        if message is None:
+            continue
+        fields = record.split(field)
+        if kind == "O":
+            # Specimen ID, falling back to the instrument specimen ID; rack/position components are dropped
+            barcode = (_component(fields[2], component) if len(fields) > 2 else "") or \
+                      (_component(fields[3], component) if len(fields) > 3 else "")
+        elif kind == "R" and len(fields) > 3 and barcode:
+            codes = [part.strip() for part in fields[2].split(component)]
+            code = next((part for part in codes[3:] if part), "") or next((part for part in codes if part), "")
+            status = fields[8].strip().upper() if len(fields) > 8 else ""
+            if not code or status in ("X", "I"):  # cannot be done / in progress
+                continue
+            message['results'].append({
+                "barcode": barcode,
+                "code": code,
+                "value": _component(fields[3], component),
+                "unit": fields[4].strip() if len(fields) > 4 else "",
+                "ref_range": fields[5].strip() if len(fields) > 5 else "",
+                "flag": fields[6].strip().upper() if len(fields) > 6 else "",
+            })
+    return messages
+
+# ==================== HL7 / MLLP ====================
+
+MLLP_START, MLLP_END = b"\x0b", b"\x1c\r"
+
+
+def mllp_wrap(message: str) -> bytes:
+    return MLLP_START + message.encode("utf-8") + MLLP_END
+
+
+class MLLPReceiver:
+    """Incremental MLLP framing: feed() bytes, get back every complete message"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> List[str]:
+        self._buffer += data
+        messages = []
+        while True:
+            start = self._buffer.find(MLLP_START)
+            if start < 0:
+                self._buffer.clear()
+                break
+            end = self._buffer.find(MLLP_END, start)
+            if end < 0:
+                del self._buffer[:start]
+                break
+            messages.append(self._buffer[start + 1:end].decode("utf-8", errors="replace"))
+            del self._buffer[:end + len(MLLP_END)]
+        return messages
+
+
+def parse_hl7(text: str) -> Dict[str, Any]:
+    """
+    ORU^R01 -> {"control_id", "instrument", "msh": fields, "results": [...]} with the same
+    result keys as parse_astm. The barcode is OBR-3 (filler order number), else OBR-2.
+    """
+    segments = [segment for segment in re.split(r"[\r\n]+", text) if segment]
+    if not segments or not segments[0].startswith("MSH") or len(segments[0]) < 8:
+        raise ValueError("Message does not start with an MSH segment")
+    field = segments[0][3]
+    component = segments[0][4]
+    # MSH-1 is the field separator itself, so MSH-n is msh[n - 1]
+    msh = segments[0].split(field)
+    message = {
+        "control_id": msh[9] if len(msh) > 9 else "",
+        "instrument": _component(msh[2], component) if len(msh) > 2 else "",
+        "msh": msh,
+        "results": [],
+    }
+    barcode = ""
+    for segment in segments[1:]:
+        fields = segment.split(field)
+        if fields[0] == "OBR":
+            barcode = (_component(fields[3], component) if len(fields) > 3 else "") or \
+                      (_component(fields[2], component) if len(fields) > 2 else "")
+        elif fields[0] == "OBX" and len(fields) > 5 and barcode:
+            status = fields[11].strip().upper() if len(fields) > 11 else ""
+            code = _component(fields[3], component)
+            if not code or status in ("D", "X", "W"):  # deleted / cannot be obtained / wrong
+                continue
+            message['results'].append({
+                "barcode": barcode,
+                "code": code,
+                "value": _component(fields[5], component),
+                "unit": _component(fields[6], component) if len(fields) > 6 else "",
+                "ref_range": fields[7].strip() if len(fields) > 7 else "",
+                "flag": fields[8].strip().upper() if len(fields) > 8 else "",
+            })
+    return message
+
+
+def hl7_ack(message: Optional[Dict[str, Any]], code: str, text: str = "") -> str:
+    """MSH + MSA acknowledgement for a received message (AA accepted, AE error, AR rejected)"""
+    msh = message['msh'] if message else []
+    now = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+    sending_app = msh[2] if len(msh) > 2 else ""
+    sending_facility = msh[3] if len(msh) > 3 else ""
+    version = msh[11] if len(msh) > 11 else "2.5.1"
+    control_id = message['control_id'] if message else ""
+    return "\r".join([
+        f"MSH|^~\\&|LIS|LAB|{sending_app}|{sending_facility}|{now}||ACK^R01|ACK{control_id}|P|{version}",
+        f"MSA|{code}|{control_id}" + (f"|{text}" if text else ""),
+    ]) + "\r"
+
+# ==================== INGESTION ====================
+
+
+class AnalyzerCodeMap:
+    """Instrument code -> (test config, parameter name)"""
+
+    def __init__(self, mapping: Dict[str, Any] = None):
+        self.mapping = {}
+        for code, target in (mapping or {}).items():
+            if isinstance(target, str):
+                target = {"test_code": target}
+            self.mapping[code.strip().upper()] = target
+
+    @classmethod
+    def load(cls) -> "AnalyzerCodeMap":
+        if not ANALYZER_CODES_FILE:
+            return cls()
+        with open(ANALYZER_CODES_FILE) as f:
+            return cls(json.load(f))
+
+    @staticmethod
+    def _only_parameter(test: Dict[str, Any]) -> Optional[str]:
+        parameters = test.get('parameters') or []
+        return parameters[0]['parameter_name'] if len(parameters) == 1 else None
+
+    def resolve(self, code: str, sample: Dict[str, Any]) -> Optional[Tuple[Dict[str, Any], str]]:
+        target = self.mapping.get(code.upper())
+        if target:
+            test = test_catalog.by_code(target['test_code'])
+            if not test:
+                return None
+            return test, target.get('parameter') or self._only_parameter(test) or code
+        test = test_catalog.by_code(code)
+        if test:
+            return test, self._only_parameter(test) or code
+        # A parameter of one of the tests ordered on the sample
+        for item in sample.get('tests') or []:
+            test = test_catalog.get(item['test_id'])
+            for parameter in (test or {}).get('parameters') or []:
+                if parameter['parameter_name'].strip().lower() == code.lower():
+                    return test, parameter['parameter_name']
+        return None
+
+
+def analyzer_user(instrument: str) -> User:
+    return User.model_construct(id=f"analyzer:{instrument}", email="analyzer@localhost", name=instrument,
+                                role="analyzer", is_active=True, created_at=datetime.now(timezone.utc))
+
+
+class ResultIngestor:
+    """
+    Single writer shared by every analyzer connection. Messages are queued; the writer takes
+    everything waiting (up to batch_size) and stores it with a fixed number of round trips
+    per batch (delta checks included), so throughput grows with load instead of with the
+    number of connections. Only writes that took effect are counted and acknowledged as stored.
+    """
+
+    _STOP = object()
+
+    def __init__(self, database, codes: AnalyzerCodeMap = None, batch_size: int = ANALYZER_BATCH_SIZE,
+                 max_queue: int = ANALYZER_QUEUE_SIZE):
+        self.db = database
+        self.codes = codes or AnalyzerCodeMap.load()
+        self.batch_size = max(1, batch_size)
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self._task = None
+        self.received = 0
+        self.stored = 0
+        self.unknown_samples = 0
+        self.unmapped_codes = 0
+        self.locked = 0
+        self.batches = 0
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task and not self._task.done():
+            await self.queue.put(self._STOP)
+            await self._task
+
+    async def submit(self, instrument: str, results: List[Dict[str, Any]], wait: bool = False) -> Optional[int]:
+        """Queue one message's results; with wait=True, return how many were stored"""
+        future = asyncio.get_running_loop().create_future() if wait else None
+        self.received += len(results)
+        await self.queue.put((instrument, results, future))
+        return await future if future else None
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            item = await self.queue.get()
+            if item is self._STOP:
+                break
+            batch = [item]
+            while len(batch) < self.batch_size and not self.queue.empty():
+                item = self.queue.get_nowait()
+                if item is self._STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                stored = await self.write(batch)
+            except Exception:
+                logger.exception("Storing %d analyzer messages failed", len(batch))
+                stored = [0] * len(batch)
+            for (_, _, future), count in zip(batch, stored):
+                if future and not future.done():
+                    future.set_result(count)
+
+    async def write(self, batch: List[Tuple[str, List[Dict[str, Any]], Any]]) -> List[int]:
+        """Store a batch of messages; returns the number of results stored per message"""
+        now = datetime.now(timezone.utc)
+        stored = [0] * len(batch)
+        keys = list({result['barcode'] for _, results, _ in batch for result in results})
+        if not keys:
+            return stored
+        samples = await self.db.samples.find(
+            {"$or": [{"barcode": {"$in": keys}}, {"sample_id": {"$in": keys}}]},
+            {"_id": 0, "id": 1, "sample_id": 1, "barcode": 1, "patient_id": 1, "tests": 1, "status": 1}
+        ).to_list(None)
+        by_key = {}
+        for sample in samples:
+            by_key[sample['barcode']] = sample
+            by_key[sample['sample_id']] = sample
+        await test_catalog.refresh()
+
+        # Group values per (sample, test); a later value of the same parameter wins
+        grouped: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        for index, (instrument, results, _) in enumerate(batch):
+            for result in results:
+                sample = by_key.get(result['barcode'])
+                if not sample:
+                    self.unknown_samples += 1
+                    continue
+                mapped = self.codes.resolve(result['code'], sample)
+                if not mapped:
+                    self.unmapped_codes += 1
+                    continue
+                test, parameter_name = mapped
+                entry = grouped.setdefault((sample['id'], test['test_name']), {
+                    "sample": sample, "instrument": instrument, "parameters": {}, "messages": []
+                })
+                unit = result['unit'] or next((p['unit'] for p in test.get('parameters') or []
+                                               if p['parameter_name'] == parameter_name), "")
+                entry['parameters'][parameter_name] = {
+                    "parameter_name": parameter_name,
+                    "value": result['value'],
+                    "unit": unit,
+                    "ref_range": result['ref_range'],
+                    "status": ANALYZER_FLAGS.get(result['flag'], "normal"),
+                    "delta_flag": False,
+                    "previous_value": None,
+                }
+                entry['messages'].append(index)
+        if not grouped:
+            return stored
+
+        existing = {}
+        cursor = self.db.test_results.find(
+            {"sample_id": {"$in": list({sample_id for sample_id, _ in grouped})}, "test_name": {"$in": list({name for _, name in grouped})}},
+            {"_id": 0}
+        )
+        async for doc in cursor:
+            key = (doc['sample_id'], doc['test_name'])
+            if key not in existing or doc['status'] == "draft":
+                existing[key] = doc
+
+        # Merge into draft results; results already under review or approved are left alone
+        merged = []
+        for key, entry in grouped.items():
+            doc = existing.get(key)
+            if doc and doc['status'] != "draft":
+                self.locked += len(entry['messages'])
+                continue
+            if doc:
+                parameters = {p['parameter_name']: p for p in doc['parameters']}
+                parameters.update(entry['parameters'])
+                result = {**doc, "parameters": list(parameters.values())}
+            else:
+                result = TestResult(
+                    sample_id=entry['sample']['id'],
+                    patient_id=entry['sample']['patient_id'],
+                    test_name=key[1],
+                    parameters=[],
+                    entered_by=f"analyzer:{entry['instrument']}"
+                ).model_dump()
+                result['parameters'] = list(entry['parameters'].values())
+            merged.append((result, doc is None, entry))
+        if not merged:
+            return stored
+
+        results = [result for result, _, _ in merged]
+        patients = await self.db.patients.find(
+            {"id": {"$in": list({result['patient_id'] for result in results})}},
+            {"_id": 0, "id": 1, "age": 1, "gender": 1}
+        ).to_list(None)
+        evaluate_results(results, {patient['id']: patient for patient in patients})
+        deltas = await delta_checker.check_many(results, now)
+
+        operations = []
+        for (result, new, entry), (delta_failures, _) in zip(merged, deltas):
+            result['has_critical_values'] = any(p['status'] == "critical" for p in result['parameters'])
+            result['has_delta_failures'] = delta_failures > 0
+            if new:
+                operations.append(InsertOne(result))
+            else:
+                operations.append(UpdateOne({"id": result['id'], "status": "draft"}, {"$set": {
+                    "parameters": result['parameters'],
+                    "has_critical_values": result['has_critical_values'],
+                    "has_delta_failures": result['has_delta_failures'],
+                    "autoverification": None,
+                    "updated_at": now,
+                }}))
+        applied = await self._apply(operations, [result['id'] for result in results])
+        for (_, new, entry), ok in zip(merged, applied):
+            if not ok and not new:
+                self.locked += len(entry['messages'])
+        # Only stored results become the patients' previous values for later delta checks
+        await delta_checker.record_many([(result['patient_id'], history)
+                                         for result, (_, history), ok in zip(results, deltas, applied) if ok])
+        merged = [item for item, ok in zip(merged, applied) if ok]
+        if not merged:
+            return stored
+        results = [result for result, _, _ in merged]
+
+        counter_changes = []
+        for result, new, entry in merged:
+            counter_changes.append(dashboard_counters.result_change(
+                None if new else existing[(result['sample_id'], result['test_name'])], result
+            ))
+            for index in entry['messages']:
+                stored[index] += 1
+        await self.db.samples.update_many(
+            {"id": {"$in": list({result['sample_id'] for result in results})}, "status": {"$in": RESULT_PENDING_SAMPLE_STATUSES}},
+            {"$set": {"status": "under_validation"}}
+        )
+        moved = {entry['sample']['id']: entry['sample'] for _, _, entry in merged
+                 if entry['sample'].get('status') in RESULT_PENDING_SAMPLE_STATUSES}
+        counter_changes.extend(dashboard_counters.sample_change(sample, {**sample, "status": "under_validation"})
+                               for sample in moved.values())
+        await dashboard_counters.apply(*counter_changes)
+
+        by_instrument: Dict[str, List[Dict[str, Any]]] = {}
+        for result, _, entry in merged:
+            by_instrument.setdefault(entry['instrument'], []).append(result)
+        for instrument, instrument_results in by_instrument.items():
+            await log_audit(analyzer_user(instrument), "ANALYZER_RESULTS", "test_results", {
+                "instrument": instrument,
+                "result_ids": [result['id'] for result in instrument_results],
+                "critical": sum(1 for result in instrument_results if result['has_critical_values']),
+            })
+        self.stored += sum(stored)
+        self.batches += 1
+        return stored
+
+    async def _apply(self, operations: list, result_ids: List[str]) -> List[bool]:
+        """Run the batch's result writes; returns, per operation, whether it actually took effect"""
+        try:
+            outcome = (await self.db.test_results.bulk_write(operations, ordered=False)).bulk_api_result
+        except BulkWriteError as exc:
+            outcome = exc.details
+            logger.error("%d analyzer result writes failed: %s", len(outcome['writeErrors']), outcome['writeErrors'][:3])
+        failed = {error['index'] for error in outcome.get('writeErrors', [])}
+        applied = [index not in failed for index in range(len(operations))]
+        updates = [index for index, operation in enumerate(operations) if isinstance(operation, UpdateOne) and applied[index]]
+        if outcome.get('nMatched', 0) < len(updates):
+            # Some drafts were submitted for review between the read and the write; only those still draft were updated
+            ids = [result_ids[index] for index in updates]
+            still_draft = {doc['id'] async for doc in self.db.test_results.find({"id": {"$in": ids}, "status": "draft"}, {"_id": 0, "id": 1})}
+            for index in updates:
+                applied[index] = result_ids[index] in still_draft
+        return applied
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self.queue.qsize(),
+            "received": self.received,
+            "stored": self.stored,
+            "unknown_samples": self.unknown_samples,
+            "unmapped_codes": self.unmapped_codes,
+            "locked": self.locked,
+            "batches": self.batches,
+        }
+
+# ==================== LISTENERS ====================
+
+
+def _peer(writer: asyncio.StreamWriter) -> str:
+    peer = writer.get_extra_info("peername")
+    return f"{peer[0]}:{peer[1]}" if peer else "unknown"
+
+
+async def handle_astm(ingestor: ResultIngestor, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """One ASTM connection: frames are acknowledged as they arrive, results are queued without waiting"""
+    peer = _peer(writer)
+    receiver = ASTMReceiver()
+    logger.info("ASTM connection from %s", peer)
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            replies, transmissions = receiver.feed(data)
+            if replies:
+                writer.write(replies)
+                await writer.drain()
+            for text in transmissions:
+                for message in parse_astm(text):
+                    if message['results']:
+                        await ingestor.submit(message['instrument'] or peer, message['results'])
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+        logger.info("ASTM connection from %s closed", peer)
+
+
+async def handle_hl7(ingestor: ResultIngestor, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """One MLLP connection: each message is acknowledged once its results are stored"""
+    peer = _peer(writer)
+    receiver = MLLPReceiver()
+    logger.info("HL7 connection from %s", peer)
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            for text in receiver.feed(data):
+                try:
+                    message = parse_hl7(text)
+                except ValueError as e:
+                    writer.write(mllp_wrap(hl7_ack(None, "AR", str(e))))
+                    continue
+                stored = await ingestor.submit(message['instrument'] or peer, message['results'], wait=True) if message['results'] else 0
+                if message['results'] and not stored:
+                    ack = hl7_ack(message, "AE", "No result matched a known sample and test")
+                else:
+                    ack = hl7_ack(message, "AA")
+                writer.write(mllp_wrap(ack))
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+        logger.info("HL7 connection from %s closed", peer)
+
+
+async def serve(host: str, astm_port: int, hl7_port: int):
+    await test_catalog.load()
+    audit_writer.start()
+    ingestor = ResultIngestor(db)
+    ingestor.start()
+    servers = [
+        await asyncio.start_server(lambda r, w: handle_astm(ingestor, r, w), host, astm_port),
+        await asyncio.start_server(lambda r, w: handle_hl7(ingestor, r, w), host, hl7_port),
+    ]
+    logger.info("Listening for ASTM on %s:%d and HL7 (MLLP) on %s:%d", host, astm_port, host, hl7_port)
+    try:
+        while True:
+            await asyncio.sleep(60)
+            logger.info("Analyzer ingestion: %s", ingestor.stats())
+    finally:
+        for server in servers:
+            server.close()
+        await ingestor.stop()
+        await audit_writer.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ASTM / HL7 analyzer result listener")
+    parser.add_argument("--host", default=ANALYZER_HOST)
+    parser.add_argument("--astm-port", type=int, default=ANALYZER_ASTM_PORT)
+    parser.add_argument("--hl7-port", type=int, default=ANALYZER_HL7_PORT)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    try:
+        asyncio.run(serve(args.host, args.astm_port, args.hl7_port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
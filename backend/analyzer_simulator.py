@@ -0,0 +1,160 @@
+"""
+Analyzer simulator: sends synthetic results to analyzer_listener.py the way an instrument would.
+
+Usage:
+    python analyzer_simulator.py astm --port 5100 --barcodes 000000000001,000000000002 --codes HGB,WBC,PLT
+    python analyzer_simulator.py hl7 --port 5200 --barcodes 000000000001 --messages 1000 --connections 4
+
+Each message carries one sample (barcodes are used round-robin) with one result per code.
+Prints the achieved results per second when done. The framing is implemented here on its
+own, so it also checks the listener against an independent encoder and needs no database settings.
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime
+
+ENQ, STX, ETX, EOT, ACK, ETB = b"\x05", b"\x02", b"\x03", b"\x04", b"\x06", b"\x17"
+MLLP_START, MLLP_END = b"\x0b", b"\x1c\r"
+
+# code -> (unit, reference range, low, high) used to draw plausible values
+DEFAULT_CODES = {
+    "HGB": ("g/dL", "13.0-17.0", 8.0, 19.0),
+    "WBC": ("10^3/uL", "4.0-11.0", 2.0, 20.0),
+    "PLT": ("10^3/uL", "150-450", 50.0, 600.0),
+    "GLU": ("mg/dL", "70-110", 40.0, 400.0),
+    "CREA": ("mg/dL", "0.6-1.2", 0.3, 6.0),
+}
+
+
+def astm_frames(text: str, size: int = 240):
+    """E1381 frames: STX, frame number, text, ETB (more follows) or ETX, checksum, CR LF"""
+    chunks = [text[i:i + size] for i in range(0, len(text), size)] or [""]
+    frames = []
+    for number, chunk in enumerate(chunks, start=1):
+        body = str(number % 8).encode() + chunk.encode("latin-1") + (ETX if number == len(chunks) else ETB)
+        frames.append(STX + body + b"%02X" % (sum(body) % 256) + b"\r\n")
+    return frames
+
+
+def mllp_wrap(message: str) -> bytes:
+    return MLLP_START + message.encode("utf-8") + MLLP_END
+
+
+def draw(code: str, rng: random.Random):
+    unit, ref_range, low, high = DEFAULT_CODES.get(code, ("", "", 0.0, 100.0))
+    value = rng.uniform(low, high)
+    bounds = [float(part) for part in ref_range.split("-")] if ref_range else None
+    flag = "" if not bounds else ("L" if value < bounds[0] else "H" if value > bounds[1] else "N")
+    return f"{value:.2f}", unit, ref_range, flag
+
+
+def astm_message(instrument: str, barcode: str, codes, rng: random.Random) -> str:
+    now = datetime.now().strftime("%Y%m%d%H%M%S")
+    tests = "\\".join("^^^" + code for code in codes)
+    records = [
+        f"H|\\^&|||{instrument}^1.0|||||||P|1|{now}",
+        "P|1",
+        f"O|1|{barcode}||{tests}|R||||||N",
+    ]
+    for number, code in enumerate(codes, start=1):
+        value, unit, ref_range, flag = draw(code, rng)
+        records.append(f"R|{number}|^^^{code}|{value}|{unit}|{ref_range}|{flag}||F||||{now}")
+    records.append("L|1|N")
+    return "\r".join(records) + "\r"
+
+
+def hl7_message(instrument: str, barcode: str, codes, control_id: int, rng: random.Random) -> str:
+    now = datetime.now().strftime("%Y%m%d%H%M%S")
+    segments = [
+        f"MSH|^~\\&|{instrument}|LAB|LIS|HOSPITAL|{now}||ORU^R01|{control_id}|P|2.5.1",
+        "PID|1",
+        f"OBR|1|{barcode}|{barcode}|PANEL",
+    ]
+    for number, code in enumerate(codes, start=1):
+        value, unit, ref_range, flag = draw(code, rng)
+        segments.append(f"OBX|{number}|NM|{code}^{code}||{value}|{unit}|{ref_range}|{flag}|||F")
+    return "\r".join(segments) + "\r"
+
+
+async def run_astm(args, messages) -> int:
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    naks = 0
+    try:
+        for text in messages:
+            writer.write(ENQ)
+            await writer.drain()
+            if await reader.readexactly(1) != ACK:
+                raise RuntimeError("Listener did not acknowledge ENQ")
+            for frame in astm_frames(text):
+                writer.write(frame)
+                await writer.drain()
+                if await reader.readexactly(1) != ACK:
+                    naks += 1
+            writer.write(EOT)
+            await writer.drain()
+    finally:
+        writer.close()
+    return naks
+
+
+async def run_hl7(args, messages) -> int:
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    errors = 0
+    try:
+        for text in messages:
+            writer.write(mllp_wrap(text))
+            await writer.drain()
+            ack = await reader.readuntil(MLLP_END)
+            if b"MSA|AA" not in ack:
+                errors += 1
+    finally:
+        writer.close()
+    return errors
+
+
+async def simulate(args):
+    rng = random.Random(args.seed)
+    barcodes = [barcode.strip() for barcode in args.barcodes.split(",") if barcode.strip()]
+    codes = [code.strip() for code in args.codes.split(",") if code.strip()]
+    per_connection = [[] for _ in range(args.connections)]
+    for number in range(args.messages):
+        barcode = barcodes[number % len(barcodes)]
+        if args.protocol == "astm":
+            text = astm_message(args.instrument, barcode, codes, rng)
+        else:
+            text = hl7_message(args.instrument, barcode, codes, number + 1, rng)
+        per_connection[number % args.connections].append(text)
+
+    runner = run_astm if args.protocol == "astm" else run_hl7
+    started = time.perf_counter()
+    failures = await asyncio.gather(*(runner(args, messages) for messages in per_connection))
+    elapsed = time.perf_counter() - started
+    results = args.messages * len(codes)
+    label = "NAKed frames" if args.protocol == "astm" else "rejected messages"
+    print(f"{args.messages} {args.protocol.upper()} messages ({results} results) over {args.connections} connection(s) in {elapsed:.2f}s")
+    print(f"throughput: {results / elapsed:,.0f} results/s; {label}: {sum(failures)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send synthetic analyzer results to the listener")
+    parser.add_argument("protocol", choices=["astm", "hl7"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, help="Defaults to 5100 for ASTM and 5200 for HL7")
+    parser.add_argument("--barcodes", required=True, help="Comma-separated sample barcodes or sample IDs")
+    parser.add_argument("--codes", default="HGB,WBC,PLT", help="Comma-separated instrument codes")
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--connections", type=int, default=1)
+    parser.add_argument("--instrument", default="SIM-1")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    if args.port is None:
+        args.port = 5100 if args.protocol == "astm" else 5200
+    args.connections = max(1, args.connections)
+    asyncio.run(simulate(args))
+
+
+if __name__ == "__main__":
+    main()
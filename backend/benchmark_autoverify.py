@@ -0,0 +1,75 @@
+"""
+Throughput benchmark for the autoverification rule engine.
+
+Builds synthetic result batches in memory and times AutoVerifier.evaluate on them;
+nothing is read from or written to the database.
+
+Usage:
+    python benchmark_autoverify.py [--batches 20] [--batch-size 500] [--parameters 8] [--abnormal 0.1]
+"""
+
+import argparse
+import random
+import time
+
+from server import AutoVerifier, AutoVerificationRules, client
+
+TEST_NAMES = ["CBC", "LFT", "KFT", "Lipid Profile", "Thyroid Profile"]
+
+
+def synthetic_batch(size: int, parameters: int, abnormal: float, rng: random.Random):
+    batch = []
+    for index in range(size):
+        params = []
+        for number in range(parameters):
+            roll = rng.random()
+            status = "normal" if roll >= abnormal else rng.choice(["low", "high", "critical"])
+            value = f"{rng.uniform(1, 200):.2f}" if rng.random() > 0.01 else "Positive"
+            params.append({"parameter_name": f"P{number}", "value": value, "unit": "", "ref_range": "",
+                           "status": status, "delta_flag": rng.random() < abnormal / 4})
+        batch.append({
+            "id": f"bench-{index}",
+            "sample_id": f"sample-{index}",
+            "test_name": rng.choice(TEST_NAMES),
+            "parameters": params,
+            "has_critical_values": any(p['status'] == "critical" for p in params),
+        })
+    return batch
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark autoverification rule evaluation")
+    parser.add_argument("--batches", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--parameters", type=int, default=8, help="Parameters per result")
+    parser.add_argument("--abnormal", type=float, default=0.1, help="Share of non-normal parameters")
+    parser.add_argument("--seed", type=int, default=15189)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    verifier = AutoVerifier(None, None, AutoVerificationRules())
+    qc_ok = {name: rng.random() > 0.05 for name in TEST_NAMES}
+    batches = [synthetic_batch(args.batch_size, args.parameters, args.abnormal, rng) for _ in range(args.batches)]
+
+    approved = 0
+    timings = []
+    try:
+        for batch in batches:
+            started = time.perf_counter()
+            passed, _ = verifier.evaluate(batch, qc_ok)
+            timings.append(time.perf_counter() - started)
+            approved += int(passed.sum())
+    finally:
+        client.close()
+
+    results = args.batches * args.batch_size
+    total = sum(timings)
+    timings.sort()
+    print(f"{results} results x {args.parameters} parameters in {total * 1000:.1f} ms")
+    print(f"throughput: {results / total:,.0f} results/s, {results * args.parameters / total:,.0f} parameters/s")
+    print(f"per batch of {args.batch_size}: median {timings[len(timings) // 2] * 1000:.2f} ms, max {timings[-1] * 1000:.2f} ms")
+    print(f"approved {approved} of {results} ({approved / results:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Login-storm benchmark for password hashing.
+
+Simulates many technicians logging in at once (one bcrypt verification each) while
+an unrelated, cheap endpoint keeps being called, and reports that endpoint's latency.
+Runs the storm twice: with bcrypt called inline on the event loop, as login did before,
+and through PasswordHasher's thread pool. Nothing is read from or written to the database.
+
+Usage:
+    python benchmark_login_storm.py [--logins 40] [--probe-interval 5] [--workers 4]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from server import PasswordHasher, client, get_password_hash, verify_password
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else float("nan")
+
+
+async def probe(stop: asyncio.Event, interval: float, latencies: list):
+    """
+    Unrelated requests arrive on a fixed schedule. Each one is measured from when it
+    should have arrived, so time the loop spent blocked counts as latency.
+    """
+    due = time.perf_counter()
+    while not stop.is_set():
+        now = time.perf_counter()
+        while due <= now:
+            # Stands in for a small read endpoint
+            json.dumps({"samples": list(range(50))})
+            latencies.append(time.perf_counter() - due)
+            due += interval
+        await asyncio.sleep(max(0.0, due - time.perf_counter()))
+
+
+async def storm(args, hashed: str, hasher: PasswordHasher = None):
+    async def login():
+        if hasher is None:
+            return verify_password(args.password, hashed)
+        return await hasher.verify(args.password, hashed)
+
+    latencies = []
+    stop = asyncio.Event()
+    prober = asyncio.create_task(probe(stop, args.probe_interval / 1000, latencies))
+    await asyncio.sleep(0.05)
+    started = time.perf_counter()
+    outcomes = await asyncio.gather(*(login() for _ in range(args.logins)))
+    elapsed = time.perf_counter() - started
+    await asyncio.sleep(0.05)
+    stop.set()
+    await prober
+    assert all(outcomes)
+    return elapsed, latencies
+
+
+def report(label: str, elapsed: float, latencies: list, logins: int):
+    print(f"{label}: {logins} logins in {elapsed * 1000:.0f} ms; unrelated requests ({len(latencies)}): "
+          f"p50 {percentile(latencies, 0.5) * 1000:.1f} ms, p99 {percentile(latencies, 0.99) * 1000:.1f} ms, "
+          f"max {max(latencies) * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark unrelated request latency during a login storm")
+    parser.add_argument("--logins", type=int, default=40, help="Concurrent logins")
+    parser.add_argument("--probe-interval", type=float, default=5, help="Milliseconds between unrelated requests")
+    parser.add_argument("--workers", type=int, default=4, help="PasswordHasher threads")
+    parser.add_argument("--password", default="technician-password")
+    args = parser.parse_args()
+
+    hashed = get_password_hash(args.password)
+    hasher = PasswordHasher(args.workers)
+    try:
+        report("inline bcrypt", *asyncio.run(storm(args, hashed)), args.logins)
+        report(f"PasswordHasher ({args.workers} threads)", *asyncio.run(storm(args, hashed, hasher)), args.logins)
+        print(f"hasher: {hasher.stats()}")
+    finally:
+        hasher.shutdown()
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
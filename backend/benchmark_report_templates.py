@@ -0,0 +1,95 @@
+"""
+Micro-benchmark for precompiled report templates.
+
+Renders synthetic reports in memory two ways: compiling the letterhead template on
+every call, as generate_pdf_report did before the template registry, and reusing the
+precompiled template from the registry. Nothing is read from or written to the database.
+
+Usage:
+    python benchmark_report_templates.py [--reports 200] [--results 2] [--parameters 8]
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime, timezone
+from io import BytesIO
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate
+
+from server import DEFAULT_REPORT_TEMPLATE, ReportTemplate, build_report_story, client, get_report_template
+
+
+def synthetic_report(index: int, results: int, parameters: int, rng: random.Random):
+    patient = {"uhid": f"UHID{index:06d}", "name": f"Patient {index}", "age": rng.randint(1, 90),
+               "gender": rng.choice(["male", "female"]), "phone": "9999999999"}
+    sample = {"sample_id": f"SMP{index:08d}", "sample_type": "Blood", "collection_date": datetime.now(timezone.utc)}
+    results_data = []
+    for number in range(results):
+        results_data.append({
+            "id": f"result-{index}-{number}",
+            "test_name": f"Test {number}",
+            "parameters": [{"parameter_name": f"P{p}", "value": f"{rng.uniform(1, 200):.2f}", "unit": "mg/dL",
+                            "ref_range": "10-100", "status": rng.choice(["normal", "normal", "high", "low", "critical"])}
+                           for p in range(parameters)],
+            "interpretation": "Within expected limits." if number == 0 else None,
+        })
+    return patient, sample, results_data
+
+
+def render(report, template: ReportTemplate) -> bytes:
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=0.5*inch, bottomMargin=0.5*inch,
+                            leftMargin=0.75*inch, rightMargin=0.75*inch)
+    doc.build(build_report_story(*report, template))
+    return buffer.getvalue()
+
+
+def timed(reports, modes):
+    """Per-report render times for each way of getting the template, interleaved so drift hits both alike"""
+    timings = [[] for _ in modes]
+    for report in reports:
+        for mode, template_for in enumerate(modes):
+            started = time.perf_counter()
+            render(report, template_for())
+            timings[mode].append(time.perf_counter() - started)
+    return [sorted(mode_timings) for mode_timings in timings]
+
+
+def summary(label: str, timings):
+    total = sum(timings)
+    print(f"{label}: mean {total / len(timings) * 1000:.2f} ms, median {timings[len(timings) // 2] * 1000:.2f} ms, "
+          f"p99 {timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000:.2f} ms per report")
+    return total / len(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark report rendering with and without precompiled templates")
+    parser.add_argument("--reports", type=int, default=200)
+    parser.add_argument("--results", type=int, default=2, help="Results per report")
+    parser.add_argument("--parameters", type=int, default=8, help="Parameters per result")
+    parser.add_argument("--seed", type=int, default=15189)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    reports = [synthetic_report(index, args.results, args.parameters, rng) for index in range(args.reports)]
+    try:
+        render(reports[0], get_report_template())  # warm fonts and imports
+        started = time.perf_counter()
+        for _ in range(args.reports):
+            ReportTemplate(DEFAULT_REPORT_TEMPLATE)
+        compile_ms = (time.perf_counter() - started) / args.reports * 1000
+
+        per_call, precompiled = timed(reports, [lambda: ReportTemplate(DEFAULT_REPORT_TEMPLATE), get_report_template])
+        before = summary("compiled per report (before)", per_call)
+        after = summary("precompiled registry (after)", precompiled)
+        print(f"template compile alone: {compile_ms:.3f} ms; saved per report: {(before - after) * 1000:.2f} ms "
+              f"({(before - after) / before:.1%})")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
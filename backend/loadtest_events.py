@@ -0,0 +1,98 @@
+"""
+Load test for the SSE event stream (GET /api/events) against a running server.
+
+Opens many idle event-stream clients on one worker, checks they stay connected, then
+changes a sample's status a number of times and measures how long each event takes
+to reach every client.
+
+Usage:
+    python loadtest_events.py --url http://localhost:8001 --token TOKEN --sample-id SAMPLE_UUID
+        [--clients 300] [--idle 30] [--updates 20]
+
+The sample is moved between `received` and `processing`; use a test sample.
+"""
+
+import argparse
+import asyncio
+import time
+
+import httpx
+
+
+async def listen(client: httpx.AsyncClient, args, connected: asyncio.Event, counter: list, arrivals: list):
+    async with client.stream("GET", f"{args.url}/api/events", params={"topics": "sample.status"},
+                             headers={"Authorization": f"Bearer {args.token}"}) as response:
+        response.raise_for_status()
+        counter[0] += 1
+        if counter[0] == args.clients:
+            connected.set()
+        event = None
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[7:]
+            elif line.startswith("data: ") and event == "sample.status":
+                arrivals.append(time.perf_counter())
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else float("nan")
+
+
+async def run(args):
+    headers = {"Authorization": f"Bearer {args.token}"}
+    limits = httpx.Limits(max_connections=args.clients + 10, max_keepalive_connections=args.clients + 10)
+    timeout = httpx.Timeout(10.0, read=None)
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        connected = asyncio.Event()
+        counter = [0]
+        arrivals = [[] for _ in range(args.clients)]
+        started = time.perf_counter()
+        listeners = [asyncio.create_task(listen(client, args, connected, counter, arrivals[i])) for i in range(args.clients)]
+        await asyncio.wait_for(connected.wait(), timeout=60)
+        print(f"{args.clients} clients connected in {time.perf_counter() - started:.2f}s")
+
+        await asyncio.sleep(args.idle)
+        stats = (await client.get(f"{args.url}/api/events/stats", headers=headers)).json()
+        failed = [task for task in listeners if task.done()]
+        print(f"after {args.idle:.0f}s idle: {stats['subscribers']} subscribers on the worker, {len(failed)} client(s) dropped")
+
+        sent = []
+        for number in range(args.updates):
+            status = "received" if number % 2 == 0 else "processing"
+            sent.append(time.perf_counter())
+            response = await client.put(f"{args.url}/api/samples/{args.sample_id}/status", json={"status": status}, headers=headers)
+            response.raise_for_status()
+            await asyncio.sleep(args.pause)
+        await asyncio.sleep(1)
+
+        latencies = []
+        missing = 0
+        for client_arrivals in arrivals:
+            missing += max(0, args.updates - len(client_arrivals))
+            latencies.extend(arrival - sent_at for arrival, sent_at in zip(client_arrivals, sent))
+        fanout = [max((a[i] for a in arrivals if len(a) > i), default=sent[i]) - sent[i] for i in range(args.updates)]
+        print(f"{args.updates} events x {args.clients} clients: {len(latencies)} delivered, {missing} missing")
+        print(f"delivery latency: p50 {percentile(latencies, 0.5) * 1000:.1f} ms, p99 {percentile(latencies, 0.99) * 1000:.1f} ms")
+        print(f"time until every client had an event: p50 {percentile(fanout, 0.5) * 1000:.1f} ms, max {max(fanout) * 1000:.1f} ms")
+
+        for task in listeners:
+            task.cancel()
+        await asyncio.gather(*listeners, return_exceptions=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the SSE event stream")
+    parser.add_argument("--url", default="http://localhost:8001")
+    parser.add_argument("--token", required=True, help="Bearer token of any active user")
+    parser.add_argument("--sample-id", required=True, help="id (UUID) of a test sample whose status may be changed")
+    parser.add_argument("--clients", type=int, default=300)
+    parser.add_argument("--idle", type=float, default=30, help="Seconds to hold the idle connections before publishing")
+    parser.add_argument("--updates", type=int, default=20)
+    parser.add_argument("--pause", type=float, default=0.05, help="Seconds between status updates")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Index maintenance for the LIMS database.
+
+Usage:
+    python manage_indexes.py apply     # build every index declared in server.INDEXES
+    python manage_indexes.py drift     # report missing / unexpected / changed indexes
+    python manage_indexes.py explain   # fail if any route query shape falls back to COLLSCAN
+
+drift and explain exit with status 1 when they find a problem.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+
+from server import client, ensure_indexes, index_drift, find_collscans
+
+
+async def run(command: str) -> int:
+    if command == "apply":
+        created = await ensure_indexes()
+        for collection, names in created.items():
+            print(f"{collection}: {', '.join(names)}")
+        return 0
+    if command == "drift":
+        drift = await index_drift()
+        print(json.dumps(drift, indent=2) if drift else "No index drift")
+        return 1 if drift else 0
+    offenders = await find_collscans()
+    for offender in offenders:
+        print(f"COLLSCAN on {offender['collection']}: filter={offender['filter']} sort={offender['sort']}")
+    if not offenders:
+        print("All query shapes are served by an index")
+    return 1 if offenders else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage MongoDB indexes")
+    parser.add_argument("command", choices=["apply", "drift", "explain"])
+    args = parser.parse_args()
+    try:
+        status = asyncio.run(run(args.command))
+    finally:
+        client.close()
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
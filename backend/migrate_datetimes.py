@@ -0,0 +1,90 @@
+"""
+One-shot migration: convert ISO-string datetime fields to native BSON dates.
+
+Only documents that still hold a string in one of their DATE_FIELDS are selected,
+so the migration is idempotent and can be stopped and re-run at any point.
+Afterwards, results approved before approved_at was recorded get it from updated_at.
+
+Usage:
+    python migrate_datetimes.py [--collection samples] [--batch-size 1000] [--dry-run]
+"""
+
+import argparse
+import logging
+import os
+
+from pymongo import MongoClient, UpdateOne
+
+from server import DATE_FIELDS, parse_datetime
+
+logger = logging.getLogger("migrate_datetimes")
+
+
+def migrate_collection(collection, fields, batch_size: int, dry_run: bool) -> int:
+    query = {"$or": [{field: {"$type": "string"}} for field in fields]}
+    projection = {field: 1 for field in fields}
+    last_id = None
+    converted = 0
+
+    while True:
+        page_query = query if last_id is None else {"$and": [query, {"_id": {"$gt": last_id}}]}
+        docs = list(collection.find(page_query, projection).sort("_id", 1).limit(batch_size))
+        if not docs:
+            break
+        last_id = docs[-1]["_id"]
+
+        operations = []
+        for doc in docs:
+            updates = {}
+            for field in fields:
+                value = doc.get(field)
+                if not isinstance(value, str):
+                    continue
+                try:
+                    updates[field] = parse_datetime(value)
+                except ValueError:
+                    logger.warning("%s %s: cannot parse %s=%r", collection.name, doc["_id"], field, value)
+            if updates:
+                operations.append(UpdateOne({"_id": doc["_id"]}, {"$set": updates}))
+
+        if operations and not dry_run:
+            collection.bulk_write(operations, ordered=False)
+        converted += len(operations)
+        logger.info("%s: %d documents converted so far", collection.name, converted)
+
+    return converted
+
+
+def backfill_approved_at(collection, dry_run: bool) -> int:
+    """Results approved before approved_at existed: their last update is the best approval time there is"""
+    query = {"status": {"$in": ["approved", "finalized"]}, "approved_at": None, "updated_at": {"$type": "date"}}
+    if dry_run:
+        return collection.count_documents(query)
+    return collection.update_many(query, [{"$set": {"approved_at": "$updated_at"}}]).modified_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert ISO-string dates to BSON dates")
+    parser.add_argument("--collection", choices=sorted(DATE_FIELDS), help="Only migrate this collection")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true", help="Count documents without writing")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    client = MongoClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+    names = [args.collection] if args.collection else sorted(DATE_FIELDS)
+    try:
+        for name in names:
+            total = migrate_collection(db[name], DATE_FIELDS[name], args.batch_size, args.dry_run)
+            logger.info("%s: done, %d documents %s", name, total, "to convert" if args.dry_run else "converted")
+        if "test_results" in names:
+            filled = backfill_approved_at(db.test_results, args.dry_run)
+            logger.info("test_results: approved_at %s on %d approved results", "missing" if args.dry_run else "set", filled)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,52 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Request
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Request, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.responses import FileResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, IndexModel, UpdateOne, ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from bson.errors import InvalidDocument
 import os
+import asyncio
+import time
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, EmailStr, ConfigDict
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 import uuid
 from datetime import datetime, timezone, timedelta
 from passlib.context import CryptContext
 import jwt
 import barcode
-from barcode.writer import ImageWriter
-from io import BytesIO
+from barcode.writer import ImageWriter, SVGWriter
+from io import BytesIO, StringIO
+import csv
 import base64
 import qrcode
 import json
+import math
+import re
 import hashlib
+import tempfile
+import heapq
+from collections import OrderedDict, defaultdict
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image as RLImage
+from reportlab.lib.units import inch, mm
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak, Image as RLImage
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 from reportlab.graphics.barcode import code128
 from reportlab.graphics.shapes import Drawing
 from reportlab.graphics import renderPDF
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfgen import canvas
+import numpy as np
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -38,14 +56,87 @@ SECRET_KEY = os.environ.get('SECRET_KEY', 'your-secret-key-change-in-production'
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 480
 
+# Authenticated-user cache - the worker that edits a user drops it at once, so USER_CACHE_TTL is how
+# long a role change or deactivation can take to reach the other workers that have the user cached
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', '30'))
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', '2048'))
+
+# bcrypt runs off the event loop, at most PASSWORD_HASH_WORKERS at a time
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '4'))
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, tz_aware=True)
 db = client[os.environ['DB_NAME']]
 
+# ID sequencer - ids reserved per round trip to the counters collection
+ID_BLOCK_SIZE = int(os.environ.get('ID_BLOCK_SIZE', '20'))
+
+# PDF reports - rendered in a warm process pool off the event loop
+REPORT_WORKERS = int(os.environ.get('REPORT_WORKERS', '2'))
+REPORT_RENDER_TIMEOUT = float(os.environ.get('REPORT_RENDER_TIMEOUT', '30'))
+REPORT_MAX_QUEUE = int(os.environ.get('REPORT_MAX_QUEUE', '50'))
+REPORT_CACHE_DIR = Path(os.environ.get('REPORT_CACHE_DIR', str(ROOT_DIR / 'report_cache')))
+REPORT_CACHE_MAX_BYTES = int(os.environ.get('REPORT_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+
+# Barcodes - rendered images are cached in memory and, if BARCODE_CACHE_DIR is set, on disk
+BARCODE_CACHE_SIZE = int(os.environ.get('BARCODE_CACHE_SIZE', '4096'))
+BARCODE_CACHE_DIR = os.environ.get('BARCODE_CACHE_DIR')
+LABEL_SHEET_MAX_LABELS = int(os.environ.get('LABEL_SHEET_MAX_LABELS', '600'))
+
+# Test catalog - seconds between checks of the catalog version written by other workers
+TEST_CATALOG_CHECK_INTERVAL = float(os.environ.get('TEST_CATALOG_CHECK_INTERVAL', '5'))
+
+# Reference ranges - patients up to this age (years) use ref_range_child when a test defines one
+REFERENCE_CHILD_MAX_AGE = int(os.environ.get('REFERENCE_CHILD_MAX_AGE', '12'))
+
+# Delta checks - window and default % change for parameters without their own delta settings (unset = off)
+DELTA_CHECK_WINDOW_HOURS = float(os.environ.get('DELTA_CHECK_WINDOW_HOURS', '72'))
+DELTA_CHECK_DEFAULT_PERCENT = float(os.environ['DELTA_CHECK_DEFAULT_PERCENT']) if os.environ.get('DELTA_CHECK_DEFAULT_PERCENT') else None
+
+# Autoverification - background sweep every AUTOVERIFY_INTERVAL seconds (0 = only on demand)
+AUTOVERIFY_INTERVAL = float(os.environ.get('AUTOVERIFY_INTERVAL', '0'))
+AUTOVERIFY_BATCH_SIZE = int(os.environ.get('AUTOVERIFY_BATCH_SIZE', '500'))
+
+# Dashboard counters - rebuilt from the collections every DASHBOARD_RECONCILE_INTERVAL seconds
+DASHBOARD_RECONCILE_INTERVAL = float(os.environ.get('DASHBOARD_RECONCILE_INTERVAL', '3600'))
+
+# TAT monitor - "approaching" warning this many minutes before a deadline; seconds between
+# pickups of samples created by other workers
+TAT_WARNING_MINUTES = float(os.environ.get('TAT_WARNING_MINUTES', '60'))
+TAT_MONITOR_SYNC_INTERVAL = float(os.environ.get('TAT_MONITOR_SYNC_INTERVAL', '30'))
+
+# TAT analytics - seconds between rollup runs (0 = only on demand), results per run, histogram shape
+TAT_ROLLUP_INTERVAL = float(os.environ.get('TAT_ROLLUP_INTERVAL', '60'))
+TAT_ROLLUP_BATCH_SIZE = int(os.environ.get('TAT_ROLLUP_BATCH_SIZE', '1000'))
+TAT_HISTOGRAM_GROWTH = 1.05
+TAT_HISTOGRAM_BUCKETS = 260  # 1.05 ** 258 minutes is about 200 days
+
+# QC - accepted runs a lot needs before its own mean/SD are used (when no target_sd is given),
+# and the fixed tolerance (%) applied until then
+QC_MIN_RUNS = int(os.environ.get('QC_MIN_RUNS', '20'))
+QC_TOLERANCE_PERCENT = float(os.environ.get('QC_TOLERANCE_PERCENT', '10'))
+
+# Event stream (SSE) - events buffered per client, seconds between keepalives, clients per worker
+EVENT_BUFFER_SIZE = int(os.environ.get('EVENT_BUFFER_SIZE', '256'))
+EVENT_HEARTBEAT_INTERVAL = float(os.environ.get('EVENT_HEARTBEAT_INTERVAL', '15'))
+EVENT_MAX_SUBSCRIBERS = int(os.environ.get('EVENT_MAX_SUBSCRIBERS', '1000'))
+
+# EMR bulk ordering
+EMR_BULK_MAX_ORDERS = int(os.environ.get('EMR_BULK_MAX_ORDERS', '1000'))
+
+# Streaming exports - rows fetched per cursor batch and written per response chunk
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '1000'))
+
+# Audit pipeline - batched background writes to audit_logs
+AUDIT_QUEUE_SIZE = int(os.environ.get('AUDIT_QUEUE_SIZE', '10000'))
+AUDIT_BATCH_SIZE = int(os.environ.get('AUDIT_BATCH_SIZE', '200'))
+AUDIT_FLUSH_INTERVAL = float(os.environ.get('AUDIT_FLUSH_INTERVAL', '0.5'))
+AUDIT_FLUSH_RETRIES = int(os.environ.get('AUDIT_FLUSH_RETRIES', '5'))
+
 app = FastAPI()
 api_router = APIRouter(prefix="/api")
 
@@ -76,6 +167,11 @@ class UserCreate(BaseModel):
     password: str
     role: str
 
+class UserUpdate(BaseModel):
+    name: Optional[str] = None
+    role: Optional[str] = None
+    is_active: Optional[bool] = None
+
 class UserLogin(BaseModel):
     email: EmailStr
     password: str
@@ -143,6 +239,10 @@ class SampleStatusUpdate(BaseModel):
 class SampleRejection(BaseModel):
     rejection_reason: str
 
+class LabelSheetRequest(BaseModel):
+    sample_ids: List[str]
+    copies: int = 1  # labels per sample, one per tube
+
 class TestParameter(BaseModel):
     parameter_name: str
     unit: str
@@ -151,6 +251,9 @@ class TestParameter(BaseModel):
     ref_range_child: Optional[str] = None
     critical_low: Optional[float] = None
     critical_high: Optional[float] = None
+    delta_abs: Optional[float] = None  # flag a change of at least this much from the previous value
+    delta_percent: Optional[float] = None  # ... or of at least this many percent
+    delta_window_hours: Optional[float] = None  # previous values older than this are not compared
 
 class TestConfig(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -179,6 +282,8 @@ class ResultParameter(BaseModel):
     unit: str
     ref_range: str
     status: str = "normal"  # normal, high, low, critical
+    delta_flag: bool = False
+    previous_value: Optional[float] = None  # set when delta_flag is raised
 
 class TestResult(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -191,7 +296,10 @@ class TestResult(BaseModel):
     entered_by: str
     reviewed_by: Optional[str] = None
     approved_by: Optional[str] = None
+    approved_at: Optional[datetime] = None
     has_critical_values: bool = False
+    has_delta_failures: bool = False
+    autoverification: Optional[Dict[str, Any]] = None  # decision of the last autoverification sweep
     interpretation: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
@@ -218,9 +326,12 @@ class QCEntry(BaseModel):
     lot_number: str
     parameter: str
     target_value: float
+    target_sd: Optional[float] = None
     measured_value: float
     deviation: float
-    status: str  # pass, fail
+    z_score: Optional[float] = None
+    rules_violated: List[str] = []  # Westgard rules: 1-2s, 1-3s, 2-2s, R-4s, 4-1s, 10x
+    status: str  # pass, warning (1-2s only), fail
     entered_by: str
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
@@ -232,6 +343,7 @@ class QCEntryCreate(BaseModel):
     parameter: str
     target_value: float
     measured_value: float
+    target_sd: Optional[float] = None  # SD of the control material; without it the lot's own SD is used
 
 class NABLDocument(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -287,6 +399,249 @@ class InventoryItemCreate(BaseModel):
     minimum_stock: int
     supplier: str
 
+# ==================== DATE CODEC ====================
+
+# Datetime fields per collection. They are stored as native BSON dates; documents
+# written before that stored ISO strings and are converted by migrate_datetimes.py.
+DATE_FIELDS = {
+    "users": ("created_at",),
+    "patients": ("created_at",),
+    "samples": ("collection_date", "tat_deadline", "created_at"),
+    "test_configs": ("created_at",),
+    "test_results": ("created_at", "updated_at", "approved_at"),
+    "qc_entries": ("date", "created_at"),
+    "nabl_documents": ("created_at", "updated_at"),
+    "audit_logs": ("timestamp",),
+    "inventory": ("expiry_date", "created_at"),
+}
+
+def parse_datetime(value):
+    """ISO string (legacy storage) -> timezone-aware datetime; anything else unchanged"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if isinstance(value, datetime) and value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+def decode_dates(doc: Dict[str, Any], collection: str) -> Dict[str, Any]:
+    """Normalise the datetime fields of a single document read from `collection`"""
+    for field in DATE_FIELDS[collection]:
+        if field in doc:
+            doc[field] = parse_datetime(doc[field])
+    return doc
+
+# ==================== INDEXES ====================
+
+# Declared indexes per collection, one per query shape used by the router.
+# Applied at startup and by manage_indexes.py (which also reports drift).
+INDEXES = {
+    "users": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("email", ASCENDING)], unique=True),
+    ],
+    "patients": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("uhid", ASCENDING)], unique=True),
+        IndexModel([("phone", ASCENDING)]),
+        IndexModel([("emr_patient_id", ASCENDING)], unique=True, sparse=True),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)]),
+    ],
+    "samples": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("sample_id", ASCENDING)], unique=True),
+        IndexModel([("barcode", ASCENDING)], unique=True),
+        IndexModel([("emr_order_id", ASCENDING)], unique=True, sparse=True),
+        IndexModel([("patient_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("status", ASCENDING), ("tat_deadline", ASCENDING)]),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)]),
+    ],
+    "test_configs": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("test_code", ASCENDING)]),
+    ],
+    "test_results": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("sample_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("patient_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("has_critical_values", ASCENDING), ("status", ASCENDING)]),
+        IndexModel([("status", ASCENDING), ("approved_at", ASCENDING), ("id", ASCENDING)]),
+        IndexModel([("status", ASCENDING), ("tat_rolled_up", ASCENDING)]),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)]),
+    ],
+    "qc_entries": [
+        IndexModel([("test_name", ASCENDING), ("date", DESCENDING)]),
+        IndexModel([("test_name", ASCENDING), ("parameter", ASCENDING), ("level", ASCENDING), ("lot_number", ASCENDING), ("date", ASCENDING)]),
+        IndexModel([("id", ASCENDING)]),
+        IndexModel([("qc_type", ASCENDING), ("date", DESCENDING)]),
+        IndexModel([("date", DESCENDING)]),
+    ],
+    "nabl_documents": [
+        IndexModel([("document_type", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)]),
+    ],
+    "inventory": [
+        IndexModel([("item_name", ASCENDING)]),
+        IndexModel([("expiry_date", ASCENDING)]),
+    ],
+    "audit_logs": [
+        IndexModel([("module", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("timestamp", DESCENDING), ("id", DESCENDING)]),
+    ],
+    "tat_breaches": [
+        IndexModel([("sample_id", ASCENDING)], unique=True),
+        IndexModel([("breached_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("closed_at", ASCENDING), ("breached_at", DESCENDING), ("id", DESCENDING)]),
+    ],
+    "qc_series": [
+        IndexModel([("test_name", ASCENDING)]),
+    ],
+    "tat_rollups": [
+        IndexModel([("period", ASCENDING), ("key", ASCENDING)]),
+    ],
+}
+
+# Representative (collection, filter, sort) shapes issued by the routes; each must
+# be served by an index. Free-text patient search ($regex, case-insensitive) is
+# deliberately absent - it cannot use a b-tree index.
+INDEX_QUERY_SHAPES = [
+    ("users", {"id": "x"}, None),
+    ("users", {"email": "x"}, None),
+    ("patients", {"id": "x"}, None),
+    ("patients", {"uhid": "x"}, None),
+    ("patients", {"phone": "x"}, None),
+    ("patients", {"emr_patient_id": "x"}, None),
+    ("patients", {}, [("created_at", -1), ("id", -1)]),
+    ("samples", {"id": "x"}, None),
+    ("samples", {"sample_id": "x"}, None),
+    ("samples", {"emr_order_id": "x"}, None),
+    ("samples", {}, [("created_at", -1), ("id", -1)]),
+    ("samples", {"status": "collected"}, [("created_at", -1), ("id", -1)]),
+    ("samples", {"created_at": {"$gte": datetime(2000, 1, 1, tzinfo=timezone.utc)}}, None),
+    ("samples", {"tat_deadline": {"$lt": datetime(2000, 1, 1, tzinfo=timezone.utc)}, "status": {"$nin": ["approved", "dispatched", "rejected"]}}, None),
+    ("test_configs", {"id": "x"}, None),
+    ("test_configs", {"test_code": "x"}, None),
+    ("test_results", {"id": "x"}, None),
+    ("test_results", {}, [("created_at", -1), ("id", -1)]),
+    ("test_results", {"sample_id": "x"}, [("created_at", -1), ("id", -1)]),
+    ("test_results", {"patient_id": "x"}, [("created_at", -1), ("id", -1)]),
+    ("test_results", {"status": "draft"}, [("created_at", -1), ("id", -1)]),
+    ("test_results", {"status": {"$in": ["draft", "under_review"]}, "autoverification": None}, [("created_at", 1), ("id", 1)]),
+    ("test_results", {"status": {"$in": ["draft", "under_review"]}, "autoverification.decision": "held", "autoverification.reasons": ["qc"]}, None),
+    ("test_results", {"has_critical_values": True, "status": {"$ne": "finalized"}}, None),
+    ("test_results", {"status": "approved", "approved_at": {"$gte": datetime(2000, 1, 1, tzinfo=timezone.utc)}}, [("approved_at", 1), ("id", 1)]),
+    ("qc_entries", {}, [("date", -1)]),
+    ("qc_entries", {"test_name": "x"}, [("date", -1)]),
+    ("qc_entries", {"qc_type": "x"}, [("date", -1)]),
+    ("qc_entries", {"test_name": "x", "parameter": "x", "level": "x", "lot_number": "x"}, [("date", 1)]),
+    ("qc_entries", {"id": "x"}, None),
+    ("qc_series", {"test_name": "x"}, None),
+    ("nabl_documents", {}, [("created_at", -1), ("id", -1)]),
+    ("nabl_documents", {"document_type": "x"}, [("created_at", -1), ("id", -1)]),
+    ("inventory", {}, [("item_name", 1)]),
+    ("inventory", {"expiry_date": {"$gte": datetime(2000, 1, 1, tzinfo=timezone.utc)}}, None),
+    ("audit_logs", {}, [("timestamp", -1), ("id", -1)]),
+    ("audit_logs", {"module": "x"}, [("timestamp", -1), ("id", -1)]),
+    ("tat_breaches", {"sample_id": "x"}, None),
+    ("tat_breaches", {}, [("breached_at", -1), ("id", -1)]),
+    ("tat_breaches", {"closed_at": None}, [("breached_at", -1), ("id", -1)]),
+    ("test_results", {"status": {"$in": ["approved", "finalized"]}, "tat_rolled_up": None}, None),
+    ("tat_rollups", {"period": "day", "key": {"$in": ["x"]}}, None),
+]
+
+def _index_signature(spec: Dict[str, Any]) -> tuple:
+    return tuple(dict(spec["key"]).items()), bool(spec.get("unique")), bool(spec.get("sparse"))
+
+async def ensure_indexes(database=None) -> Dict[str, List[str]]:
+    """Build every declared index; failures (e.g. duplicates blocking a unique index) are logged, not raised"""
+    database = db if database is None else database
+    created = {}
+    for collection, indexes in INDEXES.items():
+        try:
+            created[collection] = await database[collection].create_indexes(indexes)
+        except Exception:
+            logger.exception("Index build failed for %s", collection)
+    return created
+
+async def index_drift(database=None) -> Dict[str, Dict[str, List[str]]]:
+    """Compare declared indexes with the ones that exist: missing, unexpected and changed names per collection"""
+    database = db if database is None else database
+    drift = {}
+    for collection, indexes in INDEXES.items():
+        actual = await database[collection].index_information()
+        actual.pop("_id_", None)
+        declared = {index.document["name"]: index.document for index in indexes}
+        report = {
+            "missing": sorted(name for name in declared if name not in actual),
+            "unexpected": sorted(name for name in actual if name not in declared),
+            "changed": sorted(name for name, spec in declared.items()
+                              if name in actual and _index_signature(spec) != _index_signature(actual[name]))
+        }
+        if any(report.values()):
+            drift[collection] = report
+    return drift
+
+def _plan_has_collscan(plan) -> bool:
+    if isinstance(plan, dict):
+        return plan.get("stage") == "COLLSCAN" or any(_plan_has_collscan(v) for v in plan.values())
+    if isinstance(plan, list):
+        return any(_plan_has_collscan(v) for v in plan)
+    return False
+
+async def find_collscans(database=None) -> List[Dict[str, Any]]:
+    """Explain every entry of INDEX_QUERY_SHAPES and return the ones whose winning plan scans the collection"""
+    database = db if database is None else database
+    offenders = []
+    for collection, query, sort in INDEX_QUERY_SHAPES:
+        cursor = database[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = (await cursor.explain()).get("queryPlanner", {}).get("winningPlan", {})
+        if _plan_has_collscan(plan):
+            offenders.append({"collection": collection, "filter": query, "sort": sort})
+    return offenders
+
+# ==================== PAGINATION ====================
+
+# List endpoints page by keyset: results are ordered by (sort_key, id) descending and
+# the opaque cursor carries the last row's pair, so every page is an index seek.
+# The cursor for the next page is returned in the X-Next-Cursor response header.
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(doc: Dict[str, Any], sort_key: str) -> str:
+    value = doc.get(sort_key)
+    if isinstance(value, datetime):
+        value = {"$date": value.isoformat()}
+    raw = json.dumps([value, doc["id"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        value, last_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if isinstance(value, dict):
+            value = parse_datetime(value["$date"])
+        return value, str(last_id)
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def fetch_page(collection, query: Dict[str, Any], sort_key: str, limit: int, response: Response,
+                     skip: int = 0, cursor: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    One page of `collection` newest first. With a cursor the page starts right after
+    the cursor's row (skip is ignored); without one, skip/limit behave as before.
+    """
+    if cursor:
+        value, last_id = decode_cursor(cursor)
+        after = {"$or": [{sort_key: {"$lt": value}}, {sort_key: value, "id": {"$lt": last_id}}]}
+        query = {"$and": [query, after]} if query else after
+        skip = 0
+    docs = await collection.find(query, {"_id": 0}).sort([(sort_key, -1), ("id", -1)]).skip(skip).limit(limit + 1).to_list(limit + 1)
+    if len(docs) > limit:
+        docs = docs[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(docs[-1], sort_key)
+    return docs
+
 # ==================== AUTH FUNCTIONS ====================
 
 def verify_password(plain_password, hashed_password):
@@ -295,6 +650,64 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+class PasswordHasher:
+    """
+    Runs bcrypt hashing/verification on a dedicated thread pool (bcrypt releases
+    the GIL) so logins never block the event loop. Callers beyond the worker
+    limit queue on a semaphore; wait and run times are tracked for monitoring.
+    """
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS):
+        self.workers = max(1, workers)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        self.semaphore = asyncio.Semaphore(self.workers)
+        self.waiting = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.total_run_ms = 0.0
+
+    async def _run(self, fn, *args):
+        queued_at = time.perf_counter()
+        self.waiting += 1
+        async with self.semaphore:
+            self.waiting -= 1
+            started = time.perf_counter()
+            wait_ms = (started - queued_at) * 1000
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+            self.in_flight += 1
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+            finally:
+                self.in_flight -= 1
+                self.completed += 1
+                self.total_run_ms += (time.perf_counter() - started) * 1000
+
+    async def verify(self, plain_password, hashed_password) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    async def hash(self, password) -> str:
+        return await self._run(get_password_hash, password)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, Any]:
+        done = self.completed or 1
+        return {
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "avg_wait_ms": round(self.total_wait_ms / done, 3),
+            "max_wait_ms": round(self.max_wait_ms, 3),
+            "avg_run_ms": round(self.total_run_ms / done, 3)
+        }
+
+password_hasher = PasswordHasher()
+
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -302,22 +715,267 @@ def create_access_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+class TTLCache:
+    """Small in-process LRU cache whose entries also expire after a TTL"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = max(1, maxsize)
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is not None and entry[1] > time.monotonic():
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+        if entry is not None:
+            del self._data[key]
+        self.misses += 1
+        return None
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key):
+        entry = self._data.pop(key, None)
+        return entry[0] if entry else None
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+# user id -> User, and token -> user id (claims cached until the token expires)
+user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+token_cache = TTLCache(USER_CACHE_SIZE, ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
+def invalidate_user(user_id: str):
+    """
+    Drop a user from this worker's cache. The user update and deactivate routes call this,
+    as does login when it finds an inactive account. Other workers keep their copy until
+    USER_CACHE_TTL runs out, which is also how edits made directly in the database show up.
+    """
+    user_cache.pop(user_id)
+
+def decode_token(token: str) -> str:
+    user_id = token_cache.get(token)
+    if user_id is not None:
+        return user_id
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: str = payload.get("sub")
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid authentication credentials")
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired")
-    except jwt.JWTError:
+    except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Could not validate credentials")
+    token_cache.set(token, user_id, ttl=payload.get("exp", 0) - time.time())
+    return user_id
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    user_id = decode_token(credentials.credentials)
     
-    user = await db.users.find_one({"id": user_id}, {"_id": 0})
+    user = user_cache.get(user_id)
     if user is None:
-        raise HTTPException(status_code=401, detail="User not found")
-    return User(**user)
+        user_doc = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
+        if user_doc is None:
+            raise HTTPException(status_code=401, detail="User not found")
+        user = User(**user_doc)
+        user_cache.set(user_id, user)
+    if not user.is_active:
+        raise HTTPException(status_code=401, detail="Account is inactive")
+    return user
+
+async def get_stream_user(request: Request, token: Optional[str] = None):
+    """get_current_user for event streams: browsers' EventSource cannot set headers, so ?token= is accepted too"""
+    authorization = request.headers.get("Authorization", "")
+    if authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+    if not token:
+        raise HTTPException(status_code=403, detail="Not authenticated")
+    return await get_current_user(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token))
+
+class AuditLogWriter:
+    """
+    In-process audit pipeline. Endpoints enqueue audit documents and a background
+    task writes them with insert_many once a batch fills up or the flush interval
+    passes. A full queue makes producers wait (backpressure) instead of dropping
+    entries, and stop() drains everything queued before returning.
+
+    A batch is retried at most max_retries times. Entries a partial insert already
+    wrote are not retried, and entries that can never be written (rejected by the
+    server, not encodable) go to the audit.dead_letter log as JSON instead of
+    blocking the pipeline.
+    """
+
+    _STOP = object()
+
+    def __init__(self, collection, max_queue: int = AUDIT_QUEUE_SIZE,
+                 batch_size: int = AUDIT_BATCH_SIZE, flush_interval: float = AUDIT_FLUSH_INTERVAL,
+                 max_retries: int = AUDIT_FLUSH_RETRIES):
+        self.collection = collection
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_retries = max(1, max_retries)
+        self._task = None
+        self.written = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.dead_lettered = 0
+        self.backpressure_waits = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if not self.running:
+            return
+        await self.queue.put(self._STOP)
+        await self._task
+        self._task = None
+
+    async def submit(self, doc: Dict[str, Any]):
+        if not self.running:
+            # No pipeline (scripts, startup failures) - write through
+            await self.collection.insert_one(doc)
+            return
+        try:
+            self.queue.put_nowait(doc)
+        except asyncio.QueueFull:
+            self.backpressure_waits += 1
+            await self.queue.put(doc)
+
+    def _dead_letter(self, docs: List[Dict[str, Any]], reason: str):
+        for doc in docs:
+            audit_dead_letter.error("%s: %s", reason, json.dumps(doc, default=str))
+        self.dead_lettered += len(docs)
+
+    async def _flush(self, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Write a batch; returns the entries that should be retried"""
+        started = time.perf_counter()
+        try:
+            await self.collection.insert_many(batch, ordered=False)
+            written = len(batch)
+        except BulkWriteError as exc:
+            # Unordered insert: every entry without a write error was written. A duplicate _id
+            # was written by an earlier, partially failed attempt; any other write error is permanent.
+            rejected = [batch[error['index']] for error in exc.details.get('writeErrors', [])
+                        if error.get('code') != 11000]
+            self._dead_letter(rejected, "Audit entry rejected by the server")
+            written = len(batch) - len(rejected)
+        except InvalidDocument:
+            # Nothing was sent; isolate the entries that cannot be encoded
+            await self._insert_each(batch)
+            return []
+        except Exception:
+            self.failed_flushes += 1
+            logger.exception("Audit log flush of %d entries failed", len(batch))
+            return batch
+        elapsed = (time.perf_counter() - started) * 1000
+        self.flushes += 1
+        self.written += written
+        self.last_flush_ms = elapsed
+        self.max_flush_ms = max(self.max_flush_ms, elapsed)
+        return []
+
+    async def _insert_each(self, batch: List[Dict[str, Any]]):
+        """Last resort for a batch that keeps failing: one insert per entry, dead-letter what still fails"""
+        for doc in batch:
+            try:
+                await self.collection.insert_one(doc)
+            except DuplicateKeyError:
+                pass
+            except Exception as exc:
+                self._dead_letter([doc], f"Audit entry could not be written ({type(exc).__name__})")
+                continue
+            self.written += 1
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        batch = []
+        attempts = 0
+        stopping = False
+        while not stopping:
+            if not batch:
+                item = await self.queue.get()
+                if item is self._STOP:
+                    break
+                batch.append(item)
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is self._STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            batch = await self._flush(batch)
+            if not batch:
+                attempts = 0
+                continue
+            attempts += 1
+            if attempts >= self.max_retries:
+                await self._insert_each(batch)
+                batch, attempts = [], 0
+            elif not stopping:
+                await asyncio.sleep(self.flush_interval)
+        # Drain: retry the final batch, then write entry by entry so nothing is lost silently
+        for _ in range(self.max_retries):
+            if not batch:
+                return
+            batch = await self._flush(batch)
+            if batch:
+                await asyncio.sleep(self.flush_interval)
+        if batch:
+            await self._insert_each(batch)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "queue_depth": self.queue.qsize(),
+            "queue_capacity": self.queue.maxsize,
+            "written": self.written,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "dead_lettered": self.dead_lettered,
+            "backpressure_waits": self.backpressure_waits,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "max_flush_ms": round(self.max_flush_ms, 3)
+        }
+
+audit_dead_letter = logging.getLogger("audit.dead_letter")
+audit_writer = AuditLogWriter(db.audit_logs)
 
 async def log_audit(user: User, action: str, module: str, details: Dict[str, Any], request: Request = None):
     audit_log = AuditLog(
@@ -330,293 +988,1418 @@ async def log_audit(user: User, action: str, module: str, details: Dict[str, Any
         ip_address=request.client.host if request else None
     )
     doc = audit_log.model_dump()
-    doc['timestamp'] = doc['timestamp'].isoformat()
-    await db.audit_logs.insert_one(doc)
+    await audit_writer.submit(doc)
+
+BARCODE_FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
 
-def generate_barcode_base64(barcode_text: str) -> str:
+def write_file_atomic(path: Path, data: bytes):
+    """Write via a unique temporary file in the same directory, so concurrent writers never share one"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f"{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+@lru_cache(maxsize=BARCODE_CACHE_SIZE)
+def render_barcode(barcode_text: str, barcode_format: str = "png") -> bytes:
+    """
+    Code128 image bytes. A sample's barcode never changes, so images are cached in
+    memory (LRU) and optionally on disk. SVG skips PIL rasterisation entirely.
+    """
+    disk_path = None
+    if BARCODE_CACHE_DIR:
+        disk_name = hashlib.sha256(barcode_text.encode()).hexdigest()
+        disk_path = Path(BARCODE_CACHE_DIR) / f"{disk_name}.{barcode_format}"
+        if disk_path.exists():
+            return disk_path.read_bytes()
+    
     EAN = barcode.get_barcode_class('code128')
-    ean = EAN(barcode_text, writer=ImageWriter())
+    ean = EAN(barcode_text, writer=ImageWriter() if barcode_format == "png" else SVGWriter())
     buffer = BytesIO()
     ean.write(buffer)
-    buffer.seek(0)
-    return base64.b64encode(buffer.getvalue()).decode()
+    data = buffer.getvalue()
+    
+    if disk_path:
+        write_file_atomic(disk_path, data)
+    return data
 
-# ==================== AUTH ROUTES ====================
+def generate_barcode_base64(barcode_text: str, barcode_format: str = "png") -> str:
+    return base64.b64encode(render_barcode(barcode_text, barcode_format)).decode()
 
-@api_router.post("/auth/register", response_model=User)
-async def register(user_data: UserCreate):
-    existing = await db.users.find_one({"email": user_data.email}, {"_id": 0})
-    if existing:
-        raise HTTPException(status_code=400, detail="Email already registered")
-    
-    hashed_password = get_password_hash(user_data.password)
-    user = User(
-        email=user_data.email,
-        name=user_data.name,
-        role=user_data.role
-    )
-    
-    doc = user.model_dump()
-    doc['password'] = hashed_password
-    doc['created_at'] = doc['created_at'].isoformat()
-    
-    await db.users.insert_one(doc)
-    return user
+# ==================== ID SEQUENCER ====================
 
-@api_router.post("/auth/login", response_model=Token)
-async def login(credentials: UserLogin):
-    user_doc = await db.users.find_one({"email": credentials.email}, {"_id": 0})
-    if not user_doc:
-        raise HTTPException(status_code=401, detail="Invalid email or password")
-    
-    if not verify_password(credentials.password, user_doc['password']):
-        raise HTTPException(status_code=401, detail="Invalid email or password")
-    
-    if not user_doc.get('is_active', True):
-        raise HTTPException(status_code=401, detail="Account is inactive")
-    
-    user = User(**user_doc)
-    access_token = create_access_token(data={"sub": user.id})
-    
-    return Token(access_token=access_token, token_type="bearer", user=user)
+class IDSequencer:
+    """
+    Atomic id allocator backed by the counters collection.
+    Each worker reserves a block of numbers with a single $inc and hands them out
+    from memory, so concurrent requests (and workers) never share a number.
+    Numbers left in a block when the worker stops are skipped, not reused.
+    """
 
-@api_router.get("/auth/me", response_model=User)
-async def get_me(current_user: User = Depends(get_current_user)):
-    return current_user
+    def __init__(self, collection, block_size: int = ID_BLOCK_SIZE):
+        self.collection = collection
+        self.block_size = max(1, block_size)
+        self._blocks: Dict[str, List[int]] = {}  # name -> [next, last]
+        self._locks: Dict[str, asyncio.Lock] = {}
 
-# ==================== PATIENT ROUTES ====================
+    async def _reserve(self, name: str, size: int) -> int:
+        counter = await self.collection.find_one_and_update(
+            {"_id": name},
+            {"$inc": {"value": size}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return counter['value']
 
-@api_router.post("/patients", response_model=Patient)
-async def create_patient(patient_data: PatientCreate, current_user: User = Depends(get_current_user), request: Request = None):
-    # Generate UHID
-    count = await db.patients.count_documents({}) + 1
-    uhid = f"UHID{count:06d}"
-    
-    patient = Patient(
-        uhid=uhid,
-        name=patient_data.name,
-        age=patient_data.age,
-        gender=patient_data.gender,
-        phone=patient_data.phone,
-        email=patient_data.email,
-        address=patient_data.address,
-        patient_type=patient_data.patient_type,
-        created_by=current_user.id
-    )
-    
-    doc = patient.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    await db.patients.insert_one(doc)
-    
-    await log_audit(current_user, "CREATE", "patients", {"patient_id": patient.id, "uhid": uhid}, request)
-    
-    return patient
+    async def seed(self, name: str, floor: int):
+        """Make sure the counter never hands out a number <= floor"""
+        await self.collection.update_one({"_id": name}, {"$max": {"value": floor}}, upsert=True)
 
-@api_router.get("/patients", response_model=List[Patient])
-async def get_patients(skip: int = 0, limit: int = 100, search: str = None, current_user: User = Depends(get_current_user)):
-    query = {}
-    if search:
-        query = {"$or": [
-            {"name": {"$regex": search, "$options": "i"}},
-            {"uhid": {"$regex": search, "$options": "i"}},
-            {"phone": {"$regex": search, "$options": "i"}}
-        ]}
-    
-    patients = await db.patients.find(query, {"_id": 0}).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
-    for p in patients:
-        if isinstance(p['created_at'], str):
-            p['created_at'] = datetime.fromisoformat(p['created_at'])
-    return patients
+    async def take(self, name: str, count: int = 1) -> List[int]:
+        """Return `count` unique numbers, costing at most one round trip"""
+        lock = self._locks.setdefault(name, asyncio.Lock())
+        async with lock:
+            block = self._blocks.get(name, [1, 0])
+            numbers = list(range(block[0], min(block[1], block[0] + count - 1) + 1))
+            block[0] += len(numbers)
+            missing = count - len(numbers)
+            if missing > 0:
+                size = max(self.block_size, missing)
+                last = await self._reserve(name, size)
+                first = last - size + 1
+                numbers.extend(range(first, first + missing))
+                block = [first + missing, last]
+            self._blocks[name] = block
+            return numbers
 
-@api_router.get("/patients/{patient_id}", response_model=Patient)
-async def get_patient(patient_id: str, current_user: User = Depends(get_current_user)):
-    patient = await db.patients.find_one({"id": patient_id}, {"_id": 0})
-    if not patient:
-        raise HTTPException(status_code=404, detail="Patient not found")
-    if isinstance(patient['created_at'], str):
-        patient['created_at'] = datetime.fromisoformat(patient['created_at'])
-    return Patient(**patient)
+    async def next(self, name: str) -> int:
+        return (await self.take(name))[0]
 
-# ==================== SAMPLE ROUTES ====================
+id_sequencer = IDSequencer(db.counters)
 
-@api_router.post("/samples", response_model=Sample)
-async def create_sample(sample_data: SampleCreate, current_user: User = Depends(get_current_user), request: Request = None):
-    patient = await db.patients.find_one({"id": sample_data.patient_id}, {"_id": 0})
-    if not patient:
-        raise HTTPException(status_code=404, detail="Patient not found")
-    
-    # Generate sample ID and barcode
-    count = await db.samples.count_documents({}) + 1
-    sample_id = f"SMP{count:08d}"
-    barcode_num = f"{count:012d}"
-    
-    # Calculate TAT deadline (use maximum TAT from tests)
-    max_tat = max([test.tat_hours for test in sample_data.tests])
-    tat_deadline = datetime.now(timezone.utc) + timedelta(hours=max_tat)
-    
-    sample = Sample(
-        sample_id=sample_id,
-        barcode=barcode_num,
-        patient_id=sample_data.patient_id,
-        patient_name=patient['name'],
-        uhid=patient['uhid'],
-        tests=[test.model_dump() for test in sample_data.tests],
-        sample_type=sample_data.sample_type,
-        collected_by=current_user.id,
-        tat_deadline=tat_deadline
-    )
-    
-    doc = sample.model_dump()
-    doc['collection_date'] = doc['collection_date'].isoformat()
-    doc['tat_deadline'] = doc['tat_deadline'].isoformat()
-    doc['created_at'] = doc['created_at'].isoformat()
-    await db.samples.insert_one(doc)
-    
-    await log_audit(current_user, "CREATE", "samples", {"sample_id": sample_id, "patient_id": sample_data.patient_id}, request)
-    
-    return sample
+def format_uhid(number: int) -> str:
+    return f"UHID{number:06d}"
 
-@api_router.get("/samples", response_model=List[Sample])
-async def get_samples(skip: int = 0, limit: int = 100, status: str = None, current_user: User = Depends(get_current_user)):
-    query = {}
-    if status:
-        query["status"] = status
-    
-    samples = await db.samples.find(query, {"_id": 0}).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
-    for s in samples:
-        if isinstance(s['collection_date'], str):
-            s['collection_date'] = datetime.fromisoformat(s['collection_date'])
-        if isinstance(s['tat_deadline'], str):
-            s['tat_deadline'] = datetime.fromisoformat(s['tat_deadline'])
-        if isinstance(s['created_at'], str):
-            s['created_at'] = datetime.fromisoformat(s['created_at'])
-    return samples
+def format_sample_id(number: int) -> str:
+    return f"SMP{number:08d}"
 
-@api_router.get("/samples/{sample_id}", response_model=Sample)
-async def get_sample(sample_id: str, current_user: User = Depends(get_current_user)):
-    sample = await db.samples.find_one({"id": sample_id}, {"_id": 0})
-    if not sample:
-        raise HTTPException(status_code=404, detail="Sample not found")
-    if isinstance(sample['collection_date'], str):
-        sample['collection_date'] = datetime.fromisoformat(sample['collection_date'])
-    if isinstance(sample['tat_deadline'], str):
-        sample['tat_deadline'] = datetime.fromisoformat(sample['tat_deadline'])
-    if isinstance(sample['created_at'], str):
-        sample['created_at'] = datetime.fromisoformat(sample['created_at'])
-    return Sample(**sample)
+def format_barcode(number: int) -> str:
+    return f"{number:012d}"
 
-@api_router.put("/samples/{sample_id}/status", response_model=Sample)
-async def update_sample_status(sample_id: str, status_update: SampleStatusUpdate, current_user: User = Depends(get_current_user), request: Request = None):
-    sample = await db.samples.find_one({"id": sample_id}, {"_id": 0})
-    if not sample:
-        raise HTTPException(status_code=404, detail="Sample not found")
-    
-    await db.samples.update_one({"id": sample_id}, {"$set": {"status": status_update.status}})
-    sample['status'] = status_update.status
-    
-    await log_audit(current_user, "UPDATE_STATUS", "samples", {"sample_id": sample_id, "new_status": status_update.status}, request)
-    
-    if isinstance(sample['collection_date'], str):
-        sample['collection_date'] = datetime.fromisoformat(sample['collection_date'])
-    if isinstance(sample['tat_deadline'], str):
-        sample['tat_deadline'] = datetime.fromisoformat(sample['tat_deadline'])
-    if isinstance(sample['created_at'], str):
-        sample['created_at'] = datetime.fromisoformat(sample['created_at'])
-    return Sample(**sample)
+async def next_uhid() -> str:
+    return format_uhid(await id_sequencer.next("patients"))
 
-@api_router.post("/samples/{sample_id}/reject", response_model=Sample)
-async def reject_sample(sample_id: str, rejection: SampleRejection, current_user: User = Depends(get_current_user), request: Request = None):
-    sample = await db.samples.find_one({"id": sample_id}, {"_id": 0})
-    if not sample:
-        raise HTTPException(status_code=404, detail="Sample not found")
-    
-    await db.samples.update_one({"id": sample_id}, {"$set": {
-        "is_rejected": True,
-        "rejection_reason": rejection.rejection_reason,
-        "status": "rejected"
-    }})
-    
-    sample['is_rejected'] = True
-    sample['rejection_reason'] = rejection.rejection_reason
-    sample['status'] = "rejected"
-    
-    await log_audit(current_user, "REJECT", "samples", {"sample_id": sample_id, "reason": rejection.rejection_reason}, request)
-    
-    if isinstance(sample['collection_date'], str):
-        sample['collection_date'] = datetime.fromisoformat(sample['collection_date'])
-    if isinstance(sample['tat_deadline'], str):
-        sample['tat_deadline'] = datetime.fromisoformat(sample['tat_deadline'])
-    if isinstance(sample['created_at'], str):
-        sample['created_at'] = datetime.fromisoformat(sample['created_at'])
-    return Sample(**sample)
+async def next_sample_ids() -> tuple:
+    """Sample ID and barcode share one sequence, as they always have"""
+    number = await id_sequencer.next("samples")
+    return format_sample_id(number), format_barcode(number)
 
-@api_router.get("/samples/{sample_id}/barcode")
-async def get_sample_barcode(sample_id: str, current_user: User = Depends(get_current_user)):
-    sample = await db.samples.find_one({"id": sample_id}, {"_id": 0})
-    if not sample:
-        raise HTTPException(status_code=404, detail="Sample not found")
-    
-    barcode_base64 = generate_barcode_base64(sample['barcode'])
-    return {"barcode": barcode_base64, "barcode_text": sample['barcode']}
+async def last_issued_number(collection, field: str, prefix: str) -> Optional[int]:
+    """Largest number behind `prefix` in `field`, compared as numbers (UHID1000000 > UHID999999)"""
+    pipeline = [
+        {"$match": {field: {"$regex": f"^{prefix}\\d+$"}}},
+        # ids are ASCII, so the byte offset of $substr is the character offset
+        {"$group": {"_id": None, "last": {"$max": {"$toLong": {"$substr": [f"${field}", len(prefix), 64]}}}}},
+    ]
+    rows = await collection.aggregate(pipeline).to_list(1)
+    return rows[0]['last'] if rows else None
 
-# ==================== TEST CONFIG ROUTES ====================
+async def seed_id_sequences():
+    """Move the counters past ids issued before the sequencer existed"""
+    last_patient = await last_issued_number(db.patients, "uhid", "UHID")
+    if last_patient is not None:
+        await id_sequencer.seed("patients", last_patient)
+    last_sample = await last_issued_number(db.samples, "sample_id", "SMP")
+    if last_sample is not None:
+        await id_sequencer.seed("samples", last_sample)
 
-@api_router.post("/tests", response_model=TestConfig)
+# ==================== EVENT BUS ====================
+
+EVENT_TOPICS = ("dashboard", "sample.status", "result.critical", "tat.approaching", "tat.breach")
+
+def format_sse(event_id: int, topic: str, data: Dict[str, Any]) -> str:
+    return f"id: {event_id}\nevent: {topic}\ndata: {json.dumps(data, default=_export_default)}\n\n"
+
+class EventSubscription:
+    __slots__ = ("topics", "queue", "dropped", "reported", "connected_at")
+
+    def __init__(self, topics, buffer_size: int):
+        self.topics = frozenset(topics)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=buffer_size)
+        self.dropped = 0   # events discarded because this client fell behind
+        self.reported = 0  # how many of those the client has been told about
+        self.connected_at = time.time()
+
+class EventBus:
+    """
+    In-process publish/subscribe for the SSE stream. Write handlers publish without
+    waiting: each event is serialised once and handed to the subscribers of its topic.
+    Every subscriber has a bounded buffer; when a slow client's buffer is full its oldest
+    event is dropped, so one stalled screen never holds up a write or grows memory.
+    Events only reach clients connected to the worker that published them.
+    """
+
+    def __init__(self, buffer_size: int = EVENT_BUFFER_SIZE, max_subscribers: int = EVENT_MAX_SUBSCRIBERS):
+        self.buffer_size = max(1, buffer_size)
+        self.max_subscribers = max_subscribers
+        self._by_topic: Dict[str, set] = {topic: set() for topic in EVENT_TOPICS}
+        self._subscribers: set = set()
+        self._sequence = 0
+        self.published = {topic: 0 for topic in EVENT_TOPICS}
+        self.delivered = 0
+        self.dropped = 0
+
+    def subscribe(self, topics) -> EventSubscription:
+        if len(self._subscribers) >= self.max_subscribers:
+            raise HTTPException(status_code=503, detail="Too many event stream clients")
+        subscription = EventSubscription(topics, self.buffer_size)
+        self._subscribers.add(subscription)
+        for topic in subscription.topics:
+            self._by_topic[topic].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: EventSubscription):
+        self._subscribers.discard(subscription)
+        for topic in subscription.topics:
+            self._by_topic[topic].discard(subscription)
+
+    def has_subscribers(self, topic: str) -> bool:
+        return bool(self._by_topic[topic])
+
+    def publish(self, topic: str, data: Dict[str, Any]):
+        """Queue an event for every subscriber of `topic`; never blocks"""
+        self.published[topic] += 1
+        subscribers = self._by_topic[topic]
+        if not subscribers:
+            return
+        self._sequence += 1
+        message = format_sse(self._sequence, topic, {**data, "at": datetime.now(timezone.utc)})
+        for subscription in subscribers:
+            queue = subscription.queue
+            if queue.full():
+                queue.get_nowait()
+                subscription.dropped += 1
+                self.dropped += 1
+            queue.put_nowait(message)
+        self.delivered += len(subscribers)
+
+    async def stream(self, subscription: EventSubscription, heartbeat: float = EVENT_HEARTBEAT_INTERVAL):
+        """SSE body for one client: queued events, an `overflow` event after drops, keepalive comments when idle"""
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscription.queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if subscription.dropped > subscription.reported:
+                    # Tell the client it missed events so it can refetch instead of trusting deltas
+                    yield f"event: overflow\ndata: {json.dumps({'dropped': subscription.dropped - subscription.reported})}\n\n"
+                    subscription.reported = subscription.dropped
+                yield message
+        finally:
+            self.unsubscribe(subscription)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "subscribers": len(self._subscribers),
+            "subscribers_by_topic": {topic: len(subs) for topic, subs in self._by_topic.items()},
+            "buffer_size": self.buffer_size,
+            "max_subscribers": self.max_subscribers,
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "buffered": sum(s.queue.qsize() for s in self._subscribers),
+        }
+
+event_bus = EventBus()
+
+def publish_sample_status(sample: Dict[str, Any], previous_status: Optional[str]):
+    event_bus.publish("sample.status", {
+        "id": sample['id'],
+        "sample_id": sample['sample_id'],
+        "uhid": sample.get('uhid'),
+        "status": sample['status'],
+        "previous_status": previous_status
+    })
+
+def publish_critical_result(result: Dict[str, Any]):
+    event_bus.publish("result.critical", {
+        "result_id": result['id'],
+        "sample_id": result['sample_id'],
+        "patient_id": result['patient_id'],
+        "test_name": result['test_name'],
+        "parameters": [p['parameter_name'] for p in result['parameters'] if p['status'] == "critical"]
+    })
+
+# ==================== DASHBOARD COUNTERS ====================
+
+# Terminal statuses: a rejected sample will never be reported, so it has no TAT to breach
+TAT_OPEN_EXCLUDED_STATUSES = ["approved", "dispatched", "rejected"]
+DASHBOARD_SAMPLE_STATUSES = ["collected", "received", "processing", "under_validation", "approved"]
+
+def tat_breach_query(now: datetime) -> Dict[str, Any]:
+    return {"tat_deadline": {"$lt": now}, "status": {"$nin": TAT_OPEN_EXCLUDED_STATUSES}}
+
+def day_key(moment: datetime) -> str:
+    return moment.astimezone(timezone.utc).strftime("%Y-%m-%d")
+
+class DashboardCounters:
+    """
+    Dashboard numbers kept in one document and moved with $inc by the same code paths
+    that write patients, samples and results, so the dashboard is a single find_one.
+    Writes and their counter updates are separate operations (no transactions), so a crash
+    in between or a concurrent edit can leave drift; reconcile() rebuilds every counter from
+    the collections with one $facet aggregation each and runs at startup and periodically.
+    TAT breaches are counted by the TAT monitor as they happen and as breached samples close.
+    """
+
+    KEY = "dashboard"
+    DAYS_KEPT = 7
+
+    def __init__(self, collection, database, reconcile_interval: float = DASHBOARD_RECONCILE_INTERVAL):
+        self.collection = collection
+        self.db = database
+        self.reconcile_interval = reconcile_interval
+        self._task: Optional[asyncio.Task] = None
+        self.increments = 0
+        self.reads = 0
+        self.reconciles = 0
+        self.last_drift: Dict[str, int] = {}
+        self.last_reconcile_ms = 0.0
+
+    @staticmethod
+    def patients_added(count: int = 1) -> Dict[str, int]:
+        return {"patients": count}
+
+    @staticmethod
+    def sample_change(before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> Dict[str, int]:
+        """Counter deltas for a sample going from `before` to `after` (None = not stored)"""
+        changes = defaultdict(int)
+        if before:
+            changes[f"samples.status.{before['status']}"] -= 1
+        if after:
+            changes[f"samples.status.{after['status']}"] += 1
+            if not before:
+                changes[f"samples.by_day.{day_key(after['created_at'])}"] += 1
+        return changes
+
+    @staticmethod
+    def result_change(before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> Dict[str, int]:
+        """Counter deltas for a result going from `before` to `after` (None = not stored)"""
+        changes = defaultdict(int)
+        for doc, sign in ((before, -1), (after, 1)):
+            if doc:
+                changes[f"results.status.{doc['status']}"] += sign
+                if doc.get('has_critical_values') and doc['status'] != "finalized":
+                    changes["results.critical_open"] += sign
+        return changes
+
+    async def apply(self, *change_sets: Dict[str, int]):
+        """Add change sets ({counter path: delta}, from the helpers above) with one atomic $inc"""
+        changes = defaultdict(int)
+        for change_set in change_sets:
+            for path, delta in change_set.items():
+                changes[path] += delta
+        changes = {path: delta for path, delta in changes.items() if delta}
+        if not changes:
+            return
+        await self.collection.update_one({"_id": self.KEY}, {"$inc": changes}, upsert=True)
+        self.increments += 1
+        event_bus.publish("dashboard", {"changes": changes})
+
+    async def read(self) -> Dict[str, Any]:
+        """The counters document, rebuilt first if it has never been reconciled"""
+        self.reads += 1
+        doc = await self.collection.find_one({"_id": self.KEY})
+        if not doc or "reconciled_at" not in doc:
+            await self.reconcile()
+            doc = await self.collection.find_one({"_id": self.KEY})
+        return doc
+
+    async def count(self, now: datetime = None) -> Dict[str, Any]:
+        """Every counter computed from the collections: one $facet per collection, run concurrently"""
+        now = now or datetime.now(timezone.utc)
+        since = now.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=self.DAYS_KEPT - 1)
+        group_by_status = [{"$group": {"_id": "$status", "n": {"$sum": 1}}}]
+        sample_facets, result_facets, patients = await asyncio.gather(
+            self.db.samples.aggregate([{"$facet": {
+                "status": group_by_status,
+                "by_day": [
+                    {"$match": {"created_at": {"$gte": since}}},
+                    {"$group": {"_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}}, "n": {"$sum": 1}}}
+                ],
+                "tat_breaches": [{"$match": tat_breach_query(now)}, {"$count": "n"}],
+            }}]).to_list(None),
+            self.db.test_results.aggregate([{"$facet": {
+                "status": group_by_status,
+                "critical_open": [{"$match": {"has_critical_values": True, "status": {"$ne": "finalized"}}}, {"$count": "n"}],
+            }}]).to_list(None),
+            self.db.patients.count_documents({})
+        )
+        samples, results = sample_facets[0], result_facets[0]
+        return {
+            "patients": patients,
+            "samples": {
+                "status": {row['_id']: row['n'] for row in samples['status'] if row['_id']},
+                "by_day": {row['_id']: row['n'] for row in samples['by_day']},
+            },
+            "results": {
+                "status": {row['_id']: row['n'] for row in results['status'] if row['_id']},
+                "critical_open": results['critical_open'][0]['n'] if results['critical_open'] else 0,
+            },
+            "tat_breaches": samples['tat_breaches'][0]['n'] if samples['tat_breaches'] else 0,
+        }
+
+    @staticmethod
+    def _flatten(doc: Dict[str, Any], prefix: str = "") -> Dict[str, int]:
+        flat = {}
+        for key, value in doc.items():
+            if isinstance(value, dict):
+                flat.update(DashboardCounters._flatten(value, f"{prefix}{key}."))
+            elif isinstance(value, int) and not isinstance(value, bool):
+                flat[prefix + key] = value
+        return flat
+
+    async def reconcile(self) -> Dict[str, int]:
+        """Overwrite the counters with freshly aggregated values; returns the drift that was corrected"""
+        started = time.perf_counter()
+        now = datetime.now(timezone.utc)
+        stored = await self.collection.find_one({"_id": self.KEY}) or {}
+        counted = await self.count(now)
+        await self.collection.update_one(
+            {"_id": self.KEY},
+            {"$set": {**counted, "reconciled_at": now}},
+            upsert=True
+        )
+        before, after = self._flatten(stored), self._flatten(counted)
+        drift = {path: after.get(path, 0) - before.get(path, 0) for path in set(before) | set(after)
+                 if not path.startswith("samples.by_day.") and after.get(path, 0) != before.get(path, 0)}
+        self.reconciles += 1
+        self.last_drift = drift
+        if drift:
+            event_bus.publish("dashboard", {"reconciled": drift})
+        self.last_reconcile_ms = (time.perf_counter() - started) * 1000
+        return drift
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.running:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                drift = await self.reconcile()
+                if drift:
+                    logger.warning(f"Dashboard counters drifted and were corrected: {drift}")
+            except Exception:
+                logger.exception("Dashboard counter reconciliation failed")
+            await asyncio.sleep(self.reconcile_interval)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "reconcile_interval": self.reconcile_interval,
+            "increments": self.increments,
+            "reads": self.reads,
+            "reconciles": self.reconciles,
+            "last_drift": self.last_drift,
+            "last_reconcile_ms": round(self.last_reconcile_ms, 2),
+        }
+
+dashboard_counters = DashboardCounters(db.dashboard_counters, db)
+
+# ==================== TAT MONITOR ====================
+
+TAT_SAMPLE_PROJECTION = {
+    "_id": 0, "id": 1, "sample_id": 1, "uhid": 1, "patient_name": 1, "sample_type": 1,
+    "tests.test_name": 1, "status": 1, "tat_deadline": 1, "created_at": 1
+}
+
+def tat_event(sample: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": sample['id'],
+        "sample_id": sample['sample_id'],
+        "uhid": sample.get('uhid'),
+        "patient_name": sample.get('patient_name'),
+        "status": sample['status'],
+        "tat_deadline": parse_datetime(sample['tat_deadline'])
+    }
+
+class TATMonitor:
+    """
+    Raises TAT "approaching" and "breached" events when they fall due. Open samples sit in
+    a min-heap keyed on the time of their next event and the background task sleeps until
+    the top entry is due (or a write pushes an earlier one), so nothing is scanned on a timer.
+    Closing a sample removes it lazily: its heap entries are skipped when they surface.
+    Sample writes on this worker update the heap directly. Samples created on other workers
+    are picked up by created_at every sync_interval seconds, and due samples are re-read
+    before anything fires, so a sample closed elsewhere raises no alert.
+    Each breach is stored once in tat_breaches (unique per sample) for TAT analytics, and
+    gets closed_at / overdue_minutes when the sample is finally approved, dispatched or rejected.
+    """
+
+    def __init__(self, samples, breaches, warning_minutes: float = TAT_WARNING_MINUTES,
+                 sync_interval: float = TAT_MONITOR_SYNC_INTERVAL):
+        self.samples = samples
+        self.breaches = breaches
+        self.warning = timedelta(minutes=warning_minutes)
+        self.sync_interval = sync_interval
+        self._heap: List[Tuple[datetime, int, str, str]] = []  # (due, tie-breaker, kind, sample id)
+        self._deadlines: Dict[str, datetime] = {}  # samples being watched -> tat_deadline
+        self._pushed = 0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._synced_at: Optional[datetime] = None
+        self.approaching = 0
+        self.breached = 0
+        self.recorded = 0
+        self.closed_late = 0
+        self.skipped = 0
+
+    def _push(self, due: datetime, kind: str, sample_id: str):
+        self._pushed += 1
+        heapq.heappush(self._heap, (due, self._pushed, kind, sample_id))
+        if self._heap[0][1] == self._pushed:
+            self._wakeup.set()  # new earliest entry: the scheduler must wake up sooner
+
+    def track(self, sample: Dict[str, Any], now: datetime = None):
+        """Watch an open sample; samples already watched or without a deadline are ignored"""
+        deadline = parse_datetime(sample.get('tat_deadline'))
+        if sample['status'] in TAT_OPEN_EXCLUDED_STATUSES or sample['id'] in self._deadlines or not isinstance(deadline, datetime):
+            return
+        now = now or datetime.now(timezone.utc)
+        self._deadlines[sample['id']] = deadline
+        if deadline - self.warning > now:
+            self._push(deadline - self.warning, "approaching", sample['id'])
+        self._push(deadline, "breached", sample['id'])
+
+    def untrack(self, sample_id: str):
+        self._deadlines.pop(sample_id, None)
+
+    def _record(self, sample: Dict[str, Any], now: datetime) -> Dict[str, Any]:
+        deadline = parse_datetime(sample['tat_deadline'])
+        return {
+            "id": str(uuid.uuid4()),
+            "sample_id": sample['id'],
+            "sample_code": sample['sample_id'],
+            "uhid": sample.get('uhid'),
+            "patient_name": sample.get('patient_name'),
+            "sample_type": sample.get('sample_type'),
+            "tests": [test.get('test_name') for test in sample.get('tests') or []],
+            "collected_at": parse_datetime(sample.get('created_at')),
+            "tat_deadline": deadline,
+            "breached_at": deadline,
+            "detected_at": now,
+            "status_at_breach": sample['status'],
+            "closed_at": None,
+        }
+
+    async def _record_breaches(self, samples: List[Dict[str, Any]], now: datetime) -> int:
+        """Upsert one breach record per sample; returns how many were new (other workers may race us)"""
+        operations = [UpdateOne({"sample_id": sample['id']}, {"$setOnInsert": self._record(sample, now)}, upsert=True)
+                      for sample in samples]
+        try:
+            inserted = (await self.breaches.bulk_write(operations, ordered=False)).upserted_count
+        except BulkWriteError as e:
+            inserted = e.details.get('nUpserted', 0)
+        if inserted:
+            self.recorded += inserted
+            await dashboard_counters.apply({"tat_breaches": inserted})
+        return inserted
+
+    async def load(self):
+        """Watch every open sample; ones already past their deadline are recorded without alerts"""
+        now = datetime.now(timezone.utc)
+        self._heap.clear()
+        self._deadlines.clear()
+        overdue = []
+        async for sample in self.samples.find({"status": {"$nin": TAT_OPEN_EXCLUDED_STATUSES}}, TAT_SAMPLE_PROJECTION):
+            deadline = parse_datetime(sample.get('tat_deadline'))
+            if isinstance(deadline, datetime) and deadline <= now:
+                overdue.append(sample)
+            else:
+                self.track(sample, now)
+        for start in range(0, len(overdue), 1000):
+            await self._record_breaches(overdue[start:start + 1000], now)
+        self._synced_at = now
+
+    async def sync(self):
+        """Watch samples created since the last sync, e.g. on another worker"""
+        now = datetime.now(timezone.utc)
+        since = (self._synced_at or now) - timedelta(seconds=5)  # overlap for clock skew between workers
+        overdue = []
+        async for sample in self.samples.find(
+            {"created_at": {"$gte": since}, "status": {"$nin": TAT_OPEN_EXCLUDED_STATUSES}}, TAT_SAMPLE_PROJECTION
+        ):
+            deadline = parse_datetime(sample.get('tat_deadline'))
+            if isinstance(deadline, datetime) and deadline <= now:
+                overdue.append(sample)  # already handled by the worker that created it; recording is idempotent
+            else:
+                self.track(sample, now)
+        if overdue:
+            await self._record_breaches(overdue, now)
+        self._synced_at = now
+
+    async def sample_updated(self, sample: Dict[str, Any]):
+        """Call after a sample's status changes; closing a breached sample closes its breach record"""
+        if sample['status'] not in TAT_OPEN_EXCLUDED_STATUSES:
+            self.track(sample)
+            return
+        self.untrack(sample['id'])
+        deadline = parse_datetime(sample.get('tat_deadline'))
+        now = datetime.now(timezone.utc)
+        if not isinstance(deadline, datetime) or deadline > now:
+            return
+        closing = {"closed_at": now, "closed_status": sample['status'],
+                   "overdue_minutes": round((now - deadline).total_seconds() / 60, 1)}
+        closed = await self.breaches.update_one({"sample_id": sample['id'], "closed_at": None}, {"$set": closing})
+        if closed.modified_count:
+            self.closed_late += 1
+            await dashboard_counters.apply({"tat_breaches": -1})
+        elif not closed.matched_count:
+            # Closed late before the monitor fired: keep the record, it was never counted as open
+            try:
+                await self.breaches.update_one({"sample_id": sample['id']}, {"$setOnInsert": {**self._record(sample, now), **closing}}, upsert=True)
+            except DuplicateKeyError:
+                pass
+
+    async def fire_due(self, now: datetime = None) -> int:
+        """Raise the events whose time has come; returns how many fired"""
+        now = now or datetime.now(timezone.utc)
+        due: Dict[str, str] = {}
+        while self._heap and self._heap[0][0] <= now:
+            _, _, kind, sample_id = heapq.heappop(self._heap)
+            if sample_id in self._deadlines and due.get(sample_id) != "breached":
+                due[sample_id] = kind
+        if not due:
+            return 0
+        
+        samples = await self.samples.find({"id": {"$in": list(due)}}, TAT_SAMPLE_PROJECTION).to_list(None)
+        breached = []
+        for sample in samples:
+            if sample['status'] in TAT_OPEN_EXCLUDED_STATUSES:
+                self.untrack(sample['id'])
+                self.skipped += 1
+            elif due[sample['id']] == "breached":
+                self.untrack(sample['id'])
+                breached.append(sample)
+            else:
+                self.approaching += 1
+                event_bus.publish("tat.approaching", tat_event(sample))
+        for sample_id in set(due) - {sample['id'] for sample in samples}:
+            self.untrack(sample_id)
+        if breached:
+            self.breached += len(breached)
+            await self._record_breaches(breached, now)
+            for sample in breached:
+                event_bus.publish("tat.breach", tat_event(sample))
+        return len(samples)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.running:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                self._wakeup.clear()
+                timeout = self.sync_interval
+                if self._heap:
+                    timeout = min(timeout, max(0.0, (self._heap[0][0] - datetime.now(timezone.utc)).total_seconds()))
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                if not self._synced_at or (datetime.now(timezone.utc) - self._synced_at).total_seconds() >= self.sync_interval:
+                    await self.sync()
+                await self.fire_due()
+            except Exception:
+                logger.exception("TAT monitor failed")
+                await asyncio.sleep(1)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "watched": len(self._deadlines),
+            "heap_entries": len(self._heap),
+            "next_due": self._heap[0][0] if self._heap else None,
+            "warning_minutes": self.warning.total_seconds() / 60,
+            "approaching": self.approaching,
+            "breached": self.breached,
+            "recorded": self.recorded,
+            "closed_late": self.closed_late,
+            "skipped_closed": self.skipped,
+        }
+
+tat_monitor = TATMonitor(db.samples, db.tat_breaches)
+
+@api_router.get("/tat/breaches")
+async def get_tat_breaches(response: Response, start: datetime = None, end: datetime = None, open_only: bool = False,
+                           limit: int = 100, cursor: str = None, current_user: User = Depends(get_current_user)):
+    """Recorded TAT breaches, newest deadline first; open_only keeps samples not yet approved, dispatched or rejected"""
+    query: Dict[str, Any] = {}
+    if start or end:
+        query["breached_at"] = {**({"$gte": start} if start else {}), **({"$lt": end} if end else {})}
+    if open_only:
+        query["closed_at"] = None
+    return await fetch_page(db.tat_breaches, query, "breached_at", limit, response, cursor=cursor)
+
+@api_router.get("/tat/monitor/stats")
+async def tat_monitor_stats(current_user: User = Depends(get_current_user)):
+    return tat_monitor.stats()
+
+# ==================== REFERENCE RANGES ====================
+
+_RANGE_NUMBER = r"([-+]?\d+(?:\.\d+)?)"
+_RANGE_PATTERNS = (
+    (re.compile(rf"^\s*{_RANGE_NUMBER}\s*(?:-|–|to)\s*{_RANGE_NUMBER}", re.IGNORECASE), lambda m: (float(m[1]), float(m[2]))),
+    (re.compile(rf"^\s*(?:<=?|≤|up\s*to)\s*{_RANGE_NUMBER}", re.IGNORECASE), lambda m: (-math.inf, float(m[1]))),
+    (re.compile(rf"^\s*(?:>=?|≥)\s*{_RANGE_NUMBER}"), lambda m: (float(m[1]), math.inf)),
+)
+
+def parse_reference_range(text: Optional[str]) -> Optional[Tuple[float, float]]:
+    """'13.0-17.0', '< 200', 'Up to 40', '>60 mL/min' -> (low, high); None for ranges like 'Negative'"""
+    if not text:
+        return None
+    for pattern, bounds in _RANGE_PATTERNS:
+        match = pattern.match(text)
+        if match:
+            return bounds(match)
+    return None
+
+def parse_result_value(value: Optional[str]) -> Optional[float]:
+    """Numeric value of a result; analyzer qualifiers like '<0.5' are dropped, text results give None"""
+    if value is None:
+        return None
+    try:
+        number = float(str(value).strip().lstrip("<>=≤≥ "))
+    except ValueError:
+        return None
+    return number if math.isfinite(number) else None
+
+class CompiledParameter:
+    """A TestParameter with its range strings parsed once, when the catalog is loaded"""
+
+    __slots__ = ("test_name", "name", "texts", "ranges", "critical_low", "critical_high", "delta_abs", "delta_percent", "delta_window")
+
+    def __init__(self, parameter: Dict[str, Any], test_name: str = ""):
+        self.test_name = test_name
+        self.name = parameter['parameter_name']
+        self.texts = {
+            "male": parameter.get('ref_range_male'),
+            "female": parameter.get('ref_range_female'),
+            "child": parameter.get('ref_range_child'),
+        }
+        self.ranges = {group: parse_reference_range(text) for group, text in self.texts.items()}
+        self.critical_low = parameter.get('critical_low')
+        self.critical_high = parameter.get('critical_high')
+        self.delta_abs = parameter.get('delta_abs')
+        self.delta_percent = parameter.get('delta_percent')
+        if self.delta_percent is None:
+            self.delta_percent = DELTA_CHECK_DEFAULT_PERCENT
+        self.delta_window = timedelta(hours=parameter.get('delta_window_hours') or DELTA_CHECK_WINDOW_HOURS)
+
+    @property
+    def has_delta_rule(self) -> bool:
+        return self.delta_abs is not None or self.delta_percent is not None
+
+    def delta_exceeded(self, value: float, previous: float) -> bool:
+        change = abs(value - previous)
+        if self.delta_abs is not None and change >= self.delta_abs:
+            return True
+        return self.delta_percent is not None and previous != 0 and change / abs(previous) * 100 >= self.delta_percent
+
+    def select(self, age: Optional[int], gender: Optional[str]) -> Tuple[Optional[Tuple[float, float]], Optional[str]]:
+        """Reference interval and its printable text for a patient"""
+        if age is not None and age <= REFERENCE_CHILD_MAX_AGE and self.ranges['child']:
+            return self.ranges['child'], self.texts['child']
+        sex = (gender or "").strip().lower()[:1]
+        if sex in ("m", "f"):
+            group = "male" if sex == "m" else "female"
+            return self.ranges[group], self.texts[group]
+        # Unknown gender: accept anything inside either interval
+        male, female = self.ranges['male'], self.ranges['female']
+        if male and female:
+            return (min(male[0], female[0]), max(male[1], female[1])), f"{self.texts['male']} / {self.texts['female']}"
+        return (male, self.texts['male']) if male else (female, self.texts['female'])
+
+def classify_values(values: np.ndarray, lows: np.ndarray, highs: np.ndarray,
+                    critical_lows: np.ndarray, critical_highs: np.ndarray) -> np.ndarray:
+    """
+    Vectorised flagging: normal inside [low, high], low/high outside it, critical beyond
+    the critical limits. Missing bounds are passed as -inf/inf, missing critical limits as nan.
+    """
+    statuses = np.full(values.shape, "normal", dtype=object)
+    statuses[values < lows] = "low"
+    statuses[values > highs] = "high"
+    statuses[(values < critical_lows) | (values > critical_highs)] = "critical"
+    return statuses
+
+def evaluate_results(results: List[Dict[str, Any]], patients: Dict[str, Dict[str, Any]]) -> int:
+    """
+    Set the server-side status of every numeric parameter in `results` (in place), using
+    the patient's age and gender. A blank ref_range is filled with the range that was applied.
+    Parameters without a configured range or with a text value keep the status they came with.
+    All values in the batch are classified in one numpy pass; returns how many were evaluated.
+    """
+    targets = []
+    rows = []
+    for result in results:
+        patient = patients.get(result['patient_id']) or {}
+        for parameter in result['parameters']:
+            compiled = test_catalog.reference(result['test_name'], parameter['parameter_name'])
+            value = parse_result_value(parameter.get('value')) if compiled else None
+            if value is None:
+                continue
+            bounds, text = compiled.select(patient.get('age'), patient.get('gender'))
+            if bounds is None and compiled.critical_low is None and compiled.critical_high is None:
+                continue
+            low, high = bounds or (-math.inf, math.inf)
+            rows.append((value, low, high,
+                         math.nan if compiled.critical_low is None else compiled.critical_low,
+                         math.nan if compiled.critical_high is None else compiled.critical_high))
+            targets.append((parameter, text))
+    if not rows:
+        return 0
+    columns = np.array(rows, dtype=float).T
+    statuses = classify_values(*columns)
+    for (parameter, text), status in zip(targets, statuses):
+        parameter['status'] = status
+        if not parameter.get('ref_range') and text:
+            parameter['ref_range'] = text
+    return len(targets)
+
+async def evaluate_result_parameters(patient_id: str, test_name: str, parameters: List[Dict[str, Any]]) -> int:
+    """Single-result path of evaluate_results: one indexed patient read"""
+    patient = await db.patients.find_one({"id": patient_id}, {"_id": 0, "id": 1, "age": 1, "gender": 1})
+    await test_catalog.refresh()
+    return evaluate_results([{"patient_id": patient_id, "test_name": test_name, "parameters": parameters}],
+                            {patient_id: patient} if patient else {})
+
+# ==================== DELTA CHECKS ====================
+
+class DeltaChecker:
+    """
+    Compares new numeric results with the patient's previous value of the same test parameter.
+    Previous values come from a compact per-patient document in delta_index
+    ({_id: patient_id, parameters: {"test|parameter": last value}}), kept current on every
+    result write that has a delta rule, so a check is one read by _id instead of a scan of
+    test_results; results without one cost no round trip. Each entry also keeps the value
+    before it, so re-editing a result compares against the earlier result.
+    Checking does not write: callers record() the entries once the result itself is stored,
+    so a failed or skipped write never becomes the patient's previous value.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.checks = 0
+        self.flagged = 0
+
+    @staticmethod
+    def key(test_name: str, parameter_name: str) -> str:
+        # Parameters of different tests may share a name; field names cannot contain '.' or start with '$'
+        return re.sub(r"[.$]", "_", f"{test_name.strip().lower()}|{parameter_name.strip().lower()}")
+
+    def _targets(self, test_name: str, parameters: List[Dict[str, Any]]) -> list:
+        """Clear the delta fields of `parameters`; returns the numeric ones that have a delta rule"""
+        targets = []
+        for parameter in parameters:
+            parameter['delta_flag'] = False
+            parameter['previous_value'] = None
+            compiled = test_catalog.reference(test_name, parameter['parameter_name'])
+            value = parse_result_value(parameter.get('value')) if compiled and compiled.has_delta_rule else None
+            if value is not None:
+                targets.append((parameter, compiled, self.key(compiled.test_name, compiled.name), value))
+        return targets
+
+    def _compare(self, targets: list, history: Dict[str, Any], result_id: str, now: datetime) -> Tuple[int, Dict[str, Any]]:
+        """Flag targets against the patient's history; returns flags raised and the new history entries"""
+        flagged = 0
+        entries = {}
+        for parameter, compiled, key, value in targets:
+            entry = history.get(key)
+            # An edit of the same result is compared with (and keeps) the value before it
+            previous = entry.get('previous') if entry and entry.get('result_id') == result_id else entry
+            if previous and now - parse_datetime(previous['at']) <= compiled.delta_window:
+                if compiled.delta_exceeded(value, previous['value']):
+                    parameter['delta_flag'] = True
+                    parameter['previous_value'] = previous['value']
+                    flagged += 1
+            entries[key] = {
+                "value": value,
+                "at": now,
+                "result_id": result_id,
+                "previous": {k: previous[k] for k in ("value", "at", "result_id")} if previous else None,
+            }
+        return flagged, entries
+
+    async def check(self, patient_id: str, result_id: str, test_name: str, parameters: List[Dict[str, Any]],
+                    now: datetime = None) -> Tuple[int, Dict[str, Any]]:
+        """Set delta_flag/previous_value on `parameters` in place; returns flags raised and the entries to record()"""
+        now = now or datetime.now(timezone.utc)
+        targets = self._targets(test_name, parameters)
+        if not targets:
+            return 0, {}
+        
+        doc = await self.collection.find_one({"_id": patient_id}, {"_id": 0, "parameters": 1})
+        flagged, entries = self._compare(targets, (doc or {}).get('parameters', {}), result_id, now)
+        self.checks += 1
+        self.flagged += flagged
+        return flagged, entries
+
+    async def record(self, patient_id: str, entries: Dict[str, Any]):
+        """Make a stored result's values (the entries from check()) the patient's latest"""
+        if entries:
+            await self.collection.update_one({"_id": patient_id}, {"$set": {f"parameters.{key}": entry for key, entry in entries.items()}},
+                                             upsert=True)
+
+    async def check_many(self, results: List[Dict[str, Any]], now: datetime = None) -> List[Tuple[int, Dict[str, Any]]]:
+        """
+        check() for a batch of results in order, with one read for all their patients.
+        Returns (flags raised, history entries) per result; nothing is written until record_many().
+        """
+        now = now or datetime.now(timezone.utc)
+        planned = [(result, self._targets(result['test_name'], result['parameters'])) for result in results]
+        patient_ids = list({result['patient_id'] for result, targets in planned if targets})
+        if not patient_ids:
+            return [(0, {})] * len(results)
+        
+        docs = await self.collection.find({"_id": {"$in": patient_ids}}, {"parameters": 1}).to_list(None)
+        histories = {doc['_id']: doc.get('parameters', {}) for doc in docs}
+        checked = []
+        for result, targets in planned:
+            if not targets:
+                checked.append((0, {}))
+                continue
+            history = histories.setdefault(result['patient_id'], {})
+            flagged, entries = self._compare(targets, history, result['id'], now)
+            history.update(entries)  # a later result of the same batch compares with this one
+            checked.append((flagged, entries))
+            self.checks += 1
+            self.flagged += flagged
+        return checked
+
+    async def record_many(self, histories: List[Tuple[str, Dict[str, Any]]]):
+        """Record (patient_id, entries from check_many) of the results that were stored, with one bulk write"""
+        updates: Dict[str, Dict[str, Any]] = defaultdict(dict)
+        for patient_id, entries in histories:
+            updates[patient_id].update({f"parameters.{key}": entry for key, entry in entries.items()})
+        operations = [UpdateOne({"_id": patient_id}, {"$set": fields}, upsert=True)
+                      for patient_id, fields in updates.items() if fields]
+        if operations:
+            await self.collection.bulk_write(operations, ordered=False)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"checks": self.checks, "flagged": self.flagged}
+
+delta_checker = DeltaChecker(db.delta_index)
+
+# ==================== TEST CATALOG ====================
+
+class TestCatalog:
+    """
+    Process-local copy of the test master, indexed by id and test_code.
+    Writes bump a version counter in the counters collection. Readers compare it at most
+    every check_interval seconds and reload the whole catalog only when it moved, so
+    every worker picks up new tests without reading test_configs on each request.
+    """
+
+    VERSION_KEY = "test_catalog"
+
+    def __init__(self, collection, counters, check_interval: float = TEST_CATALOG_CHECK_INTERVAL):
+        self.collection = collection
+        self.counters = counters
+        self.check_interval = check_interval
+        self.version: Optional[int] = None
+        self.etag: Optional[str] = None
+        self.body = b"[]"  # GET /tests response, serialised once per version
+        self._by_id: Dict[str, Dict[str, Any]] = {}
+        self._by_code: Dict[str, Dict[str, Any]] = {}
+        self._references: Dict[Tuple[str, str], CompiledParameter] = {}
+        self._references_by_parameter: Dict[str, Optional[CompiledParameter]] = {}
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+        self.reloads = 0
+        self.version_checks = 0
+
+    async def _current_version(self) -> int:
+        counter = await self.counters.find_one({"_id": self.VERSION_KEY})
+        return counter['value'] if counter else 0
+
+    async def load(self, version: int = None):
+        # Read the version first: a test inserted in between only causes one extra reload
+        if version is None:
+            version = await self._current_version()
+        tests = await self.collection.find({}, {"_id": 0}).to_list(None)
+        by_code = {}
+        references = {}
+        references_by_parameter = {}
+        for test in tests:
+            by_code.setdefault(test['test_code'], test)
+            for parameter in test.get('parameters') or []:
+                compiled = CompiledParameter(parameter, test['test_name'])
+                name = compiled.name.strip().lower()
+                references.setdefault((test['test_name'].strip().lower(), name), compiled)
+                # A parameter name shared by several tests is ambiguous on its own
+                references_by_parameter[name] = None if name in references_by_parameter else compiled
+        body = json.dumps([TestConfig(**test).model_dump(mode="json") for test in tests]).encode()
+        self._by_id = {test['id']: test for test in tests}
+        self._by_code = by_code
+        self._references = references
+        self._references_by_parameter = references_by_parameter
+        self.body = body
+        self.etag = f'"tests-{version}-{hashlib.sha256(body).hexdigest()[:16]}"'
+        self.version = version
+        self._checked_at = time.monotonic()
+        self.reloads += 1
+
+    def _fresh(self) -> bool:
+        return self.version is not None and time.monotonic() - self._checked_at < self.check_interval
+
+    async def refresh(self):
+        """Reload if the catalog changed since the last check; usually a no-op"""
+        if self._fresh():
+            return
+        async with self._lock:
+            if self._fresh():
+                return
+            version = await self._current_version()
+            self.version_checks += 1
+            if version != self.version:
+                await self.load(version)
+            else:
+                self._checked_at = time.monotonic()
+
+    async def bump(self):
+        """Publish a change to the test master and reload this worker's copy"""
+        counter = await self.counters.find_one_and_update(
+            {"_id": self.VERSION_KEY},
+            {"$inc": {"value": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        async with self._lock:
+            await self.load(counter['value'])
+
+    def get(self, test_id: str) -> Optional[Dict[str, Any]]:
+        return self._by_id.get(test_id)
+
+    def by_code(self, test_code: str) -> Optional[Dict[str, Any]]:
+        return self._by_code.get(test_code)
+
+    def reference(self, test_name: str, parameter_name: str) -> Optional[CompiledParameter]:
+        """
+        Compiled ranges for a result parameter. test_name may list several tests ('CBC, LFT');
+        'CBC - Hemoglobin' style names and names unique across the catalog also resolve.
+        """
+        name = parameter_name.strip().lower()
+        for test in test_name.split(","):
+            compiled = self._references.get((test.strip().lower(), name))
+            if compiled:
+                return compiled
+        if " - " in name:
+            test, _, parameter = name.partition(" - ")
+            compiled = self._references.get((test.strip(), parameter.strip()))
+            if compiled:
+                return compiled
+        return self._references_by_parameter.get(name)
+
+    def test_items(self, test_codes: List[str]) -> List[TestItem]:
+        """Order lines for the known codes, in request order; unknown codes are dropped"""
+        items = []
+        for code in test_codes:
+            test = self._by_code.get(code)
+            if test:
+                items.append(TestItem(test_id=test['id'], test_name=test['test_name'],
+                                      price=test['price'], tat_hours=test['tat_hours']))
+        return items
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "etag": self.etag,
+            "tests": len(self._by_id),
+            "reference_ranges": len(self._references),
+            "reloads": self.reloads,
+            "version_checks": self.version_checks,
+            "check_interval": self.check_interval,
+        }
+
+test_catalog = TestCatalog(db.test_configs, db.counters)
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against our ETag"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in [tag[2:] if tag.startswith("W/") else tag for tag in candidates]
+
+# ==================== AUTH ROUTES ====================
+
+@api_router.post("/auth/register", response_model=User)
+async def register(user_data: UserCreate):
+    existing = await db.users.find_one({"email": user_data.email}, {"_id": 0})
+    if existing:
+        raise HTTPException(status_code=400, detail="Email already registered")
+    
+    hashed_password = await password_hasher.hash(user_data.password)
+    user = User(
+        email=user_data.email,
+        name=user_data.name,
+        role=user_data.role
+    )
+    
+    doc = user.model_dump()
+    doc['password'] = hashed_password
+    
+    await db.users.insert_one(doc)
+    return user
+
+@api_router.post("/auth/login", response_model=Token)
+async def login(credentials: UserLogin):
+    user_doc = await db.users.find_one({"email": credentials.email}, {"_id": 0})
+    if not user_doc:
+        raise HTTPException(status_code=401, detail="Invalid email or password")
+    
+    if not await password_hasher.verify(credentials.password, user_doc['password']):
+        raise HTTPException(status_code=401, detail="Invalid email or password")
+    
+    if not user_doc.get('is_active', True):
+        invalidate_user(user_doc['id'])
+        raise HTTPException(status_code=401, detail="Account is inactive")
+    
+    user = User(**user_doc)
+    user_cache.set(user.id, user)
+    access_token = create_access_token(data={"sub": user.id})
+    
+    return Token(access_token=access_token, token_type="bearer", user=user)
+
+@api_router.get("/auth/me", response_model=User)
+async def get_me(current_user: User = Depends(get_current_user)):
+    return current_user
+
+async def _change_user(user_id: str, changes: Dict[str, Any], action: str, current_user: User, request: Request) -> User:
+    user_doc = await db.users.find_one_and_update(
+        {"id": user_id},
+        {"$set": changes},
+        projection={"_id": 0, "password": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if not user_doc:
+        raise HTTPException(status_code=404, detail="User not found")
+    # The next request of this user reads the new role or inactive flag on this worker
+    invalidate_user(user_id)
+    
+    await log_audit(current_user, action, "users", {"user_id": user_id, "updates": changes}, request)
+    
+    return User(**user_doc)
+
+@api_router.put("/users/{user_id}", response_model=User)
+async def update_user(user_id: str, user_data: UserUpdate, current_user: User = Depends(get_current_user), request: Request = None):
+    changes = user_data.model_dump(exclude_none=True)
+    if not changes:
+        raise HTTPException(status_code=400, detail="Nothing to update")
+    return await _change_user(user_id, changes, "UPDATE", current_user, request)
+
+@api_router.post("/users/{user_id}/deactivate", response_model=User)
+async def deactivate_user(user_id: str, current_user: User = Depends(get_current_user), request: Request = None):
+    return await _change_user(user_id, {"is_active": False}, "DEACTIVATE", current_user, request)
+
+@api_router.get("/auth/cache/stats")
+async def get_auth_cache_stats(current_user: User = Depends(get_current_user)):
+    """Hit/miss counters of the authenticated-user and token caches"""
+    return {"users": user_cache.stats(), "tokens": token_cache.stats(), "ttl_seconds": USER_CACHE_TTL}
+
+@api_router.get("/auth/hashing/stats")
+async def get_password_hashing_stats(current_user: User = Depends(get_current_user)):
+    """Concurrency and queueing metrics of the bcrypt worker pool"""
+    return password_hasher.stats()
+
+# ==================== PATIENT ROUTES ====================
+
+@api_router.post("/patients", response_model=Patient)
+async def create_patient(patient_data: PatientCreate, current_user: User = Depends(get_current_user), request: Request = None):
+    # Generate UHID
+    uhid = await next_uhid()
+    
+    patient = Patient(
+        uhid=uhid,
+        name=patient_data.name,
+        age=patient_data.age,
+        gender=patient_data.gender,
+        phone=patient_data.phone,
+        email=patient_data.email,
+        address=patient_data.address,
+        patient_type=patient_data.patient_type,
+        created_by=current_user.id
+    )
+    
+    doc = patient.model_dump()
+    await db.patients.insert_one(doc)
+    await dashboard_counters.apply(dashboard_counters.patients_added())
+    
+    await log_audit(current_user, "CREATE", "patients", {"patient_id": patient.id, "uhid": uhid}, request)
+    
+    return patient
+
+@api_router.get("/patients", response_model=List[Patient])
+async def get_patients(response: Response, skip: int = 0, limit: int = 100, search: str = None, cursor: str = None, current_user: User = Depends(get_current_user)):
+    query = {}
+    if search:
+        query = {"$or": [
+            {"name": {"$regex": search, "$options": "i"}},
+            {"uhid": {"$regex": search, "$options": "i"}},
+            {"phone": {"$regex": search, "$options": "i"}}
+        ]}
+    
+    patients = await fetch_page(db.patients, query, "created_at", limit, response, skip=skip, cursor=cursor)
+    return patients
+
+@api_router.get("/patients/{patient_id}", response_model=Patient)
+async def get_patient(patient_id: str, current_user: User = Depends(get_current_user)):
+    patient = await db.patients.find_one({"id": patient_id}, {"_id": 0})
+    if not patient:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    return Patient(**patient)
+
+# ==================== SAMPLE ROUTES ====================
+
+@api_router.post("/samples", response_model=Sample)
+async def create_sample(sample_data: SampleCreate, current_user: User = Depends(get_current_user), request: Request = None):
+    patient = await db.patients.find_one({"id": sample_data.patient_id}, {"_id": 0})
+    if not patient:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    
+    # Generate sample ID and barcode
+    sample_id, barcode_num = await next_sample_ids()
+    
+    # Calculate TAT deadline (use maximum TAT from tests)
+    max_tat = max([test.tat_hours for test in sample_data.tests])
+    tat_deadline = datetime.now(timezone.utc) + timedelta(hours=max_tat)
+    
+    sample = Sample(
+        sample_id=sample_id,
+        barcode=barcode_num,
+        patient_id=sample_data.patient_id,
+        patient_name=patient['name'],
+        uhid=patient['uhid'],
+        tests=[test.model_dump() for test in sample_data.tests],
+        sample_type=sample_data.sample_type,
+        collected_by=current_user.id,
+        tat_deadline=tat_deadline
+    )
+    
+    doc = sample.model_dump()
+    await db.samples.insert_one(doc)
+    await dashboard_counters.apply(dashboard_counters.sample_change(None, doc))
+    publish_sample_status(doc, None)
+    tat_monitor.track(doc)
+    
+    await log_audit(current_user, "CREATE", "samples", {"sample_id": sample_id, "patient_id": sample_data.patient_id}, request)
+    
+    return sample
+
+@api_router.get("/samples", response_model=List[Sample])
+async def get_samples(response: Response, skip: int = 0, limit: int = 100, status: str = None, cursor: str = None, current_user: User = Depends(get_current_user)):
+    query = {}
+    if status:
+        query["status"] = status
+    
+    samples = await fetch_page(db.samples, query, "created_at", limit, response, skip=skip, cursor=cursor)
+    return samples
+
+@api_router.get("/samples/{sample_id}", response_model=Sample)
+async def get_sample(sample_id: str, current_user: User = Depends(get_current_user)):
+    sample = await db.samples.find_one({"id": sample_id}, {"_id": 0})
+    if not sample:
+        raise HTTPException(status_code=404, detail="Sample not found")
+    return Sample(**sample)
+
+@api_router.put("/samples/{sample_id}/status", response_model=Sample)
+async def update_sample_status(sample_id: str, status_update: SampleStatusUpdate, current_user: User = Depends(get_current_user), request: Request = None):
+    # The document as it was before this write, so the status counters move from the real previous status
+    sample = await db.samples.find_one_and_update({"id": sample_id}, {"$set": {"status": status_update.status}}, {"_id": 0})
+    if not sample:
+        raise HTTPException(status_code=404, detail="Sample not found")
+    
+    await dashboard_counters.apply(dashboard_counters.sample_change(sample, {**sample, "status": status_update.status}))
+    previous_status = sample['status']
+    sample['status'] = status_update.status
+    publish_sample_status(sample, previous_status)
+    await tat_monitor.sample_updated(sample)
+    
+    await log_audit(current_user, "UPDATE_STATUS", "samples", {"sample_id": sample_id, "new_status": status_update.status}, request)
+    
+    return Sample(**sample)
+
+@api_router.post("/samples/{sample_id}/reject", response_model=Sample)
+async def reject_sample(sample_id: str, rejection: SampleRejection, current_user: User = Depends(get_current_user), request: Request = None):
+    sample = await db.samples.find_one_and_update({"id": sample_id}, {"$set": {
+        "is_rejected": True,
+        "rejection_reason": rejection.rejection_reason,
+        "status": "rejected"
+    }}, {"_id": 0})
+    if not sample:
+        raise HTTPException(status_code=404, detail="Sample not found")
+    
+    await dashboard_counters.apply(dashboard_counters.sample_change(sample, {**sample, "status": "rejected"}))
+    
+    previous_status = sample['status']
+    sample['is_rejected'] = True
+    sample['rejection_reason'] = rejection.rejection_reason
+    sample['status'] = "rejected"
+    publish_sample_status(sample, previous_status)
+    await tat_monitor.sample_updated(sample)
+    
+    await log_audit(current_user, "REJECT", "samples", {"sample_id": sample_id, "reason": rejection.rejection_reason}, request)
+    
+    return Sample(**sample)
+
+@api_router.get("/samples/{sample_id}/barcode")
+async def get_sample_barcode(sample_id: str, barcode_format: str = "png", current_user: User = Depends(get_current_user)):
+    if barcode_format not in BARCODE_FORMATS:
+        raise HTTPException(status_code=400, detail="barcode_format must be 'png' or 'svg'")
+    sample = await db.samples.find_one({"id": sample_id}, {"_id": 0, "barcode": 1})
+    if not sample:
+        raise HTTPException(status_code=404, detail="Sample not found")
+    
+    barcode_base64 = await asyncio.to_thread(generate_barcode_base64, sample['barcode'], barcode_format)
+    return {"barcode": barcode_base64, "barcode_text": sample['barcode'], "format": barcode_format,
+            "media_type": BARCODE_FORMATS[barcode_format]}
+
+@api_router.get("/barcodes/cache/stats")
+async def get_barcode_cache_stats(current_user: User = Depends(get_current_user)):
+    """Hit/miss counters of the in-memory barcode image cache"""
+    info = render_barcode.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "maxsize": info.maxsize,
+            "disk_cache": BARCODE_CACHE_DIR}
+
+@api_router.post("/samples/labels")
+async def print_sample_labels(label_request: LabelSheetRequest, current_user: User = Depends(get_current_user),
+                              request: Request = None):
+    """One printable A4 sheet (3 x 10 labels per page) with a vector Code128 label per tube"""
+    copies = max(1, label_request.copies)
+    if len(label_request.sample_ids) * copies > LABEL_SHEET_MAX_LABELS:
+        raise HTTPException(status_code=400, detail=f"At most {LABEL_SHEET_MAX_LABELS} labels per sheet request")
+    
+    projection = {"_id": 0, "id": 1, "sample_id": 1, "barcode": 1, "patient_name": 1, "uhid": 1, "sample_type": 1}
+    samples = await db.samples.find({"id": {"$in": label_request.sample_ids}}, projection).to_list(None)
+    by_id = {sample['id']: sample for sample in samples}
+    missing = [sample_id for sample_id in label_request.sample_ids if sample_id not in by_id]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Samples not found: {', '.join(missing)}")
+    
+    labels = [by_id[sample_id] for sample_id in label_request.sample_ids for _ in range(copies)]
+    pdf_bytes = await report_renderer.render_labels(labels)
+    
+    await log_audit(current_user, "PRINT_LABELS", "samples", {"sample_ids": label_request.sample_ids, "labels": len(labels)}, request)
+    
+    return Response(content=pdf_bytes, media_type='application/pdf',
+                    headers={'Content-Disposition': 'attachment; filename="Sample_Labels.pdf"'})
+
+# ==================== TEST CONFIG ROUTES ====================
+
+@api_router.post("/tests", response_model=TestConfig)
 async def create_test_config(test_data: TestConfigCreate, current_user: User = Depends(get_current_user), request: Request = None):
     test = TestConfig(**test_data.model_dump())
     doc = test.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     await db.test_configs.insert_one(doc)
+    await test_catalog.bump()
     
     await log_audit(current_user, "CREATE", "test_configs", {"test_id": test.id, "test_name": test.test_name}, request)
     
     return test
 
 @api_router.get("/tests", response_model=List[TestConfig])
-async def get_tests(current_user: User = Depends(get_current_user)):
-    tests = await db.test_configs.find({}, {"_id": 0}).to_list(1000)
-    for t in tests:
-        if isinstance(t['created_at'], str):
-            t['created_at'] = datetime.fromisoformat(t['created_at'])
-    return tests
+async def get_tests(current_user: User = Depends(get_current_user), request: Request = None):
+    """Whole test catalog, served from memory; sends 304 when If-None-Match has the current ETag"""
+    await test_catalog.refresh()
+    headers = {"ETag": test_catalog.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match") if request else None, test_catalog.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=test_catalog.body, media_type="application/json", headers=headers)
+
+@api_router.get("/tests/catalog/stats")
+async def test_catalog_stats(current_user: User = Depends(get_current_user)):
+    return test_catalog.stats()
 
 @api_router.get("/tests/{test_id}", response_model=TestConfig)
 async def get_test(test_id: str, current_user: User = Depends(get_current_user)):
-    test = await db.test_configs.find_one({"id": test_id}, {"_id": 0})
+    await test_catalog.refresh()
+    test = test_catalog.get(test_id)
     if not test:
         raise HTTPException(status_code=404, detail="Test not found")
-    if isinstance(test['created_at'], str):
-        test['created_at'] = datetime.fromisoformat(test['created_at'])
     return TestConfig(**test)
 
 # ==================== RESULTS ROUTES ====================
 
 @api_router.post("/results", response_model=TestResult)
 async def create_result(result_data: TestResultCreate, current_user: User = Depends(get_current_user), request: Request = None):
-    # Check for critical values
-    has_critical = any(p.status == "critical" for p in result_data.parameters)
+    # Flag values against the configured reference ranges and the patient's previous values
+    result_id = str(uuid.uuid4())
+    parameters = [p.model_dump() for p in result_data.parameters]
+    await evaluate_result_parameters(result_data.patient_id, result_data.test_name, parameters)
+    delta_failures, delta_history = await delta_checker.check(result_data.patient_id, result_id, result_data.test_name, parameters)
+    has_critical = any(p['status'] == "critical" for p in parameters)
     
     result = TestResult(
+        id=result_id,
         sample_id=result_data.sample_id,
         patient_id=result_data.patient_id,
         test_name=result_data.test_name,
-        parameters=[p.model_dump() for p in result_data.parameters],
+        parameters=parameters,
         interpretation=result_data.interpretation,
         entered_by=current_user.id,
-        has_critical_values=has_critical
+        has_critical_values=has_critical,
+        has_delta_failures=delta_failures > 0
     )
     
     doc = result.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    doc['updated_at'] = doc['updated_at'].isoformat()
     await db.test_results.insert_one(doc)
+    await delta_checker.record(result_data.patient_id, delta_history)
+    await dashboard_counters.apply(dashboard_counters.result_change(None, doc))
+    if has_critical:
+        publish_critical_result(doc)
     
-    await log_audit(current_user, "CREATE", "test_results", {"result_id": result.id, "sample_id": result_data.sample_id, "has_critical": has_critical}, request)
+    await log_audit(current_user, "CREATE", "test_results", {"result_id": result.id, "sample_id": result_data.sample_id, "has_critical": has_critical, "delta_failures": delta_failures}, request)
     
     return result
 
 @api_router.get("/results", response_model=List[TestResult])
-async def get_results(sample_id: str = None, patient_id: str = None, status: str = None, current_user: User = Depends(get_current_user)):
+async def get_results(response: Response, sample_id: str = None, patient_id: str = None, status: str = None,
+                      limit: int = 1000, cursor: str = None, current_user: User = Depends(get_current_user)):
     query = {}
     if sample_id:
         query["sample_id"] = sample_id
@@ -625,12 +2408,7 @@ async def get_results(sample_id: str = None, patient_id: str = None, status: str
     if status:
         query["status"] = status
     
-    results = await db.test_results.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    for r in results:
-        if isinstance(r['created_at'], str):
-            r['created_at'] = datetime.fromisoformat(r['created_at'])
-        if isinstance(r['updated_at'], str):
-            r['updated_at'] = datetime.fromisoformat(r['updated_at'])
+    results = await fetch_page(db.test_results, query, "created_at", limit, response, cursor=cursor)
     return results
 
 @api_router.get("/results/{result_id}", response_model=TestResult)
@@ -638,94 +2416,906 @@ async def get_result(result_id: str, current_user: User = Depends(get_current_us
     result = await db.test_results.find_one({"id": result_id}, {"_id": 0})
     if not result:
         raise HTTPException(status_code=404, detail="Result not found")
-    if isinstance(result['created_at'], str):
-        result['created_at'] = datetime.fromisoformat(result['created_at'])
-    if isinstance(result['updated_at'], str):
-        result['updated_at'] = datetime.fromisoformat(result['updated_at'])
     return TestResult(**result)
 
+@api_router.post("/results/evaluate")
+async def evaluate_results_batch(items: List[TestResultCreate], current_user: User = Depends(get_current_user)):
+    """
+    Flag many results against the reference ranges without saving them (analyzer uploads, previews).
+    Patients are loaded with one $in query and all values are classified in one pass.
+    """
+    patient_ids = list({item.patient_id for item in items})
+    patients = await db.patients.find({"id": {"$in": patient_ids}}, {"_id": 0, "id": 1, "age": 1, "gender": 1}).to_list(None)
+    await test_catalog.refresh()
+    
+    results = [{"patient_id": item.patient_id, "sample_id": item.sample_id, "test_name": item.test_name,
+                "parameters": [p.model_dump() for p in item.parameters]} for item in items]
+    evaluated = evaluate_results(results, {p['id']: p for p in patients})
+    for result in results:
+        result["has_critical_values"] = any(p['status'] == "critical" for p in result['parameters'])
+    
+    return {"evaluated": evaluated, "results": results}
+
+@api_router.get("/results/delta/stats")
+async def delta_check_stats(current_user: User = Depends(get_current_user)):
+    return delta_checker.stats()
+
 @api_router.put("/results/{result_id}", response_model=TestResult)
 async def update_result(result_id: str, update_data: TestResultUpdate, current_user: User = Depends(get_current_user), request: Request = None):
     result = await db.test_results.find_one({"id": result_id}, {"_id": 0})
     if not result:
         raise HTTPException(status_code=404, detail="Result not found")
     
-    update_fields = {"updated_at": datetime.now(timezone.utc).isoformat()}
+    update_fields = {"updated_at": datetime.now(timezone.utc)}
+    delta_history = {}
     
     if update_data.parameters:
-        update_fields["parameters"] = [p.model_dump() for p in update_data.parameters]
-        has_critical = any(p.status == "critical" for p in update_data.parameters)
-        update_fields["has_critical_values"] = has_critical
+        parameters = [p.model_dump() for p in update_data.parameters]
+        await evaluate_result_parameters(result['patient_id'], result['test_name'], parameters)
+        delta_failures, delta_history = await delta_checker.check(result['patient_id'], result_id, result['test_name'], parameters)
+        update_fields["parameters"] = parameters
+        update_fields["has_critical_values"] = any(p['status'] == "critical" for p in parameters)
+        update_fields["has_delta_failures"] = delta_failures > 0
+        update_fields["autoverification"] = None  # edited values are checked again
     
     if update_data.status:
         update_fields["status"] = update_data.status
         if update_data.status == "approved":
             update_fields["approved_by"] = current_user.id
+            update_fields["approved_at"] = update_fields["updated_at"]
         elif update_data.status == "under_review":
             update_fields["reviewed_by"] = current_user.id
     
     if update_data.interpretation is not None:
         update_fields["interpretation"] = update_data.interpretation
     
-    await db.test_results.update_one({"id": result_id}, {"$set": update_fields})
+    before = await db.test_results.find_one_and_update(
+        {"id": result_id}, {"$set": update_fields}, {"_id": 0, "status": 1, "has_critical_values": 1}
+    )
+    if before:
+        await delta_checker.record(result['patient_id'], delta_history)
+        await dashboard_counters.apply(dashboard_counters.result_change(before, {**before, **update_fields}))
+    report_cache.invalidate_result(result_id)
     
     await log_audit(current_user, "UPDATE", "test_results", {"result_id": result_id, "updates": list(update_fields.keys())}, request)
     
     result.update(update_fields)
-    if isinstance(result['created_at'], str):
-        result['created_at'] = datetime.fromisoformat(result['created_at'])
-    if isinstance(result['updated_at'], str):
-        result['updated_at'] = datetime.fromisoformat(result['updated_at'])
+    if update_fields.get('has_critical_values') and not (before or {}).get('has_critical_values'):
+        publish_critical_result(result)
     return TestResult(**result)
 
+# ==================== QC ENGINE ====================
+
+WESTGARD_RULES = ("1-2s", "1-3s", "2-2s", "R-4s", "4-1s", "10x")
+WESTGARD_REJECTION_RULES = ("1-3s", "2-2s", "R-4s", "4-1s", "10x")  # 1-2s only warns
+QC_ACCEPTED_STATUSES = ["pass", "warning"]
+QC_STREAKS = ("1s_high", "1s_low", "mean_high", "mean_low")
+
+def qc_series_key(test_name: str, parameter: str, level: str, lot_number: str) -> str:
+    return "|".join((test_name, parameter, level, lot_number))
+
+def advance_streaks(streaks: Dict[str, int], z: Optional[float]) -> Dict[str, int]:
+    """Consecutive runs beyond +/-1 SD and on each side of the mean, including z (None breaks every streak)"""
+    if z is None:
+        return {name: 0 for name in QC_STREAKS}
+    return {
+        "1s_high": streaks.get("1s_high", 0) + 1 if z > 1 else 0,
+        "1s_low": streaks.get("1s_low", 0) + 1 if z < -1 else 0,
+        "mean_high": streaks.get("mean_high", 0) + 1 if z > 0 else 0,
+        "mean_low": streaks.get("mean_low", 0) + 1 if z < 0 else 0,
+    }
+
+def westgard_check(z: float, previous_z: Optional[float], streaks: Dict[str, int]) -> List[str]:
+    """Westgard rules violated by z, from the previous z-score and the streaks that include z"""
+    violated = []
+    if abs(z) > 2:
+        violated.append("1-2s")
+    if abs(z) > 3:
+        violated.append("1-3s")
+    if previous_z is not None:
+        if (z > 2 and previous_z > 2) or (z < -2 and previous_z < -2):
+            violated.append("2-2s")
+        if (z > 2 and previous_z < -2) or (z < -2 and previous_z > 2):
+            violated.append("R-4s")
+    if streaks["1s_high"] >= 4 or streaks["1s_low"] >= 4:
+        violated.append("4-1s")
+    if streaks["mean_high"] >= 10 or streaks["mean_low"] >= 10:
+        violated.append("10x")
+    return violated
+
+def qc_status_for(violated: List[str]) -> str:
+    if any(rule in WESTGARD_REJECTION_RULES for rule in violated):
+        return "fail"
+    return "warning" if violated else "pass"
+
+def qc_tolerance_status(measured: float, target: float) -> str:
+    """Fallback before a lot has enough runs for an SD: the old fixed tolerance around the target"""
+    deviation_percent = (measured - target) / target * 100 if target != 0 else 0
+    return "pass" if abs(deviation_percent) <= QC_TOLERANCE_PERCENT else "fail"
+
+def _trailing_run(mask: np.ndarray) -> int:
+    breaks = np.flatnonzero(~mask)
+    return int(len(mask) - 1 - breaks[-1]) if len(breaks) else len(mask)
+
+class QCEngine:
+    """
+    Westgard multi-rule QC per series (test, parameter, level, lot). Each series has a state
+    document in qc_series holding the running mean/M2 of accepted runs (Welford), the last
+    z-score and four streak counters, so a new entry is judged in O(1) without reading history.
+    z uses the entry's target_value/target_sd when an SD is given, otherwise the lot's own
+    mean/SD once it has QC_MIN_RUNS accepted runs; before that the old tolerance rule applies.
+    Concurrent entries on one series are serialised with a version number (retry on conflict).
+    reevaluate() re-judges a whole lot in date order with the same accepted-only statistics:
+    vectorised with numpy when every run has a target SD (no run depends on an earlier
+    verdict), otherwise by replaying the runs through the O(1) step.
+    """
+
+    def __init__(self, entries, series, min_runs: int = QC_MIN_RUNS):
+        self.entries = entries
+        self.series = series
+        self.min_runs = max(2, min_runs)
+        self.recorded = 0
+        self.conflicts = 0
+        self.reevaluated = 0
+
+    def _z(self, measured: float, target: float, target_sd: Optional[float], state: Dict[str, Any]) -> Optional[float]:
+        if target_sd:
+            return (measured - target) / target_sd
+        if state.get('n', 0) >= self.min_runs:
+            sd = math.sqrt(state['m2'] / (state['n'] - 1))
+            if sd > 0:
+                return (measured - state['mean']) / sd
+        return None
+
+    def _advance(self, state: Dict[str, Any], measured: float, target: float,
+                 target_sd: Optional[float]) -> Tuple[Optional[float], List[str], str, Dict[str, Any]]:
+        """Judge one run against a series state: returns z, violated rules, status and the next state"""
+        z = self._z(measured, target, target_sd, state)
+        streaks = advance_streaks(state.get('streaks', {}), z)
+        if z is None:
+            violated, status = [], qc_tolerance_status(measured, target)
+        else:
+            violated = westgard_check(z, state.get('last_z'), streaks)
+            status = qc_status_for(violated)
+        
+        n, mean, m2 = state.get('n', 0), state.get('mean', 0.0), state.get('m2', 0.0)
+        if status != "fail":
+            # Welford update over accepted runs only
+            n += 1
+            delta = measured - mean
+            mean += delta / n
+            m2 += delta * (measured - mean)
+        return z, violated, status, {
+            "n": n, "mean": mean, "m2": m2, "last_z": z, "streaks": streaks,
+            "runs": state.get('runs', 0) + 1, "rejected": state.get('rejected', 0) + (status == "fail"),
+        }
+
+    async def record(self, qc_data: QCEntryCreate, entered_by: str) -> QCEntry:
+        """
+        Judge a new run against its series, store the entry, then advance the series state.
+        The entry is written first: if the state write fails the series lags its entries
+        (reevaluate() rebuilds it) instead of counting a run that was never stored.
+        """
+        key = qc_series_key(qc_data.test_name, qc_data.parameter, qc_data.level, qc_data.lot_number)
+        qc = None
+        while True:
+            state = await self.series.find_one({"_id": key}) or {}
+            version = state.get('version', 0)
+            z, violated, status, statistics = self._advance(state, qc_data.measured_value, qc_data.target_value, qc_data.target_sd)
+            z_score = round(z, 3) if z is not None else None
+            if qc is None:
+                qc = QCEntry(
+                    test_name=qc_data.test_name,
+                    qc_type=qc_data.qc_type,
+                    level=qc_data.level,
+                    lot_number=qc_data.lot_number,
+                    parameter=qc_data.parameter,
+                    target_value=qc_data.target_value,
+                    target_sd=qc_data.target_sd,
+                    measured_value=qc_data.measured_value,
+                    deviation=qc_data.measured_value - qc_data.target_value,
+                    z_score=z_score,
+                    rules_violated=violated,
+                    status=status,
+                    entered_by=entered_by
+                )
+                await self.entries.insert_one(qc.model_dump())
+            elif (qc.status, qc.z_score, qc.rules_violated) != (status, z_score, violated):
+                # Another run reached the series first; re-judged against the state it now follows
+                qc.status, qc.z_score, qc.rules_violated = status, z_score, violated
+                await self.entries.update_one({"id": qc.id}, {"$set": {"status": status, "z_score": z_score, "rules_violated": violated}})
+            
+            new_state = {
+                "test_name": qc_data.test_name, "parameter": qc_data.parameter,
+                "level": qc_data.level, "lot_number": qc_data.lot_number,
+                **statistics, "updated_at": datetime.now(timezone.utc), "version": version + 1,
+            }
+            try:
+                written = await self.series.update_one({"_id": key, "version": version}, {"$set": new_state}, upsert=version == 0)
+            except DuplicateKeyError:
+                written = None  # another entry created the series first
+            if written is not None and (written.matched_count or written.upserted_id is not None):
+                self.recorded += 1
+                return qc
+            self.conflicts += 1
+
+    def _replay(self, entries: List[Dict[str, Any]]) -> Tuple[list, Dict[str, Any]]:
+        """Verdicts of a lot's runs judged one after another from an empty series, and the final state"""
+        state: Dict[str, Any] = {}
+        verdicts = []
+        for entry in entries:
+            z, violated, status, state = self._advance(state, entry['measured_value'], entry['target_value'], entry.get('target_sd'))
+            verdicts.append((round(z, 3) if z is not None else None, violated, status))
+        return verdicts, state
+
+    def _judge_vectorised(self, entries: List[Dict[str, Any]]) -> Tuple[list, Dict[str, Any]]:
+        """Same verdicts as _replay for a lot whose runs all have a target SD, computed with numpy"""
+        count = len(entries)
+        measured = np.array([e['measured_value'] for e in entries], dtype=float)
+        target = np.array([e['target_value'] for e in entries], dtype=float)
+        target_sd = np.array([e['target_sd'] for e in entries], dtype=float)
+        z = (measured - target) / target_sd
+        previous = np.concatenate(([np.nan], z[:-1]))
+        
+        def run_of(mask: np.ndarray, length: int) -> np.ndarray:
+            return np.convolve(mask.astype(np.int64), np.ones(length, dtype=np.int64))[:count] >= length
+        
+        violations = np.column_stack([
+            np.abs(z) > 2,
+            np.abs(z) > 3,
+            ((z > 2) & (previous > 2)) | ((z < -2) & (previous < -2)),
+            ((z > 2) & (previous < -2)) | ((z < -2) & (previous > 2)),
+            run_of(z > 1, 4) | run_of(z < -1, 4),
+            run_of(z > 0, 10) | run_of(z < 0, 10),
+        ])
+        statuses = np.where(violations[:, 1:].any(axis=1), "fail", np.where(violations[:, 0], "warning", "pass"))
+        
+        accepted = measured[statuses != "fail"]
+        state = {
+            "n": int(len(accepted)),
+            "mean": float(accepted.mean()) if len(accepted) else 0.0,
+            "m2": float(((accepted - accepted.mean()) ** 2).sum()) if len(accepted) else 0.0,
+            "last_z": float(z[-1]),
+            "streaks": {name: _trailing_run(mask) for name, mask in zip(QC_STREAKS, (z > 1, z < -1, z > 0, z < 0))},
+            "runs": count,
+            "rejected": int((statuses == "fail").sum()),
+        }
+        verdicts = [(round(float(z[index]), 3), [rule for rule, hit in zip(WESTGARD_RULES, violations[index]) if hit], str(statuses[index]))
+                    for index in range(count)]
+        return verdicts, state
+
+    async def reevaluate(self, test_name: str, parameter: str, level: str, lot_number: str) -> Optional[Dict[str, Any]]:
+        """Re-judge every run of a lot in date order, rewrite changed entries and rebuild the series state"""
+        started = time.perf_counter()
+        query = {"test_name": test_name, "parameter": parameter, "level": level, "lot_number": lot_number}
+        entries = await self.entries.find(
+            query, {"_id": 0, "id": 1, "measured_value": 1, "target_value": 1, "target_sd": 1, "status": 1, "z_score": 1, "rules_violated": 1}
+        ).sort("date", 1).to_list(None)
+        if not entries:
+            return None
+        
+        if all(entry.get('target_sd') for entry in entries):
+            verdicts, state = self._judge_vectorised(entries)
+        else:
+            verdicts, state = self._replay(entries)
+        
+        operations = []
+        for entry, (z_score, violated, status) in zip(entries, verdicts):
+            if (entry.get('status'), entry.get('z_score'), entry.get('rules_violated') or []) != (status, z_score, violated):
+                operations.append(UpdateOne({"id": entry['id']}, {"$set": {"status": status, "z_score": z_score, "rules_violated": violated}}))
+        if operations:
+            await self.entries.bulk_write(operations, ordered=False)
+        
+        await self.series.update_one({"_id": qc_series_key(test_name, parameter, level, lot_number)},
+                                     {"$set": {**query, **state, "updated_at": datetime.now(timezone.utc)}, "$inc": {"version": 1}},
+                                     upsert=True)
+        self.reevaluated += len(entries)
+        statistics = QCEngine.describe({**query, **state})
+        return {
+            "entries": len(entries),
+            "changed": len(operations),
+            "status_counts": {status: sum(1 for verdict in verdicts if verdict[2] == status) for status in ("pass", "warning", "fail")},
+            "mean": statistics['mean'],
+            "sd": statistics['sd'],
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+
+    @staticmethod
+    def describe(state: Dict[str, Any]) -> Dict[str, Any]:
+        """Rolling mean/SD/CV of a series state document"""
+        n = state.get('n', 0)
+        sd = math.sqrt(state['m2'] / (n - 1)) if n > 1 else None
+        mean = state.get('mean') if n else None
+        return {
+            "test_name": state['test_name'],
+            "parameter": state['parameter'],
+            "level": state['level'],
+            "lot_number": state['lot_number'],
+            "n": n,
+            "mean": round(mean, 4) if mean is not None else None,
+            "sd": round(sd, 4) if sd is not None else None,
+            "cv_percent": round(sd / mean * 100, 2) if sd is not None and mean else None,
+            "runs": state.get('runs', 0),
+            "rejected": state.get('rejected', 0),
+            "last_z": round(state['last_z'], 3) if state.get('last_z') is not None else None,
+            "streaks": state.get('streaks', {}),
+            "updated_at": state.get('updated_at'),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "min_runs": self.min_runs,
+            "recorded": self.recorded,
+            "version_conflicts": self.conflicts,
+            "reevaluated": self.reevaluated,
+        }
+
+qc_engine = QCEngine(db.qc_entries, db.qc_series)
+
 # ==================== QC ROUTES ====================
 
 @api_router.post("/qc", response_model=QCEntry)
 async def create_qc_entry(qc_data: QCEntryCreate, current_user: User = Depends(get_current_user), request: Request = None):
-    deviation = qc_data.measured_value - qc_data.target_value
-    deviation_percent = (deviation / qc_data.target_value) * 100 if qc_data.target_value != 0 else 0
-    
-    # Simple QC pass/fail logic (within ±10%)
-    status = "pass" if abs(deviation_percent) <= 10 else "fail"
-    
-    qc = QCEntry(
-        test_name=qc_data.test_name,
-        qc_type=qc_data.qc_type,
-        level=qc_data.level,
-        lot_number=qc_data.lot_number,
-        parameter=qc_data.parameter,
-        target_value=qc_data.target_value,
-        measured_value=qc_data.measured_value,
-        deviation=deviation,
-        status=status,
-        entered_by=current_user.id
-    )
+    # Westgard multi-rule check against the series' stored run state; the engine stores the entry
+    qc = await qc_engine.record(qc_data, current_user.id)
+    status = qc.status
     
-    doc = qc.model_dump()
-    doc['date'] = doc['date'].isoformat()
-    doc['created_at'] = doc['created_at'].isoformat()
-    await db.qc_entries.insert_one(doc)
+    await log_audit(current_user, "CREATE", "qc_entries", {"qc_id": qc.id, "test_name": qc.test_name, "status": status, "rules_violated": qc.rules_violated}, request)
     
-    await log_audit(current_user, "CREATE", "qc_entries", {"qc_id": qc.id, "test_name": qc.test_name, "status": status}, request)
+    # Results held only because QC was missing or failed are checked again once it passes
+    if status in QC_ACCEPTED_STATUSES:
+        await autoverifier.release_qc_holds(qc.test_name)
     
     return qc
 
 @api_router.get("/qc", response_model=List[QCEntry])
-async def get_qc_entries(test_name: str = None, qc_type: str = None, current_user: User = Depends(get_current_user)):
+async def get_qc_entries(test_name: str = None, qc_type: str = None, parameter: str = None, level: str = None,
+                         lot_number: str = None, limit: int = 100, current_user: User = Depends(get_current_user)):
     query = {}
     if test_name:
         query["test_name"] = test_name
     if qc_type:
         query["qc_type"] = qc_type
+    if parameter:
+        query["parameter"] = parameter
+    if level:
+        query["level"] = level
+    if lot_number:
+        query["lot_number"] = lot_number
     
-    entries = await db.qc_entries.find(query, {"_id": 0}).sort("date", -1).limit(100).to_list(100)
-    for e in entries:
-        if isinstance(e['date'], str):
-            e['date'] = datetime.fromisoformat(e['date'])
-        if isinstance(e['created_at'], str):
-            e['created_at'] = datetime.fromisoformat(e['created_at'])
+    entries = await db.qc_entries.find(query, {"_id": 0}).sort("date", -1).limit(limit).to_list(limit)
     return entries
 
+@api_router.get("/qc/series")
+async def get_qc_series(test_name: str = None, current_user: User = Depends(get_current_user)):
+    """Rolling mean, SD and CV per (test, parameter, level, lot) from the stored run state"""
+    query = {"test_name": test_name} if test_name else {}
+    states = await db.qc_series.find(query).to_list(None)
+    return [QCEngine.describe(state) for state in states]
+
+@api_router.post("/qc/series/reevaluate")
+async def reevaluate_qc_series(test_name: str, parameter: str, level: str, lot_number: str,
+                               current_user: User = Depends(get_current_user), request: Request = None):
+    """Re-judge every run of a lot in date order, e.g. after correcting or deleting entries"""
+    outcome = await qc_engine.reevaluate(test_name, parameter, level, lot_number)
+    if outcome is None:
+        raise HTTPException(status_code=404, detail="No QC entries for this lot")
+    await log_audit(current_user, "REEVALUATE", "qc_entries", {"test_name": test_name, "parameter": parameter, "level": level,
+                                                                "lot_number": lot_number, "changed": outcome['changed']}, request)
+    return outcome
+
+@api_router.get("/qc/engine/stats")
+async def qc_engine_stats(current_user: User = Depends(get_current_user)):
+    return qc_engine.stats()
+
+# ==================== AUTOVERIFICATION ====================
+
+# Rules are a JSON object of AutoVerificationRules keyword arguments; without a file the defaults apply
+AUTOVERIFY_RULES_FILE = os.environ.get('AUTOVERIFY_RULES_FILE')
+AUTOVERIFY_FROM_STATUSES = ["draft", "under_review"]
+
+AUTOVERIFY_USER = User.model_construct(id="autoverification", email="autoverification@localhost", name="Autoverification",
+                                       role="system", is_active=True, created_at=datetime.now(timezone.utc))
+
+class AutoVerificationRules:
+    """
+    Which results may be approved without a person. A result is held if any rule fails;
+    rules are checked in RULE_ORDER and every failing rule is reported.
+    """
+
+    RULE_ORDER = ("no_parameters", "excluded_test", "critical", "delta", "status", "non_numeric", "qc")
+
+    def __init__(self, allowed_statuses: List[str] = None, excluded_tests: List[str] = None,
+                 allow_delta_failures: bool = False, require_numeric: bool = True,
+                 require_qc: bool = True, qc_max_age_hours: float = 24, version: str = "1"):
+        self.allowed_statuses = list(allowed_statuses or ["normal"])
+        self.excluded_tests = {name.strip().lower() for name in excluded_tests or []}
+        self.allow_delta_failures = allow_delta_failures
+        self.require_numeric = require_numeric
+        self.require_qc = require_qc
+        self.qc_max_age = timedelta(hours=qc_max_age_hours)
+        self.version = version
+
+    @classmethod
+    def load(cls) -> "AutoVerificationRules":
+        if not AUTOVERIFY_RULES_FILE:
+            return cls()
+        with open(AUTOVERIFY_RULES_FILE) as f:
+            return cls(**json.load(f))
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "allowed_statuses": self.allowed_statuses,
+            "excluded_tests": sorted(self.excluded_tests),
+            "allow_delta_failures": self.allow_delta_failures,
+            "require_numeric": self.require_numeric,
+            "require_qc": self.require_qc,
+            "qc_max_age_hours": self.qc_max_age.total_seconds() / 3600,
+        }
+
+def result_test_names(result: Dict[str, Any]) -> List[str]:
+    """A result's test_name may list several tests ('CBC, LFT')"""
+    return [name.strip() for name in result['test_name'].split(",") if name.strip()]
+
+class AutoVerifier:
+    """
+    Sweeps draft and under-review results in batches. Each batch costs one query for
+    the results and one aggregation for QC. Rules run as numpy operations over all
+    parameters of the batch. Passing results are approved with one update_many.
+    Held results are marked with their reasons and left for a person. Every decision
+    is audit-logged. update_result clears the mark, so edited results are checked again;
+    so does an accepted QC run for results held only for QC, and a rules version change.
+    """
+
+    def __init__(self, collection, qc_collection, rules: AutoVerificationRules = None,
+                 batch_size: int = AUTOVERIFY_BATCH_SIZE, interval: float = AUTOVERIFY_INTERVAL):
+        self.collection = collection
+        self.qc_collection = qc_collection
+        self.rules = rules or AutoVerificationRules.load()
+        self.batch_size = max(1, batch_size)
+        self.interval = interval
+        self._task = None
+        self._lock = asyncio.Lock()
+        self.evaluated = 0
+        self.approved = 0
+        self.held = 0
+        self.held_by_rule = {rule: 0 for rule in AutoVerificationRules.RULE_ORDER}
+        self.released = 0
+        self.last_sweep_ms = 0.0
+
+    async def qc_status(self, test_names: List[str], now: datetime = None) -> Dict[str, bool]:
+        """True per test whose most recent QC run of every level/parameter inside the window passed"""
+        now = now or datetime.now(timezone.utc)
+        pipeline = [
+            {"$match": {"test_name": {"$in": test_names}, "date": {"$gte": now - self.rules.qc_max_age}}},
+            {"$sort": {"date": -1}},
+            {"$group": {"_id": {"test_name": "$test_name", "level": "$level", "parameter": "$parameter"},
+                        "status": {"$first": "$status"}}},
+        ]
+        status = {}
+        async for row in self.qc_collection.aggregate(pipeline):
+            name = row['_id']['test_name']
+            status[name] = status.get(name, True) and row['status'] in QC_ACCEPTED_STATUSES
+        return status
+
+    async def _release(self, query: Dict[str, Any]) -> int:
+        outcome = await self.collection.update_many(
+            {"status": {"$in": AUTOVERIFY_FROM_STATUSES}, "autoverification.decision": "held", **query},
+            {"$set": {"autoverification": None}}
+        )
+        self.released += outcome.modified_count
+        return outcome.modified_count
+
+    async def release_qc_holds(self, test_name: str) -> int:
+        """After a QC run of test_name: results held only for QC are checked again once its QC passes"""
+        if not self.rules.require_qc or not (await self.qc_status([test_name])).get(test_name):
+            return 0
+        return await self._release({"autoverification.reasons": ["qc"],
+                                    "test_name": {"$regex": rf"(^|,)\s*{re.escape(test_name)}\s*(,|$)"}})
+
+    async def release_stale_holds(self) -> int:
+        """Results held under another rules version are checked again under the current one"""
+        return await self._release({"autoverification.rules_version": {"$ne": self.rules.version}})
+
+    def evaluate(self, results: List[Dict[str, Any]], qc_ok: Dict[str, bool]) -> Tuple[np.ndarray, List[List[str]]]:
+        """
+        Decide a batch: returns a boolean array (True = approve) and the failing rules per result.
+        Parameters of the whole batch are flattened into arrays and reduced per result with bincount.
+        """
+        rules = self.rules
+        count = len(results)
+        owners, statuses, numeric, delta = [], [], [], []
+        for index, result in enumerate(results):
+            for parameter in result['parameters']:
+                owners.append(index)
+                statuses.append(parameter.get('status'))
+                numeric.append(parse_result_value(parameter.get('value')) is not None)
+                delta.append(bool(parameter.get('delta_flag')))
+        owners = np.array(owners, dtype=np.int64)
+        statuses = np.array(statuses, dtype=object)
+        
+        def per_result(mask: np.ndarray) -> np.ndarray:
+            return np.bincount(owners[mask], minlength=count) > 0
+        
+        names = [result_test_names(result) for result in results]
+        failures = np.zeros((count, len(AutoVerificationRules.RULE_ORDER)), dtype=bool)
+        failures[:, 0] = np.bincount(owners, minlength=count) == 0
+        failures[:, 1] = [any(name.lower() in rules.excluded_tests for name in tests) for tests in names]
+        failures[:, 2] = per_result(statuses == "critical") | [bool(r.get('has_critical_values')) for r in results]
+        if not rules.allow_delta_failures:
+            failures[:, 3] = per_result(np.array(delta, dtype=bool)) | [bool(r.get('has_delta_failures')) for r in results]
+        failures[:, 4] = per_result(~np.isin(statuses, rules.allowed_statuses))
+        if rules.require_numeric:
+            failures[:, 5] = per_result(~np.array(numeric, dtype=bool))
+        if rules.require_qc:
+            failures[:, 6] = [not tests or not all(qc_ok.get(name, False) for name in tests) for tests in names]
+        
+        passed = ~failures.any(axis=1)
+        reasons = [[AutoVerificationRules.RULE_ORDER[rule] for rule in np.flatnonzero(row)] for row in failures]
+        return passed, reasons
+
+    async def sweep(self, limit: int = None, dry_run: bool = False) -> Dict[str, Any]:
+        """Evaluate up to `limit` unchecked results, oldest first"""
+        async with self._lock:
+            started = time.perf_counter()
+            now = datetime.now(timezone.utc)
+            query = {"status": {"$in": AUTOVERIFY_FROM_STATUSES}, "autoverification": None}
+            results = await self.collection.find(query, {"_id": 0}).sort([("created_at", 1), ("id", 1)]).limit(limit or self.batch_size).to_list(None)
+            if not results:
+                return {"evaluated": 0, "approved": [], "held": []}
+            
+            names = sorted({name for result in results for name in result_test_names(result)})
+            qc_ok = await self.qc_status(names, now) if self.rules.require_qc else {}
+            passed, reasons = self.evaluate(results, qc_ok)
+            approved = [result['id'] for result, ok in zip(results, passed) if ok]
+            held = [{"result_id": result['id'], "reasons": why} for result, ok, why in zip(results, passed, reasons) if not ok]
+            if dry_run:
+                return {"evaluated": len(results), "approved": approved, "held": held, "dry_run": True}
+            
+            if approved:
+                await self.collection.update_many(
+                    {"id": {"$in": approved}, **query},
+                    {"$set": {"status": "approved", "approved_by": AUTOVERIFY_USER.id, "approved_at": now, "updated_at": now,
+                              "autoverification": {"decision": "approved", "reasons": [], "rules_version": self.rules.version, "at": now}}}
+                )
+                for result_id in approved:
+                    report_cache.invalidate_result(result_id)
+                # A result edited by someone else mid-sweep is not updated above; reconcile() corrects that case
+                await dashboard_counters.apply(*(
+                    dashboard_counters.result_change(result, {**result, "status": "approved"})
+                    for result, ok in zip(results, passed) if ok
+                ))
+            if held:
+                await self.collection.bulk_write([
+                    UpdateOne({"id": item['result_id'], **query},
+                              {"$set": {"autoverification": {"decision": "held", "reasons": item['reasons'],
+                                                             "rules_version": self.rules.version, "at": now}}})
+                    for item in held
+                ], ordered=False)
+            
+            for result, ok, why in zip(results, passed, reasons):
+                await log_audit(AUTOVERIFY_USER, "AUTOVERIFY", "test_results", {
+                    "result_id": result['id'],
+                    "sample_id": result['sample_id'],
+                    "decision": "approved" if ok else "held",
+                    "reasons": why,
+                    "rules_version": self.rules.version
+                })
+            
+            self.evaluated += len(results)
+            self.approved += len(approved)
+            self.held += len(held)
+            for item in held:
+                for rule in item['reasons']:
+                    self.held_by_rule[rule] += 1
+            self.last_sweep_ms = (time.perf_counter() - started) * 1000
+            return {"evaluated": len(results), "approved": approved, "held": held}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if self.interval > 0 and not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.running:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def _run(self):
+        try:
+            await self.release_stale_holds()
+        except Exception:
+            logger.exception("Releasing autoverification holds of older rules failed")
+        while True:
+            try:
+                # Keep sweeping while full batches come back, then wait for new results
+                while (await self.sweep())['evaluated'] >= self.batch_size:
+                    pass
+            except Exception:
+                logger.exception("Autoverification sweep failed")
+            await asyncio.sleep(self.interval)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "interval": self.interval,
+            "batch_size": self.batch_size,
+            "rules": self.rules.describe(),
+            "evaluated": self.evaluated,
+            "approved": self.approved,
+            "held": self.held,
+            "held_by_rule": self.held_by_rule,
+            "released": self.released,
+            "last_sweep_ms": round(self.last_sweep_ms, 2),
+        }
+
+autoverifier = AutoVerifier(db.test_results, db.qc_entries)
+
+@api_router.post("/results/autoverify")
+async def run_autoverification(limit: int = None, dry_run: bool = False, current_user: User = Depends(get_current_user),
+                               request: Request = None):
+    """Run one autoverification sweep now; dry_run reports the decisions without applying them"""
+    outcome = await autoverifier.sweep(limit, dry_run)
+    await log_audit(current_user, "AUTOVERIFY_SWEEP", "test_results", {"evaluated": outcome['evaluated'], "approved": len(outcome['approved']), "dry_run": dry_run}, request)
+    return outcome
+
+@api_router.get("/results/autoverify/stats")
+async def autoverification_stats(current_user: User = Depends(get_current_user)):
+    return autoverifier.stats()
+
+# ==================== TAT ANALYTICS ====================
+
+TAT_ROLLUP_STATUSES = ["approved", "finalized"]
+TAT_GROUP_BY = ("none", "test", "sample_type", "day", "month")
+
+def tat_bucket(minutes: float) -> int:
+    """Histogram bucket of a turnaround time: 0 below a minute, then buckets TAT_HISTOGRAM_GROWTH apart"""
+    if minutes < 1:
+        return 0
+    return min(TAT_HISTOGRAM_BUCKETS - 1, 1 + int(math.log(minutes) / math.log(TAT_HISTOGRAM_GROWTH)))
+
+def tat_bucket_minutes(bucket: np.ndarray) -> np.ndarray:
+    """Representative value (geometric middle) of each bucket, in minutes"""
+    return np.where(bucket == 0, 0.5, TAT_HISTOGRAM_GROWTH ** (bucket - 0.5))
+
+def rollup_periods(start: datetime, end: datetime, use_months: bool = True) -> Tuple[List[str], List[str]]:
+    """Month keys for months fully inside [start, end] and day keys for the rest"""
+    months, days = [], []
+    day = start
+    while day <= end:
+        month_end = (day.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+        if use_months and day.day == 1 and month_end <= end:
+            months.append(day.strftime("%Y-%m"))
+            day = month_end + timedelta(days=1)
+        else:
+            days.append(day.strftime("%Y-%m-%d"))
+            day += timedelta(days=1)
+    return months, days
+
+class TATRollup:
+    """
+    Incremental TAT analytics. Each run takes approved results not yet rolled up and adds
+    their collection-to-approval time to histograms per (day, test, sample type) and per
+    (month, test, sample type) in tat_rollups; results are then marked so they are counted
+    once. Histograms are sparse log-spaced buckets ({bucket: count}, ~2.5% error), so
+    reports merge a few hundred small documents - whole months for a year-long range -
+    and never read samples or results.
+    """
+
+    def __init__(self, results, samples, rollups, interval: float = TAT_ROLLUP_INTERVAL,
+                 batch_size: int = TAT_ROLLUP_BATCH_SIZE):
+        self.results = results
+        self.samples = samples
+        self.rollups = rollups
+        self.interval = interval
+        self.batch_size = max(1, batch_size)
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.rolled_up = 0
+        self.runs = 0
+        self.last_run_ms = 0.0
+        self.last_report_ms = 0.0
+
+    async def run_once(self) -> int:
+        """Roll up one batch of newly approved results; returns how many were processed"""
+        async with self._lock:
+            started = time.perf_counter()
+            results = await self.results.find(
+                {"status": {"$in": TAT_ROLLUP_STATUSES}, "tat_rolled_up": None},
+                {"_id": 0, "id": 1, "sample_id": 1, "test_name": 1, "approved_at": 1, "updated_at": 1}
+            ).limit(self.batch_size).to_list(None)
+            if not results:
+                return 0
+            
+            samples = await self.samples.find(
+                {"id": {"$in": list({result['sample_id'] for result in results})}},
+                {"_id": 0, "id": 1, "sample_type": 1, "collection_date": 1, "created_at": 1, "tat_deadline": 1}
+            ).to_list(None)
+            samples = {sample['id']: sample for sample in samples}
+            
+            groups: Dict[str, Dict[str, Any]] = {}
+            for result in results:
+                sample = samples.get(result['sample_id'])
+                if not sample:
+                    continue
+                approved = parse_datetime(result.get('approved_at') or result['updated_at'])
+                collected = parse_datetime(sample.get('collection_date') or sample['created_at'])
+                minutes = max(0.0, (approved - collected).total_seconds() / 60)
+                breached = approved > parse_datetime(sample['tat_deadline'])
+                bucket = str(tat_bucket(minutes))
+                for test_name in result_test_names(result):
+                    for period, key in (("day", approved.strftime("%Y-%m-%d")), ("month", approved.strftime("%Y-%m"))):
+                        doc_id = f"{period}|{key}|{test_name}|{sample.get('sample_type')}"
+                        group = groups.setdefault(doc_id, {
+                            "fields": {"period": period, "key": key, "test_name": test_name, "sample_type": sample.get('sample_type')},
+                            "inc": defaultdict(int), "max": 0.0
+                        })
+                        group['inc']["count"] += 1
+                        group['inc']["breaches"] += int(breached)
+                        group['inc']["sum_minutes"] += minutes
+                        group['inc'][f"buckets.{bucket}"] += 1
+                        group['max'] = max(group['max'], minutes)
+            
+            # Counts are added before results are marked: a crash in between counts a batch twice rather than never
+            if groups:
+                await self.rollups.bulk_write([
+                    UpdateOne({"_id": doc_id}, {"$inc": dict(group['inc']), "$max": {"max_minutes": round(group['max'], 1)},
+                                                "$setOnInsert": group['fields']}, upsert=True)
+                    for doc_id, group in groups.items()
+                ], ordered=False)
+            await self.results.update_many({"id": {"$in": [result['id'] for result in results]}}, {"$set": {"tat_rolled_up": True}})
+            
+            self.rolled_up += len(results)
+            self.runs += 1
+            self.last_run_ms = (time.perf_counter() - started) * 1000
+            return len(results)
+
+    async def rebuild(self) -> int:
+        """Drop all rollups and roll every approved result up again"""
+        async with self._lock:
+            await self.rollups.delete_many({})
+            await self.results.update_many({"tat_rolled_up": True}, {"$unset": {"tat_rolled_up": ""}})
+        processed = 0
+        while True:
+            count = await self.run_once()
+            processed += count
+            if count < self.batch_size:
+                return processed
+
+    async def report(self, start: datetime, end: datetime, group_by: str = "none",
+                     test_name: str = None, sample_type: str = None) -> Dict[str, Any]:
+        """Percentiles and breach rates for approvals between two UTC days (inclusive), merged from the rollups"""
+        started = time.perf_counter()
+        months, days = rollup_periods(start, end, use_months=group_by != "day")
+        query: Dict[str, Any] = {"$or": [{"period": "month", "key": {"$in": months}}, {"period": "day", "key": {"$in": days}}]}
+        if test_name:
+            query["test_name"] = test_name
+        if sample_type:
+            query["sample_type"] = sample_type
+        docs = await self.rollups.find(query, {"_id": 0}).to_list(None)
+        
+        group_field = {"test": "test_name", "sample_type": "sample_type", "day": "key"}.get(group_by)
+        merged: Dict[Any, Dict[str, Any]] = {}
+        for doc in docs:
+            if group_by == "month":
+                group_key = doc['key'][:7]
+            else:
+                group_key = doc.get(group_field) if group_field else "all"
+            group = merged.setdefault(group_key, {"histogram": np.zeros(TAT_HISTOGRAM_BUCKETS), "count": 0,
+                                                  "breaches": 0, "sum_minutes": 0.0, "max_minutes": 0.0})
+            for bucket, count in doc.get('buckets', {}).items():
+                group['histogram'][int(bucket)] += count
+            group['count'] += doc.get('count', 0)
+            group['breaches'] += doc.get('breaches', 0)
+            group['sum_minutes'] += doc.get('sum_minutes', 0.0)
+            group['max_minutes'] = max(group['max_minutes'], doc.get('max_minutes', 0.0))
+        
+        groups = []
+        quantiles = np.array([0.5, 0.9, 0.99])
+        for group_key in sorted(merged, key=str):
+            group = merged[group_key]
+            count = group['count']
+            cumulative = np.cumsum(group['histogram'])
+            buckets = np.searchsorted(cumulative, np.ceil(quantiles * count))
+            p50, p90, p99 = tat_bucket_minutes(buckets)
+            groups.append({
+                "group": group_key,
+                "count": int(count),
+                "breaches": int(group['breaches']),
+                "breach_rate": round(group['breaches'] / count, 4) if count else 0.0,
+                "mean_minutes": round(group['sum_minutes'] / count, 1) if count else None,
+                "p50_minutes": round(float(p50), 1),
+                "p90_minutes": round(float(p90), 1),
+                "p99_minutes": round(float(p99), 1),
+                "max_minutes": group['max_minutes'],
+            })
+        self.last_report_ms = (time.perf_counter() - started) * 1000
+        return {
+            "start": start.strftime("%Y-%m-%d"),
+            "end": end.strftime("%Y-%m-%d"),
+            "group_by": group_by,
+            "rollup_documents": len(docs),
+            "groups": groups,
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if self.interval > 0 and not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.running:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                # Keep going while full batches come back (first run after an upgrade backfills history)
+                while await self.run_once() >= self.batch_size:
+                    pass
+            except Exception:
+                logger.exception("TAT rollup failed")
+            await asyncio.sleep(self.interval)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "interval": self.interval,
+            "batch_size": self.batch_size,
+            "rolled_up": self.rolled_up,
+            "runs": self.runs,
+            "last_run_ms": round(self.last_run_ms, 2),
+            "last_report_ms": round(self.last_report_ms, 2),
+        }
+
+tat_rollup = TATRollup(db.test_results, db.samples, db.tat_rollups)
+
+@api_router.get("/analytics/tat")
+async def get_tat_analytics(start: str, end: str, group_by: str = "none", test_name: str = None, sample_type: str = None,
+                            current_user: User = Depends(get_current_user)):
+    """
+    Collection-to-approval TAT percentiles (p50/p90/p99) and breach rates for results
+    approved from `start` to `end` (YYYY-MM-DD, inclusive), grouped by test, sample type, day or month
+    """
+    try:
+        start_day = datetime.strptime(start, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+        end_day = datetime.strptime(end, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start and end must be YYYY-MM-DD")
+    if end_day < start_day:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    if group_by not in TAT_GROUP_BY:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of: {', '.join(TAT_GROUP_BY)}")
+    
+    return await tat_rollup.report(start_day, end_day, group_by, test_name, sample_type)
+
+@api_router.post("/analytics/tat/rollup")
+async def run_tat_rollup(rebuild: bool = False, current_user: User = Depends(get_current_user), request: Request = None):
+    """Roll up newly approved results now; rebuild=true recomputes every rollup from the results"""
+    processed = await tat_rollup.rebuild() if rebuild else await tat_rollup.run_once()
+    await log_audit(current_user, "TAT_ROLLUP", "tat_rollups", {"processed": processed, "rebuild": rebuild}, request)
+    return {"processed": processed, "rebuild": rebuild}
+
+@api_router.get("/analytics/tat/stats")
+async def tat_rollup_stats(current_user: User = Depends(get_current_user)):
+    return tat_rollup.stats()
+
 # ==================== NABL DOCUMENTS ROUTES ====================
 
 @api_router.post("/nabl-documents", response_model=NABLDocument)
@@ -740,8 +3330,6 @@ async def create_nabl_document(doc_data: NABLDocumentCreate, current_user: User
     )
     
     doc_dict = doc.model_dump()
-    doc_dict['created_at'] = doc_dict['created_at'].isoformat()
-    doc_dict['updated_at'] = doc_dict['updated_at'].isoformat()
     await db.nabl_documents.insert_one(doc_dict)
     
     await log_audit(current_user, "CREATE", "nabl_documents", {"document_id": doc.id, "type": doc.document_type}, request)
@@ -749,17 +3337,13 @@ async def create_nabl_document(doc_data: NABLDocumentCreate, current_user: User
     return doc
 
 @api_router.get("/nabl-documents", response_model=List[NABLDocument])
-async def get_nabl_documents(document_type: str = None, current_user: User = Depends(get_current_user)):
+async def get_nabl_documents(response: Response, document_type: str = None, limit: int = 1000, cursor: str = None,
+                             current_user: User = Depends(get_current_user)):
     query = {}
     if document_type:
         query["document_type"] = document_type
     
-    docs = await db.nabl_documents.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    for d in docs:
-        if isinstance(d['created_at'], str):
-            d['created_at'] = datetime.fromisoformat(d['created_at'])
-        if isinstance(d['updated_at'], str):
-            d['updated_at'] = datetime.fromisoformat(d['updated_at'])
+    docs = await fetch_page(db.nabl_documents, query, "created_at", limit, response, cursor=cursor)
     return docs
 
 # ==================== INVENTORY ROUTES ====================
@@ -768,8 +3352,6 @@ async def get_nabl_documents(document_type: str = None, current_user: User = Dep
 async def create_inventory_item(item_data: InventoryItemCreate, current_user: User = Depends(get_current_user), request: Request = None):
     item = InventoryItem(**item_data.model_dump())
     doc = item.model_dump()
-    doc['expiry_date'] = doc['expiry_date'].isoformat()
-    doc['created_at'] = doc['created_at'].isoformat()
     await db.inventory.insert_one(doc)
     
     await log_audit(current_user, "CREATE", "inventory", {"item_id": item.id, "item_name": item.item_name}, request)
@@ -779,84 +3361,166 @@ async def create_inventory_item(item_data: InventoryItemCreate, current_user: Us
 @api_router.get("/inventory", response_model=List[InventoryItem])
 async def get_inventory(current_user: User = Depends(get_current_user)):
     items = await db.inventory.find({}, {"_id": 0}).sort("item_name", 1).to_list(1000)
-    for i in items:
-        if isinstance(i['expiry_date'], str):
-            i['expiry_date'] = datetime.fromisoformat(i['expiry_date'])
-        if isinstance(i['created_at'], str):
-            i['created_at'] = datetime.fromisoformat(i['created_at'])
     return items
 
 @api_router.get("/inventory/alerts")
 async def get_inventory_alerts(current_user: User = Depends(get_current_user)):
-    items = await db.inventory.find({}, {"_id": 0}).to_list(1000)
-    
-    low_stock = []
-    expiring_soon = []
+    now = datetime.now(timezone.utc)
+    low_stock = await db.inventory.find({"$expr": {"$lte": ["$quantity", "$minimum_stock"]}}, {"_id": 0}).to_list(1000)
+    expiring = await db.inventory.find({"expiry_date": {"$gte": now, "$lt": now + timedelta(days=31)}}, {"_id": 0}).to_list(1000)
     
-    for item in items:
-        if isinstance(item['expiry_date'], str):
-            item['expiry_date'] = datetime.fromisoformat(item['expiry_date'])
-        if isinstance(item['created_at'], str):
-            item['created_at'] = datetime.fromisoformat(item['created_at'])
-        
-        if item['quantity'] <= item['minimum_stock']:
-            low_stock.append(item)
-        
-        days_to_expire = (item['expiry_date'] - datetime.now(timezone.utc)).days
-        if 0 <= days_to_expire <= 30:
-            expiring_soon.append({**item, "days_to_expire": days_to_expire})
+    expiring_soon = [{**item, "days_to_expire": (item['expiry_date'] - now).days} for item in expiring]
     
     return {"low_stock": low_stock, "expiring_soon": expiring_soon}
 
 # ==================== AUDIT LOG ROUTES ====================
 
 @api_router.get("/audit-logs", response_model=List[AuditLog])
-async def get_audit_logs(module: str = None, skip: int = 0, limit: int = 100, current_user: User = Depends(get_current_user)):
+async def get_audit_logs(response: Response, module: str = None, skip: int = 0, limit: int = 100, cursor: str = None,
+                         current_user: User = Depends(get_current_user)):
     query = {}
     if module:
         query["module"] = module
     
-    logs = await db.audit_logs.find(query, {"_id": 0}).sort("timestamp", -1).skip(skip).limit(limit).to_list(limit)
-    for log in logs:
-        if isinstance(log['timestamp'], str):
-            log['timestamp'] = datetime.fromisoformat(log['timestamp'])
+    logs = await fetch_page(db.audit_logs, query, "timestamp", limit, response, skip=skip, cursor=cursor)
     return logs
 
-# ==================== DASHBOARD STATS ====================
+@api_router.get("/audit-logs/pipeline")
+async def get_audit_pipeline_stats(current_user: User = Depends(get_current_user)):
+    """Queue depth and flush latency of the background audit writer"""
+    return audit_writer.stats()
 
-@api_router.get("/dashboard/stats")
-async def get_dashboard_stats(current_user: User = Depends(get_current_user)):
-    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+# ==================== EXPORTS ====================
+
+# export name -> (collection, date field used for the range filter, model defining the CSV columns)
+EXPORT_SOURCES = {
+    "samples": ("samples", "created_at", Sample),
+    "results": ("test_results", "created_at", TestResult),
+    "qc": ("qc_entries", "date", QCEntry),
+    "audit-logs": ("audit_logs", "timestamp", AuditLog),
+}
+
+def _export_default(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+def _csv_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, default=_export_default)
+    return value
+
+async def _stream_export(cursor, export_format: str, columns: List[str]):
+    """Yield the cursor as NDJSON or CSV, one chunk per EXPORT_BATCH_SIZE rows"""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    if export_format == "csv":
+        writer.writerow(columns)
+    rows = 0
+    async for doc in cursor:
+        if export_format == "csv":
+            writer.writerow([_csv_value(doc.get(column)) for column in columns])
+        else:
+            buffer.write(json.dumps(doc, default=_export_default))
+            buffer.write("\n")
+        rows += 1
+        if rows % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+@api_router.get("/export/{source}")
+async def export_records(source: str, export_format: str = "ndjson", start: datetime = None, end: datetime = None,
+                         module: str = None, current_user: User = Depends(get_current_user), request: Request = None):
+    """
+    Stream every sample, result, QC entry or audit log in [start, end) as NDJSON or CSV.
+    Rows go straight from the Mongo cursor to the response, so memory stays flat regardless of size.
+    """
+    if source not in EXPORT_SOURCES:
+        raise HTTPException(status_code=404, detail=f"Unknown export '{source}'")
+    if export_format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="export_format must be 'ndjson' or 'csv'")
+    collection, date_field, model = EXPORT_SOURCES[source]
     
-    total_patients = await db.patients.count_documents({})
-    total_samples_today = await db.samples.count_documents({
-        "created_at": {"$gte": today.isoformat()}
-    })
+    query = {}
+    if start or end:
+        query[date_field] = {}
+        if start:
+            query[date_field]["$gte"] = parse_datetime(start)
+        if end:
+            query[date_field]["$lt"] = parse_datetime(end)
+    if module and source == "audit-logs":
+        query["module"] = module
     
-    pending_results = await db.test_results.count_documents({"status": "draft"})
-    critical_results = await db.test_results.count_documents({"has_critical_values": True, "status": {"$ne": "finalized"}})
+    cursor = db[collection].find(query, {"_id": 0, EMR_SNAPSHOT_FIELD: 0}).sort(date_field, 1).batch_size(EXPORT_BATCH_SIZE)
     
-    samples_by_status = {}
-    for status in ["collected", "received", "processing", "under_validation", "approved"]:
-        count = await db.samples.count_documents({"status": status})
-        samples_by_status[status] = count
+    await log_audit(current_user, "EXPORT", collection, {"format": export_format, "filter": {k: str(v) for k, v in query.items()}}, request)
     
-    # TAT breaches
-    now_iso = datetime.now(timezone.utc).isoformat()
-    tat_breaches = await db.samples.count_documents({
-        "tat_deadline": {"$lt": now_iso},
-        "status": {"$nin": ["approved", "dispatched"]}
-    })
+    media_type = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    extension = "csv" if export_format == "csv" else "ndjson"
+    return StreamingResponse(
+        _stream_export(cursor, export_format, list(model.model_fields)),
+        media_type=media_type,
+        headers={'Content-Disposition': f'attachment; filename="{source}_export.{extension}"'}
+    )
+
+# ==================== DASHBOARD STATS ====================
+
+@api_router.get("/dashboard/stats")
+async def get_dashboard_stats(current_user: User = Depends(get_current_user)):
+    """Read from the incrementally maintained counters document: one round trip"""
+    counters = await dashboard_counters.read()
+    samples = counters.get('samples', {})
+    results = counters.get('results', {})
+    sample_statuses = samples.get('status', {})
     
     return {
-        "total_patients": total_patients,
-        "total_samples_today": total_samples_today,
-        "pending_results": pending_results,
-        "critical_results": critical_results,
-        "samples_by_status": samples_by_status,
-        "tat_breaches": tat_breaches
+        "total_patients": counters.get('patients', 0),
+        "total_samples_today": samples.get('by_day', {}).get(day_key(datetime.now(timezone.utc)), 0),
+        "pending_results": results.get('status', {}).get("draft", 0),
+        "critical_results": results.get('critical_open', 0),
+        "samples_by_status": {status: sample_statuses.get(status, 0) for status in DASHBOARD_SAMPLE_STATUSES},
+        "tat_breaches": counters.get('tat_breaches', 0)
     }
 
+@api_router.post("/dashboard/reconcile")
+async def reconcile_dashboard_counters(current_user: User = Depends(get_current_user), request: Request = None):
+    """Rebuild the dashboard counters from the collections now; returns the drift that was corrected"""
+    drift = await dashboard_counters.reconcile()
+    await log_audit(current_user, "RECONCILE", "dashboard_counters", {"drift": drift}, request)
+    return {"drift": drift}
+
+@api_router.get("/dashboard/counters/stats")
+async def dashboard_counter_stats(current_user: User = Depends(get_current_user)):
+    return dashboard_counters.stats()
+
+# ==================== EVENT STREAM ====================
+
+@api_router.get("/events")
+async def stream_events(topics: str = None, current_user: User = Depends(get_stream_user)):
+    """
+    Server-Sent Events: dashboard counter changes, sample status changes, new critical results
+    and TAT breaches as they happen, so screens do not have to poll. `topics` is a
+    comma-separated subset of EVENT_TOPICS (default: all).
+    """
+    wanted = [topic.strip() for topic in topics.split(",") if topic.strip()] if topics else list(EVENT_TOPICS)
+    unknown = [topic for topic in wanted if topic not in EVENT_TOPICS]
+    if unknown or not wanted:
+        raise HTTPException(status_code=400, detail=f"topics must be from: {', '.join(EVENT_TOPICS)}")
+    
+    subscription = event_bus.subscribe(wanted)
+    return StreamingResponse(
+        event_bus.stream(subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@api_router.get("/events/stats")
+async def event_stream_stats(current_user: User = Depends(get_current_user)):
+    return event_bus.stats()
+
 # ==================== EMR INTEGRATION ENDPOINTS ====================
 
 class EMRPatientCreate(BaseModel):
@@ -881,26 +3545,88 @@ class EMRLabOrder(BaseModel):
     ordered_by: str  # Doctor name
     priority: str = "routine"  # routine, urgent, stat
 
+class EMRBulkLabOrder(BaseModel):
+    """Batch of lab orders from EMR system, processed together"""
+    orders: List[EMRLabOrder]
+
+# Samples created from an EMR order keep the response that was sent back, so a retried
+# order (same emr_order_id) is answered from the unique index without writing anything.
+EMR_SNAPSHOT_FIELD = "emr_response"
+
+def _emr_patient_exists_response(patient: Dict[str, Any], emr_patient_id: str) -> Dict[str, Any]:
+    return {
+        "status": "exists",
+        "message": "Patient already registered",
+        "uhid": patient['uhid'],
+        "patient_id": patient['id'],
+        "emr_patient_id": emr_patient_id
+    }
+
+def _emr_order_response(sample: Dict[str, Any]) -> Dict[str, Any]:
+    """Response for an accepted EMR order, built from its sample document"""
+    return {
+        "status": "success",
+        "message": "Lab order created successfully",
+        "uhid": sample['uhid'],
+        "patient_id": sample['patient_id'],
+        "patient_name": sample['patient_name'],
+        "sample_id": sample['sample_id'],
+        "barcode": sample['barcode'],
+        "tests": [{"test_name": t['test_name'], "tat_hours": t['tat_hours']} for t in sample['tests']],
+        "tat_deadline": parse_datetime(sample['tat_deadline']).isoformat(),
+        "emr_order_id": sample['emr_order_id']
+    }
+
+# Fields needed to rebuild the response of samples created before snapshots were stored
+_EMR_REPLAY_PROJECTION = {
+    "_id": 0, EMR_SNAPSHOT_FIELD: 1, "emr_order_id": 1, "uhid": 1, "patient_id": 1, "patient_name": 1,
+    "sample_id": 1, "barcode": 1, "tests.test_name": 1, "tests.tat_hours": 1, "tat_deadline": 1
+}
+
+def _emr_replay(sample: Dict[str, Any]) -> Dict[str, Any]:
+    snapshot = sample.get(EMR_SNAPSHOT_FIELD) or _emr_order_response(sample)
+    return {**snapshot, "replayed": True}
+
+async def emr_order_replays(emr_order_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Stored responses of EMR orders that were already accepted, keyed by emr_order_id"""
+    if not emr_order_ids:
+        return {}
+    if len(emr_order_ids) == 1:
+        sample = await db.samples.find_one({"emr_order_id": emr_order_ids[0]}, _EMR_REPLAY_PROJECTION)
+        samples = [sample] if sample else []
+    else:
+        samples = await db.samples.find({"emr_order_id": {"$in": emr_order_ids}}, _EMR_REPLAY_PROJECTION).to_list(None)
+    return {sample['emr_order_id']: _emr_replay(sample) for sample in samples}
+
+async def _insert_emr_patient(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Insert a patient registered from the EMR; a concurrent registration of the same
+    emr_patient_id loses on the unique index and gets the stored patient instead"""
+    try:
+        await db.patients.insert_one(doc)
+    except DuplicateKeyError:
+        existing = await db.patients.find_one({"emr_patient_id": doc['emr_patient_id']}, {"_id": 0})
+        if not existing:
+            raise
+        return existing
+    await dashboard_counters.apply(dashboard_counters.patients_added())
+    doc.pop('_id', None)
+    return doc
+
 @api_router.post("/emr/patient/register")
 async def emr_register_patient(patient_data: EMRPatientCreate, current_user: User = Depends(get_current_user)):
     """
     EMR Integration: Register patient from external EMR system
-    Returns UHID for future reference
+    Returns UHID for future reference. Registering the same emr_patient_id again returns the stored patient.
     """
     # Check if EMR patient already exists
-    existing = await db.patients.find_one({"phone": patient_data.phone}, {"_id": 0})
+    existing = await db.patients.find_one({"emr_patient_id": patient_data.emr_patient_id}, {"_id": 0})
+    if not existing:
+        existing = await db.patients.find_one({"phone": patient_data.phone}, {"_id": 0})
     if existing:
-        return {
-            "status": "exists",
-            "message": "Patient already registered",
-            "uhid": existing['uhid'],
-            "patient_id": existing['id'],
-            "emr_patient_id": patient_data.emr_patient_id
-        }
+        return _emr_patient_exists_response(existing, patient_data.emr_patient_id)
     
     # Generate UHID
-    count = await db.patients.count_documents({}) + 1
-    uhid = f"UHID{count:06d}"
+    uhid = await next_uhid()
     
     patient = Patient(
         uhid=uhid,
@@ -915,9 +3641,10 @@ async def emr_register_patient(patient_data: EMRPatientCreate, current_user: Use
     )
     
     doc = patient.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     doc['emr_patient_id'] = patient_data.emr_patient_id
-    await db.patients.insert_one(doc)
+    stored = await _insert_emr_patient(doc)
+    if stored['id'] != patient.id:
+        return _emr_patient_exists_response(stored, patient_data.emr_patient_id)
     
     return {
         "status": "created",
@@ -931,10 +3658,15 @@ async def emr_register_patient(patient_data: EMRPatientCreate, current_user: Use
 async def emr_create_lab_order(order_data: EMRLabOrder, current_user: User = Depends(get_current_user)):
     """
     EMR Integration: Create lab order from doctor's prescription
-    Automatically registers patient if new, creates sample with tests
+    Automatically registers patient if new, creates sample with tests.
+    Retrying an emr_order_id returns the original sample instead of creating another.
     """
-    patient_id = None
-    uhid = None
+    replays = await emr_order_replays([order_data.emr_order_id])
+    if replays:
+        return replays[order_data.emr_order_id]
+    
+    patient = None
+    emr_patient_id = order_data.emr_patient_id or (order_data.patient_details.emr_patient_id if order_data.patient_details else None)
     
     # Get or create patient
     if order_data.uhid:
@@ -942,22 +3674,14 @@ async def emr_create_lab_order(order_data: EMRLabOrder, current_user: User = Dep
         patient = await db.patients.find_one({"uhid": order_data.uhid}, {"_id": 0})
         if not patient:
             raise HTTPException(status_code=404, detail="Patient not found with given UHID")
-        patient_id = patient['id']
-        uhid = patient['uhid']
-    elif order_data.emr_patient_id:
+    elif emr_patient_id:
         # Try to find by EMR ID
-        patient = await db.patients.find_one({"emr_patient_id": order_data.emr_patient_id}, {"_id": 0})
-        if patient:
-            patient_id = patient['id']
-            uhid = patient['uhid']
+        patient = await db.patients.find_one({"emr_patient_id": emr_patient_id}, {"_id": 0})
     
     # Create new patient if needed
-    if not patient_id and order_data.patient_details:
-        count = await db.patients.count_documents({}) + 1
-        uhid = f"UHID{count:06d}"
-        
+    if not patient and order_data.patient_details:
         patient = Patient(
-            uhid=uhid,
+            uhid=await next_uhid(),
             name=order_data.patient_details.name,
             age=order_data.patient_details.age,
             gender=order_data.patient_details.gender,
@@ -967,38 +3691,23 @@ async def emr_create_lab_order(order_data: EMRLabOrder, current_user: User = Dep
             patient_type=order_data.patient_details.patient_type,
             created_by=current_user.id
         )
-        
+    
         doc = patient.model_dump()
-        doc['created_at'] = doc['created_at'].isoformat()
         doc['emr_patient_id'] = order_data.patient_details.emr_patient_id
-        await db.patients.insert_one(doc)
-        patient_id = patient.id
+        patient = await _insert_emr_patient(doc)
     
-    if not patient_id:
+    if not patient:
         raise HTTPException(status_code=400, detail="Patient information required")
     
-    # Get patient details
-    patient = await db.patients.find_one({"id": patient_id}, {"_id": 0})
-    
     # Get tests by codes
-    test_list = []
-    for test_code in order_data.test_codes:
-        test = await db.test_configs.find_one({"test_code": test_code}, {"_id": 0})
-        if test:
-            test_list.append(TestItem(
-                test_id=test['id'],
-                test_name=test['test_name'],
-                price=test['price'],
-                tat_hours=test['tat_hours']
-            ))
+    await test_catalog.refresh()
+    test_list = test_catalog.test_items(order_data.test_codes)
     
     if not test_list:
         raise HTTPException(status_code=404, detail="No valid tests found for given test codes")
     
     # Generate sample ID and barcode
-    count = await db.samples.count_documents({}) + 1
-    sample_id = f"SMP{count:08d}"
-    barcode_num = f"{count:012d}"
+    sample_id, barcode_num = await next_sample_ids()
     
     # Calculate TAT deadline
     max_tat = max([test.tat_hours for test in test_list])
@@ -1007,7 +3716,7 @@ async def emr_create_lab_order(order_data: EMRLabOrder, current_user: User = Dep
     sample = Sample(
         sample_id=sample_id,
         barcode=barcode_num,
-        patient_id=patient_id,
+        patient_id=patient['id'],
         patient_name=patient['name'],
         uhid=patient['uhid'],
         tests=[test.model_dump() for test in test_list],
@@ -1017,25 +3726,207 @@ async def emr_create_lab_order(order_data: EMRLabOrder, current_user: User = Dep
     )
     
     doc = sample.model_dump()
-    doc['collection_date'] = doc['collection_date'].isoformat()
-    doc['tat_deadline'] = doc['tat_deadline'].isoformat()
-    doc['created_at'] = doc['created_at'].isoformat()
     doc['emr_order_id'] = order_data.emr_order_id
     doc['ordered_by'] = order_data.ordered_by
     doc['priority'] = order_data.priority
-    await db.samples.insert_one(doc)
+    response = _emr_order_response(doc)
+    doc[EMR_SNAPSHOT_FIELD] = response
+    try:
+        await db.samples.insert_one(doc)
+    except DuplicateKeyError:
+        # A concurrent retry of the same order won the race
+        replays = await emr_order_replays([order_data.emr_order_id])
+        if not replays:
+            raise
+        return replays[order_data.emr_order_id]
+    await dashboard_counters.apply(dashboard_counters.sample_change(None, doc))
+    publish_sample_status(doc, None)
+    tat_monitor.track(doc)
+    
+    return response
+
+async def _insert_many_partial(collection, docs: List[Dict[str, Any]]) -> set:
+    """insert_many that keeps going past bad documents; returns the indexes that failed"""
+    if not docs:
+        return set()
+    try:
+        await collection.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        return {error['index'] for error in e.details.get('writeErrors', [])}
+    return set()
+
+@api_router.post("/emr/lab-order/bulk")
+async def emr_create_lab_orders_bulk(bulk_data: EMRBulkLabOrder, current_user: User = Depends(get_current_user),
+                                     request: Request = None):
+    """
+    EMR Integration: Create many lab orders in one call
+    Patients are resolved with $in queries and tests from the in-memory catalog, UHIDs
+    and sample IDs are reserved in blocks and samples are written with one insert_many.
+    Each order gets its own result, so one bad order does not fail the batch. Orders already accepted (same
+    emr_order_id) are answered from their stored response.
+    """
+    orders = bulk_data.orders
+    if len(orders) > EMR_BULK_MAX_ORDERS:
+        raise HTTPException(status_code=400, detail=f"At most {EMR_BULK_MAX_ORDERS} orders per request")
+    results: List[Optional[Dict[str, Any]]] = [None] * len(orders)
+    
+    def fail(index: int, message: str):
+        results[index] = {"index": index, "emr_order_id": orders[index].emr_order_id, "status": "error", "error": message}
+    
+    # Replay orders that were already accepted; repeats within the batch follow their first occurrence
+    replays = await emr_order_replays(list({o.emr_order_id for o in orders}))
+    first_occurrence = {}
+    repeats = {}
+    pending = []
+    for index, order in enumerate(orders):
+        if order.emr_order_id in replays:
+            results[index] = {"index": index, **replays[order.emr_order_id]}
+        elif order.emr_order_id in first_occurrence:
+            repeats[index] = first_occurrence[order.emr_order_id]
+        else:
+            first_occurrence[order.emr_order_id] = index
+            pending.append(index)
+    
+    # Resolve existing patients in two indexed $in queries
+    uhids = {orders[i].uhid for i in pending if orders[i].uhid}
+    emr_ids = {orders[i].emr_patient_id for i in pending if orders[i].emr_patient_id}
+    emr_ids |= {orders[i].patient_details.emr_patient_id for i in pending if orders[i].patient_details}
+    by_uhid = {}
+    by_emr_id = {}
+    if uhids:
+        for p in await db.patients.find({"uhid": {"$in": list(uhids)}}, {"_id": 0}).to_list(None):
+            by_uhid[p['uhid']] = p
+    if emr_ids:
+        for p in await db.patients.find({"emr_patient_id": {"$in": list(emr_ids)}}, {"_id": 0}).to_list(None):
+            by_emr_id.setdefault(p['emr_patient_id'], p)
+    
+    await test_catalog.refresh()
+    
+    # New patients are registered once per EMR patient id, even if several orders carry them
+    new_patients: Dict[str, EMRPatientCreate] = {}
+    for i in pending:
+        order = orders[i]
+        if not order.uhid and order.patient_details and order.patient_details.emr_patient_id not in by_emr_id:
+            new_patients.setdefault(order.patient_details.emr_patient_id, order.patient_details)
+    
+    # Decide patient and tests per order
+    plans = {}
+    for index in pending:
+        order = orders[index]
+        patient_key = None
+        if order.uhid:
+            if order.uhid not in by_uhid:
+                fail(index, "Patient not found with given UHID")
+                continue
+            patient_key = ("uhid", order.uhid)
+        elif order.emr_patient_id and (order.emr_patient_id in by_emr_id or order.emr_patient_id in new_patients):
+            patient_key = ("emr", order.emr_patient_id)
+        elif order.patient_details:
+            patient_key = ("emr", order.patient_details.emr_patient_id)
+        if patient_key is None:
+            fail(index, "Patient information required")
+            continue
+    
+        test_list = test_catalog.test_items(order.test_codes)
+        if not test_list:
+            fail(index, "No valid tests found for given test codes")
+            continue
+        plans[index] = (patient_key, test_list)
+    
+    # Register new patients with a block of UHIDs and one insert_many
+    counter_changes = []
+    if new_patients:
+        numbers = await id_sequencer.take("patients", len(new_patients))
+        patient_docs = []
+        for number, (emr_patient_id, details) in zip(numbers, new_patients.items()):
+            patient = Patient(
+                uhid=format_uhid(number),
+                name=details.name,
+                age=details.age,
+                gender=details.gender,
+                phone=details.phone,
+                email=details.email,
+                address=details.address,
+                patient_type=details.patient_type,
+                created_by=current_user.id
+            )
+            doc = patient.model_dump()
+            doc['emr_patient_id'] = emr_patient_id
+            patient_docs.append(doc)
+        failed = await _insert_many_partial(db.patients, patient_docs)
+        counter_changes.append(dashboard_counters.patients_added(len(patient_docs) - len(failed)))
+        for i, doc in enumerate(patient_docs):
+            if i not in failed:
+                doc.pop('_id', None)
+                by_emr_id[doc['emr_patient_id']] = doc
+        if failed:
+            # Registered concurrently under the same emr_patient_id: use the stored patient
+            raced = [patient_docs[i]['emr_patient_id'] for i in failed]
+            for p in await db.patients.find({"emr_patient_id": {"$in": raced}}, {"_id": 0}).to_list(None):
+                by_emr_id[p['emr_patient_id']] = p
+    
+    # Build samples with a block of sample IDs and one insert_many
+    sample_docs = []
+    sample_orders = []
+    for index, (patient_key, test_list) in plans.items():
+        patient = by_uhid.get(patient_key[1]) if patient_key[0] == "uhid" else by_emr_id.get(patient_key[1])
+        if patient is None:
+            fail(index, "Patient registration failed")
+            continue
+        sample_orders.append((index, patient, test_list))
+    numbers = await id_sequencer.take("samples", len(sample_orders)) if sample_orders else []
+    now = datetime.now(timezone.utc)
+    for number, (index, patient, test_list) in zip(numbers, sample_orders):
+        order = orders[index]
+        sample = Sample(
+            sample_id=format_sample_id(number),
+            barcode=format_barcode(number),
+            patient_id=patient['id'],
+            patient_name=patient['name'],
+            uhid=patient['uhid'],
+            tests=[test.model_dump() for test in test_list],
+            sample_type=order.sample_type,
+            collected_by=current_user.id,
+            tat_deadline=now + timedelta(hours=max(test.tat_hours for test in test_list))
+        )
+        doc = sample.model_dump()
+        doc['emr_order_id'] = order.emr_order_id
+        doc['ordered_by'] = order.ordered_by
+        doc['priority'] = order.priority
+        doc[EMR_SNAPSHOT_FIELD] = _emr_order_response(doc)
+        sample_docs.append(doc)
+    failed = await _insert_many_partial(db.samples, sample_docs)
+    
+    # Orders that lost an insert race to a concurrent retry are answered with the winner's response
+    raced = await emr_order_replays([sample_docs[i]['emr_order_id'] for i in failed])
+    for i, ((index, patient, test_list), doc) in enumerate(zip(sample_orders, sample_docs)):
+        if i not in failed:
+            results[index] = {"index": index, **doc[EMR_SNAPSHOT_FIELD]}
+            counter_changes.append(dashboard_counters.sample_change(None, doc))
+            publish_sample_status(doc, None)
+            tat_monitor.track(doc)
+        elif doc['emr_order_id'] in raced:
+            results[index] = {"index": index, **raced[doc['emr_order_id']]}
+        else:
+            fail(index, "Sample could not be created")
+    await dashboard_counters.apply(*counter_changes)
+    
+    for index, first in repeats.items():
+        results[index] = {**results[first], "index": index}
+        if results[index]['status'] == "success":
+            results[index]['replayed'] = True
+    
+    created = sum(1 for r in results if r['status'] == "success" and not r.get('replayed'))
+    accepted = sum(1 for r in results if r['status'] == "success")
+    await log_audit(current_user, "BULK_CREATE", "samples", {"orders": len(orders), "created": created}, request)
     
     return {
-        "status": "success",
-        "message": "Lab order created successfully",
-        "uhid": uhid,
-        "patient_id": patient_id,
-        "patient_name": patient['name'],
-        "sample_id": sample_id,
-        "barcode": barcode_num,
-        "tests": [{"test_name": t.test_name, "tat_hours": t.tat_hours} for t in test_list],
-        "tat_deadline": tat_deadline.isoformat(),
-        "emr_order_id": order_data.emr_order_id
+        "status": "success" if accepted == len(orders) else ("partial" if accepted else "failed"),
+        "total": len(orders),
+        "created": created,
+        "replayed": accepted - created,
+        "failed": len(orders) - accepted,
+        "results": results
     }
 
 @api_router.get("/emr/patient/{uhid}")
@@ -1045,89 +3936,239 @@ async def emr_get_patient(uhid: str, current_user: User = Depends(get_current_us
     if not patient:
         raise HTTPException(status_code=404, detail="Patient not found")
     
-    if isinstance(patient['created_at'], str):
-        patient['created_at'] = datetime.fromisoformat(patient['created_at'])
-    
     return Patient(**patient)
 
 @api_router.get("/emr/results/patient/{patient_id}")
-async def emr_get_patient_results(patient_id: str, current_user: User = Depends(get_current_user)):
-    """EMR Integration: Get all results for a patient"""
-    results = await db.test_results.find({"patient_id": patient_id}, {"_id": 0}).to_list(1000)
-    for r in results:
-        if isinstance(r['created_at'], str):
-            r['created_at'] = datetime.fromisoformat(r['created_at'])
-        if isinstance(r['updated_at'], str):
-            r['updated_at'] = datetime.fromisoformat(r['updated_at'])
+async def emr_get_patient_results(patient_id: str, response: Response, limit: int = 1000, cursor: str = None,
+                                  current_user: User = Depends(get_current_user)):
+    """EMR Integration: Get all results for a patient (newest first, continue with the X-Next-Cursor header)"""
+    results = await fetch_page(db.test_results, {"patient_id": patient_id}, "created_at", limit, response, cursor=cursor)
     return results
 
 @api_router.get("/emr/sample/status/{sample_id}")
 async def emr_get_sample_status(sample_id: str, current_user: User = Depends(get_current_user)):
     """EMR Integration: Get sample status by sample ID"""
-    sample = await db.samples.find_one({"sample_id": sample_id}, {"_id": 0})
+    sample = await db.samples.find_one({"sample_id": sample_id}, {"_id": 0, EMR_SNAPSHOT_FIELD: 0})
     if not sample:
         raise HTTPException(status_code=404, detail="Sample not found")
     
-    if isinstance(sample['collection_date'], str):
-        sample['collection_date'] = datetime.fromisoformat(sample['collection_date'])
-    if isinstance(sample['tat_deadline'], str):
-        sample['tat_deadline'] = datetime.fromisoformat(sample['tat_deadline'])
-    if isinstance(sample['created_at'], str):
-        sample['created_at'] = datetime.fromisoformat(sample['created_at'])
-    
     return sample
 
 # ==================== GENERATE PDF REPORT ====================
 
-def generate_pdf_report(patient_data, sample_data, results_data):
-    """Generate PDF report with hospital letterhead, QR code and barcode"""
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=0.5*inch, bottomMargin=0.5*inch, 
-                          leftMargin=0.75*inch, rightMargin=0.75*inch)
+# Bump whenever the report layout code changes so cached reports are not reused
+REPORT_TEMPLATE_VERSION = "2"
+REPORT_TEMPLATES_FILE = os.environ.get('REPORT_TEMPLATES_FILE')
+DEFAULT_REPORT_TEMPLATE = "default"
+
+REPORT_STATUS_LABELS = {'critical': '*** CRITICAL ***', 'high': 'HIGH', 'low': 'LOW'}
+
+class ReportTemplate:
+    """
+    A branch letterhead compiled once: paragraph and table styles are built here and shared
+    by every report rendered with the template. Flowables keep layout state from wrap() and
+    split(), so letterhead() builds the static ones (letterhead lines, rule, headings) afresh
+    for each story instead of sharing them between reports.
+    """
+
+    def __init__(self, name: str, title: str = "ABC HOSPITAL", hospital: str = "ABC Hospital, Panipat",
+                 accreditation: str = "NABL Accredited Laboratory (ISO 15189:2022)",
+                 contact: str = "Panipat, Haryana | Phone: +91-XXXXXXXXXX | Email: lab@abchospital.com",
+                 footer_note: str = "Note: This is a digitally generated report from ABC Hospital NABL-accredited laboratory.",
+                 accent_color: str = "#0ea5e9", version: str = "1"):
+        self.name = name
+        self.title = title
+        self.hospital = hospital
+        self.accreditation = accreditation
+        self.contact = contact
+        self.footer_note = footer_note
+        self.version = version
+        accent = colors.HexColor(accent_color)
+        styles = getSampleStyleSheet()
+        
+        # Custom styles
+        self.title_style = ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=20,
+            textColor=colors.HexColor('#0F172A'),
+            spaceAfter=6,
+            alignment=TA_CENTER,
+            fontName='Helvetica-Bold'
+        )
+        
+        self.header_style = ParagraphStyle(
+            'Header',
+            parent=styles['Normal'],
+            fontSize=10,
+            textColor=colors.HexColor('#64748B'),
+            alignment=TA_CENTER,
+            spaceAfter=20
+        )
+        
+        self.section_style = ParagraphStyle(
+            'Section',
+            parent=styles['Heading2'],
+            fontSize=12,
+            textColor=colors.HexColor('#0F172A'),
+            spaceAfter=10,
+            spaceBefore=15,
+            fontName='Helvetica-Bold'
+        )
+        
+        self.report_title_style = ParagraphStyle('ReportTitle', parent=styles['Heading1'], fontSize=14, 
+                                                 textColor=colors.HexColor('#0F172A'), alignment=TA_CENTER, 
+                                                 spaceAfter=15, fontName='Helvetica-Bold')
+        self.barcode_label_style = ParagraphStyle('BarcodeLabel', parent=styles['Normal'], fontSize=10,
+                                                  fontName='Courier-Bold',
+                                                  textColor=colors.HexColor('#0F172A'), spaceAfter=10)
+        self.interpretation_style = ParagraphStyle('Interpretation', parent=styles['Normal'], 
+                                                   fontSize=9, textColor=colors.HexColor('#475569'),
+                                                   leftIndent=10)
+        self.qr_info_style = ParagraphStyle('QRInfo', parent=styles['Normal'], fontSize=8,
+                                            textColor=colors.HexColor('#64748B'), leftIndent=5,
+                                            rightIndent=5, spaceAfter=5)
+        
+        # Table styles
+        self.letterhead_table_style = TableStyle([
+            ('ALIGN', (0, 0), (0, 0), 'LEFT'),
+            ('ALIGN', (1, 0), (1, 0), 'RIGHT'),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP')
+        ])
+        self.patient_table_style = TableStyle([
+            ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#F1F5F9')),
+            ('BACKGROUND', (2, 0), (2, -1), colors.HexColor('#F1F5F9')),
+            ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#0F172A')),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+            ('FONTNAME', (2, 0), (2, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('TOPPADDING', (0, 0), (-1, -1), 6),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#E2E8F0'))
+        ])
+        self.result_table_commands = [
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#0F172A')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('ALIGN', (1, 1), (1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('FONTSIZE', (0, 1), (-1, -1), 9),
+            ('TOPPADDING', (0, 0), (-1, -1), 8),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#E2E8F0'))
+        ]
+        self.rule_style = TableStyle([
+            ('LINEABOVE', (0, 0), (-1, 0), 2, accent),
+        ])
+        self.qr_info_table_style = TableStyle([
+            ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#F1F5F9')),
+            ('BOX', (0, 0), (-1, -1), 1, accent),
+            ('TOPPADDING', (0, 0), (-1, -1), 8),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+            ('LEFTPADDING', (0, 0), (-1, -1), 10),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 10)
+        ])
+        self.footer_table_style = TableStyle([
+            ('ALIGN', (0, 0), (0, -3), 'LEFT'),
+            ('ALIGN', (1, 0), (1, -3), 'RIGHT'),
+            ('FONTSIZE', (0, 0), (-1, -1), 8),
+            ('TEXTCOLOR', (0, 0), (-1, -2), colors.HexColor('#0F172A')),
+            ('TEXTCOLOR', (0, -1), (-1, -1), colors.HexColor('#64748B')),
+            ('FONTNAME', (0, 1), (-1, 2), 'Helvetica-Bold'),
+            ('SPAN', (0, -2), (-1, -2)),
+        ])
+
+    def letterhead(self, qr_image) -> list:
+        """Letterhead with the report's QR code, rule, report title and patient heading, as new flowables"""
+        header_table = Table([[Paragraph(self.title, self.title_style), qr_image]], colWidths=[5.3*inch, 1.5*inch])
+        header_table.setStyle(self.letterhead_table_style)
+        rule = Table([['']], colWidths=[6.8*inch])
+        rule.setStyle(self.rule_style)
+        return [
+            header_table,
+            Paragraph(self.accreditation, self.header_style),
+            Paragraph(self.contact, self.header_style),
+            Spacer(1, 0.1*inch),
+            # Horizontal line
+            rule,
+            Spacer(1, 0.2*inch),
+            Paragraph("LABORATORY TEST REPORT", self.report_title_style),
+            Spacer(1, 0.1*inch),
+            # Patient Information Section with UHID Barcode
+            Paragraph("PATIENT INFORMATION", self.section_style),
+        ]
+
+    @property
+    def cache_tag(self) -> str:
+        return f"{REPORT_TEMPLATE_VERSION}:{self.name}:{self.version}"
+
+    def result_row_commands(self, row: int, status: str) -> list:
+        """Colour coding for one result row"""
+        if status == 'critical':
+            return [
+                ('BACKGROUND', (0, row), (-1, row), colors.HexColor('#FEF2F2')),
+                ('TEXTCOLOR', (1, row), (1, row), colors.HexColor('#DC2626')),
+                ('TEXTCOLOR', (4, row), (4, row), colors.HexColor('#DC2626')),
+                ('FONTNAME', (1, row), (1, row), 'Helvetica-Bold'),
+                ('FONTNAME', (4, row), (4, row), 'Helvetica-Bold'),
+            ]
+        if status == 'high':
+            return [
+                ('TEXTCOLOR', (1, row), (1, row), colors.HexColor('#DC2626')),
+                ('TEXTCOLOR', (4, row), (4, row), colors.HexColor('#DC2626')),
+                ('FONTNAME', (1, row), (1, row), 'Helvetica-Bold'),
+            ]
+        if status == 'low':
+            return [
+                ('TEXTCOLOR', (1, row), (1, row), colors.HexColor('#2563EB')),
+                ('TEXTCOLOR', (4, row), (4, row), colors.HexColor('#2563EB')),
+                ('FONTNAME', (1, row), (1, row), 'Helvetica-Bold'),
+            ]
+        return []
+
+REPORT_TEMPLATES: Dict[str, ReportTemplate] = {}
+
+def register_report_template(template: ReportTemplate):
+    REPORT_TEMPLATES[template.name] = template
+
+def get_report_template(name: Optional[str] = None) -> ReportTemplate:
+    template = REPORT_TEMPLATES.get(name or DEFAULT_REPORT_TEMPLATE)
+    if template is None:
+        raise HTTPException(status_code=404, detail=f"Unknown report template '{name}'")
+    return template
+
+def load_report_templates():
+    """
+    Compile the default letterhead plus any branch letterheads listed in REPORT_TEMPLATES_FILE,
+    a JSON object of {"branch_name": {ReportTemplate keyword arguments}}.
+    """
+    register_report_template(ReportTemplate(DEFAULT_REPORT_TEMPLATE))
+    if REPORT_TEMPLATES_FILE:
+        with open(REPORT_TEMPLATES_FILE) as f:
+            for name, options in json.load(f).items():
+                register_report_template(ReportTemplate(name, **options))
+
+# Compiled at import so the API process and every report worker share the same registry
+load_report_templates()
+
+def build_report_story(patient_data, sample_data, results_data, template: ReportTemplate) -> list:
+    """Flowables for one report: letterhead, patient block, one table per result, verification and footer"""
     story = []
-    styles = getSampleStyleSheet()
-    
-    # Custom styles
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=20,
-        textColor=colors.HexColor('#0F172A'),
-        spaceAfter=6,
-        alignment=TA_CENTER,
-        fontName='Helvetica-Bold'
-    )
-    
-    header_style = ParagraphStyle(
-        'Header',
-        parent=styles['Normal'],
-        fontSize=10,
-        textColor=colors.HexColor('#64748B'),
-        alignment=TA_CENTER,
-        spaceAfter=20
-    )
-    
-    section_style = ParagraphStyle(
-        'Section',
-        parent=styles['Heading2'],
-        fontSize=12,
-        textColor=colors.HexColor('#0F172A'),
-        spaceAfter=10,
-        spaceBefore=15,
-        fontName='Helvetica-Bold'
-    )
     
     # Generate QR Code for report verification
     result_id = results_data[0]['id']
+    result_ids = "".join(r['id'] for r in results_data)
     qr_data = {
         'type': 'lab_report',
-        'hospital': 'ABC Hospital, Panipat',
+        'hospital': template.hospital,
         'result_id': result_id,
         'uhid': patient_data['uhid'],
         'sample_id': sample_data['sample_id'],
         'patient_name': patient_data['name'],
         'generated_at': datetime.now(timezone.utc).isoformat(),
-        'verification_hash': hashlib.sha256(f"{result_id}{patient_data['uhid']}{sample_data['sample_id']}".encode()).hexdigest()[:16]
+        'verification_hash': hashlib.sha256(f"{result_ids}{patient_data['uhid']}{sample_data['sample_id']}".encode()).hexdigest()[:16]
     }
     
     qr = qrcode.QRCode(version=1, box_size=10, border=2)
@@ -1142,41 +4183,7 @@ def generate_pdf_report(patient_data, sample_data, results_data):
     qr_image = RLImage(qr_buffer, width=1.2*inch, height=1.2*inch)
     
     # Hospital Letterhead with QR Code
-    header_data = [
-        [
-            Paragraph("ABC HOSPITAL", title_style),
-            qr_image
-        ]
-    ]
-    header_table = Table(header_data, colWidths=[5.3*inch, 1.5*inch])
-    header_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (0, 0), 'LEFT'),
-        ('ALIGN', (1, 0), (1, 0), 'RIGHT'),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP')
-    ]))
-    story.append(header_table)
-    
-    story.append(Paragraph("NABL Accredited Laboratory (ISO 15189:2022)", header_style))
-    story.append(Paragraph("Panipat, Haryana | Phone: +91-XXXXXXXXXX | Email: lab@abchospital.com", header_style))
-    story.append(Spacer(1, 0.1*inch))
-    
-    # Horizontal line
-    line_table = Table([['']], colWidths=[6.8*inch])
-    line_table.setStyle(TableStyle([
-        ('LINEABOVE', (0, 0), (-1, 0), 2, colors.HexColor('#0ea5e9')),
-    ]))
-    story.append(line_table)
-    story.append(Spacer(1, 0.2*inch))
-    
-    # Report Title
-    report_title = ParagraphStyle('ReportTitle', parent=styles['Heading1'], fontSize=14, 
-                                   textColor=colors.HexColor('#0F172A'), alignment=TA_CENTER, 
-                                   spaceAfter=15, fontName='Helvetica-Bold')
-    story.append(Paragraph("LABORATORY TEST REPORT", report_title))
-    story.append(Spacer(1, 0.1*inch))
-    
-    # Patient Information Section with UHID Barcode
-    story.append(Paragraph("PATIENT INFORMATION", section_style))
+    story.extend(template.letterhead(qr_image))
     
     patient_info = [
         ['UHID:', patient_data['uhid'], 'Patient Name:', patient_data['name']],
@@ -1188,127 +4195,50 @@ def generate_pdf_report(patient_data, sample_data, results_data):
     ]
     
     patient_table = Table(patient_info, colWidths=[1.3*inch, 2*inch, 1.3*inch, 2.2*inch])
-    patient_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#F1F5F9')),
-        ('BACKGROUND', (2, 0), (2, -1), colors.HexColor('#F1F5F9')),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#0F172A')),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (2, 0), (2, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('TOPPADDING', (0, 0), (-1, -1), 6),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#E2E8F0'))
-    ]))
+    patient_table.setStyle(template.patient_table_style)
     story.append(patient_table)
     story.append(Spacer(1, 0.1*inch))
     
     # UHID Barcode - simplified text with barcode value
-    barcode_label = Paragraph(f"<b>UHID Barcode: {patient_data['uhid']}</b>", 
-                             ParagraphStyle('BarcodeLabel', parent=styles['Normal'], fontSize=10,
-                                          fontName='Courier-Bold',
-                                          textColor=colors.HexColor('#0F172A'), spaceAfter=10))
-    story.append(barcode_label)
+    story.append(Paragraph(f"<b>UHID Barcode: {patient_data['uhid']}</b>", template.barcode_label_style))
     story.append(Spacer(1, 0.1*inch))
     
     # Test Results Section
     for result in results_data:
-        story.append(Paragraph(f"TEST: {result['test_name']}", section_style))
+        story.append(Paragraph(f"TEST: {result['test_name']}", template.section_style))
         
-        # Results table
+        # Results table with colour-coded rows
         result_data = [['Parameter', 'Result', 'Unit', 'Reference Range', 'Status']]
-        
-        for param in result['parameters']:
-            # Color coding for values
-            status_text = param['status'].upper()
-            if param['status'] == 'critical':
-                status_text = '*** CRITICAL ***'
-            elif param['status'] == 'high':
-                status_text = 'HIGH'
-            elif param['status'] == 'low':
-                status_text = 'LOW'
-            else:
-                status_text = 'NORMAL'
-            
+        table_style = list(template.result_table_commands)
+        for i, param in enumerate(result['parameters'], start=1):
             result_data.append([
                 param['parameter_name'],
                 param['value'],
                 param['unit'],
                 param['ref_range'],
-                status_text
+                REPORT_STATUS_LABELS.get(param['status'], 'NORMAL')
             ])
+            table_style.extend(template.result_row_commands(i, param['status']))
         
         result_table = Table(result_data, colWidths=[2.2*inch, 1.1*inch, 0.9*inch, 1.6*inch, 1*inch])
-        
-        # Apply styles
-        table_style = [
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#0F172A')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('ALIGN', (1, 1), (1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('FONTSIZE', (0, 1), (-1, -1), 9),
-            ('TOPPADDING', (0, 0), (-1, -1), 8),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#E2E8F0'))
-        ]
-        
-        # Apply color coding to rows
-        for i, param in enumerate(result['parameters'], start=1):
-            if param['status'] == 'critical':
-                table_style.extend([
-                    ('BACKGROUND', (0, i), (-1, i), colors.HexColor('#FEF2F2')),
-                    ('TEXTCOLOR', (1, i), (1, i), colors.HexColor('#DC2626')),
-                    ('TEXTCOLOR', (4, i), (4, i), colors.HexColor('#DC2626')),
-                    ('FONTNAME', (1, i), (1, i), 'Helvetica-Bold'),
-                    ('FONTNAME', (4, i), (4, i), 'Helvetica-Bold'),
-                ])
-            elif param['status'] == 'high':
-                table_style.extend([
-                    ('TEXTCOLOR', (1, i), (1, i), colors.HexColor('#DC2626')),
-                    ('TEXTCOLOR', (4, i), (4, i), colors.HexColor('#DC2626')),
-                    ('FONTNAME', (1, i), (1, i), 'Helvetica-Bold'),
-                ])
-            elif param['status'] == 'low':
-                table_style.extend([
-                    ('TEXTCOLOR', (1, i), (1, i), colors.HexColor('#2563EB')),
-                    ('TEXTCOLOR', (4, i), (4, i), colors.HexColor('#2563EB')),
-                    ('FONTNAME', (1, i), (1, i), 'Helvetica-Bold'),
-                ])
-        
         result_table.setStyle(TableStyle(table_style))
         story.append(result_table)
         
         # Interpretation if present
         if result.get('interpretation'):
             story.append(Spacer(1, 0.1*inch))
-            interp_style = ParagraphStyle('Interpretation', parent=styles['Normal'], 
-                                          fontSize=9, textColor=colors.HexColor('#475569'),
-                                          leftIndent=10)
-            story.append(Paragraph(f"<b>Interpretation:</b> {result['interpretation']}", interp_style))
+            story.append(Paragraph(f"<b>Interpretation:</b> {result['interpretation']}", template.interpretation_style))
         
         story.append(Spacer(1, 0.2*inch))
     
     # QR Code Information Box
     story.append(Spacer(1, 0.2*inch))
-    qr_info_style = ParagraphStyle('QRInfo', parent=styles['Normal'], fontSize=8,
-                                   textColor=colors.HexColor('#64748B'), leftIndent=5,
-                                   rightIndent=5, spaceAfter=5)
-    
     qr_info_data = [[
         Paragraph("<b>Report Verification:</b><br/>Scan the QR code above to verify this report's authenticity. "
-                 f"Verification Hash: <font name='Courier'>{qr_data['verification_hash']}</font>", qr_info_style)
+                 f"Verification Hash: <font name='Courier'>{qr_data['verification_hash']}</font>", template.qr_info_style)
     ]]
     qr_info_table = Table(qr_info_data, colWidths=[6.8*inch])
-    qr_info_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#F1F5F9')),
-        ('BOX', (0, 0), (-1, -1), 1, colors.HexColor('#0ea5e9')),
-        ('TOPPADDING', (0, 0), (-1, -1), 8),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ('LEFTPADDING', (0, 0), (-1, -1), 10),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 10)
-    ]))
+    qr_info_table.setStyle(template.qr_info_table_style)
     story.append(qr_info_table)
     
     # Footer with signatures
@@ -1319,29 +4249,386 @@ def generate_pdf_report(patient_data, sample_data, results_data):
         ['_____________________', '_____________________'],
         ['Lab Technician', 'Pathologist'],
         ['', ''],
-        ['Note: This is a digitally generated report from ABC Hospital NABL-accredited laboratory.', ''],
+        [template.footer_note, ''],
         [f'Report ID: {result_id[:8].upper()}', f'Generated: {datetime.now(timezone.utc).strftime("%d-%b-%Y %I:%M %p UTC")}']
     ]
     
     footer_table = Table(footer_data, colWidths=[3.4*inch, 3.4*inch])
-    footer_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (0, -3), 'LEFT'),
-        ('ALIGN', (1, 0), (1, -3), 'RIGHT'),
-        ('FONTSIZE', (0, 0), (-1, -1), 8),
-        ('TEXTCOLOR', (0, 0), (-1, -2), colors.HexColor('#0F172A')),
-        ('TEXTCOLOR', (0, -1), (-1, -1), colors.HexColor('#64748B')),
-        ('FONTNAME', (0, 1), (-1, 2), 'Helvetica-Bold'),
-        ('SPAN', (0, -2), (-1, -2)),
-    ]))
+    footer_table.setStyle(template.footer_table_style)
     story.append(footer_table)
+    return story
+
+def generate_report_document(reports, template_name: Optional[str] = None) -> BytesIO:
+    """
+    Render several reports - (patient_data, sample_data, results_data) tuples - into one PDF,
+    each starting on a new page, using a precompiled letterhead template.
+    """
+    template = get_report_template(template_name)
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=0.5*inch, bottomMargin=0.5*inch, 
+                          leftMargin=0.75*inch, rightMargin=0.75*inch)
+    story = []
+    for index, (patient_data, sample_data, results_data) in enumerate(reports):
+        if index:
+            story.append(PageBreak())
+        story.extend(build_report_story(patient_data, sample_data, results_data, template))
     
     # Build PDF
     doc.build(story)
     buffer.seek(0)
     return buffer
 
+def generate_pdf_report(patient_data, sample_data, results_data, template_name: Optional[str] = None):
+    """Generate PDF report with hospital letterhead, QR code and barcode"""
+    return generate_report_document([(patient_data, sample_data, results_data)], template_name)
+
+# ==================== SAMPLE LABELS ====================
+
+LABEL_COLUMNS = 3
+LABEL_ROWS = 10
+
+def generate_label_sheet(labels: List[Dict[str, Any]]) -> BytesIO:
+    """Tube labels on A4 sheets; barcodes are ReportLab vector Code128, no image rendering"""
+    buffer = BytesIO()
+    sheet = canvas.Canvas(buffer, pagesize=A4)
+    page_width, page_height = A4
+    label_width = page_width / LABEL_COLUMNS
+    label_height = page_height / LABEL_ROWS
+    per_page = LABEL_COLUMNS * LABEL_ROWS
+    
+    for index, label in enumerate(labels):
+        if index and index % per_page == 0:
+            sheet.showPage()
+        slot = index % per_page
+        x = (slot % LABEL_COLUMNS) * label_width
+        y = page_height - (slot // LABEL_COLUMNS + 1) * label_height
+        
+        sheet.setFont('Helvetica-Bold', 7)
+        sheet.drawString(x + 4*mm, y + label_height - 5*mm, label['patient_name'][:32])
+        sheet.setFont('Helvetica', 6)
+        sheet.drawString(x + 4*mm, y + label_height - 8.5*mm, f"{label['uhid']} | {label['sample_id']} | {label['sample_type']}")
+        
+        code = code128.Code128(label['barcode'], barHeight=9*mm, barWidth=0.28*mm, humanReadable=True, fontSize=6)
+        code.drawOn(sheet, x + (label_width - code.width) / 2, y + 4*mm)
+    
+    sheet.save()
+    buffer.seek(0)
+    return buffer
+
+def render_label_sheet_pdf(labels: List[Dict[str, Any]]) -> bytes:
+    """Process-pool entry point: render a label sheet and return the PDF bytes"""
+    return generate_label_sheet(labels).getvalue()
+
+def render_report_pdf(patient_data, sample_data, results_data, template_name: Optional[str] = None) -> bytes:
+    """Process-pool entry point: render a report and return the PDF bytes"""
+    return generate_pdf_report(patient_data, sample_data, results_data, template_name).getvalue()
+
+def render_report_document_pdf(reports, template_name: Optional[str] = None) -> bytes:
+    """Process-pool entry point: render many reports into one PDF and return the bytes"""
+    return generate_report_document(reports, template_name).getvalue()
+
+def _init_report_worker():
+    """Warm a report worker: templates are compiled on import; load the base fonts too"""
+    get_report_template()
+    for font_name in ('Helvetica', 'Helvetica-Bold', 'Courier', 'Courier-Bold'):
+        pdfmetrics.getFont(font_name)
+
+def _report_worker_ready() -> bool:
+    return True
+
+class ReportRenderer:
+    """
+    Renders PDF reports in a process pool so ReportLab layout, QR generation and PNG
+    encoding never run on the event loop. At most `workers` renders run at once; further
+    requests queue up to `max_queue` and are refused with 503 beyond that. A render that
+    times out keeps its slot until the worker actually finishes it, so timeouts never
+    let more than `workers` renders run.
+    """
+
+    def __init__(self, workers: int = REPORT_WORKERS, timeout: float = REPORT_RENDER_TIMEOUT,
+                 max_queue: int = REPORT_MAX_QUEUE):
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.max_queue = max_queue
+        self.executor = None
+        self.semaphore = asyncio.Semaphore(self.workers)
+        self.waiting = 0
+        self.in_flight = 0
+        self.rendered = 0
+        self.timeouts = 0
+        self.abandoned = 0  # timed-out renders still running in a worker
+        self.rejected = 0
+        self.total_render_ms = 0.0
+        self.max_render_ms = 0.0
+
+    def start(self):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_report_worker
+            )
+            # Start every worker now so the first downloads don't pay process start-up
+            for _ in range(self.workers):
+                self.executor.submit(_report_worker_ready)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    async def render(self, patient_data, sample_data, results_data, template_name: Optional[str] = None) -> bytes:
+        return await self._run(render_report_pdf, (patient_data, sample_data, results_data, template_name), self.timeout)
+
+    async def render_document(self, reports, template_name: Optional[str] = None) -> bytes:
+        # A batch gets one timeout per 10 reports instead of a single report's budget
+        return await self._run(render_report_document_pdf, (reports, template_name),
+                               self.timeout * max(1, len(reports) // 10))
+
+    async def render_labels(self, labels: List[Dict[str, Any]]) -> bytes:
+        return await self._run(render_label_sheet_pdf, (labels,), self.timeout)
+
+    async def _run(self, fn, args: tuple, timeout: float) -> bytes:
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Report renderer is busy, please retry")
+        self.start()
+        self.waiting += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        started = time.perf_counter()
+        try:
+            future = asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        except BaseException:
+            self._finished(started)
+            raise
+        # The slot is released when the worker is done, not when the caller stops waiting
+        future.add_done_callback(lambda done: self._finished(started, done))
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            self.abandoned += 1
+            future.add_done_callback(self._abandoned_done)
+            raise HTTPException(status_code=504, detail="Report rendering timed out")
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM) - replace the pool for the next request
+            self.shutdown()
+            raise HTTPException(status_code=503, detail="Report renderer restarted, please retry")
+
+    def _finished(self, started: float, future: asyncio.Future = None):
+        if future is not None and not future.cancelled():
+            future.exception()  # retrieved here so an abandoned render's error is not logged as unhandled
+        elapsed = (time.perf_counter() - started) * 1000
+        self.in_flight -= 1
+        self.rendered += 1
+        self.total_render_ms += elapsed
+        self.max_render_ms = max(self.max_render_ms, elapsed)
+        self.semaphore.release()
+
+    def _abandoned_done(self, future: asyncio.Future):
+        self.abandoned -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "queue_depth": self.waiting,
+            "in_flight": self.in_flight,
+            "rendered": self.rendered,
+            "timeouts": self.timeouts,
+            "abandoned": self.abandoned,
+            "rejected": self.rejected,
+            "avg_render_ms": round(self.total_render_ms / (self.rendered or 1), 3),
+            "max_render_ms": round(self.max_render_ms, 3)
+        }
+
+report_renderer = ReportRenderer()
+
+def report_cache_key(patient_data, sample_data, results_data, template_name: Optional[str] = None) -> str:
+    """Hash of exactly the content a report prints, plus the template and its version"""
+    content = {
+        "template": get_report_template(template_name).cache_tag,
+        "patient": {k: patient_data.get(k) for k in ("uhid", "name", "age", "gender", "phone")},
+        "sample": {k: sample_data.get(k) for k in ("sample_id", "sample_type", "collection_date")},
+        "results": [{k: r.get(k) for k in ("id", "test_name", "parameters", "interpretation")} for r in results_data]
+    }
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+def report_document_cache_key(reports, template_name: Optional[str] = None) -> str:
+    if len(reports) == 1:
+        return report_cache_key(*reports[0], template_name)
+    keys = "".join(report_cache_key(*report, template_name) for report in reports)
+    return hashlib.sha256(keys.encode()).hexdigest()
+
+class ReportCache:
+    """
+    Content-addressed disk store of rendered reports, evicted LRU by total bytes.
+    Keys change whenever the printed content changes, so an entry can never be stale;
+    invalidate_result() only frees the space of a result's superseded reports early.
+    get() and put() pin the entry until release(): a file being served is removed
+    from the index when evicted, but only deleted from disk once the response is done.
+    """
+
+    def __init__(self, directory: Path = REPORT_CACHE_DIR, max_bytes: int = REPORT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict = OrderedDict()  # key -> size, least recently used first
+        self._by_result: Dict[str, set] = {}
+        self._serving: Dict[str, int] = {}  # key -> responses still sending the file
+        self._doomed: set = set()  # dropped while being served; unlinked on the last release
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.bytes_served = 0
+
+    def load(self):
+        """Index reports already on disk, oldest access first"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._entries.clear()
+        self.total_bytes = 0
+        for leftover in self.directory.glob("*.tmp"):
+            leftover.unlink(missing_ok=True)
+        files = sorted(self.directory.glob("*.pdf"), key=lambda p: p.stat().st_atime)
+        for path in files:
+            size = path.stat().st_size
+            self._entries[path.stem] = size
+            self.total_bytes += size
+        self._evict()
+
+    def path(self, key: str) -> Path:
+        return self.directory / f"{key}.pdf"
+
+    def get(self, key: str) -> Optional[Path]:
+        size = self._entries.get(key)
+        path = self.path(key)
+        if size is None or not path.exists():
+            if size is not None:
+                self._drop(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        self.bytes_served += size
+        self._acquire(key)
+        return path
+
+    async def put(self, key: str, result_ids: List[str], pdf_bytes: bytes) -> Path:
+        path = self.path(key)
+        await asyncio.to_thread(self._write, path, pdf_bytes)
+        if key in self._entries:
+            self.total_bytes -= self._entries[key]
+        self._entries[key] = len(pdf_bytes)
+        self.total_bytes += len(pdf_bytes)
+        for result_id in result_ids:
+            self._by_result.setdefault(result_id, set()).add(key)
+        self.bytes_served += len(pdf_bytes)
+        self._doomed.discard(key)
+        self._acquire(key)
+        self._evict()
+        return path
+
+    def _write(self, path: Path, pdf_bytes: bytes):
+        # Concurrent misses on one key each replace the file whole
+        write_file_atomic(path, pdf_bytes)
+
+    def _acquire(self, key: str):
+        self._serving[key] = self._serving.get(key, 0) + 1
+
+    def release(self, key: str):
+        """Called when a response has finished sending the file returned by get() or put()"""
+        remaining = self._serving.get(key, 0) - 1
+        if remaining > 0:
+            self._serving[key] = remaining
+            return
+        self._serving.pop(key, None)
+        if key in self._doomed:
+            self._doomed.discard(key)
+            if key not in self._entries:
+                self.path(key).unlink(missing_ok=True)
+
+    def _drop(self, key: str):
+        self.total_bytes -= self._entries.pop(key, 0)
+        if key in self._serving:
+            self._doomed.add(key)
+        else:
+            self.path(key).unlink(missing_ok=True)
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            self._drop(next(iter(self._entries)))
+
+    def invalidate_result(self, result_id: str):
+        for key in self._by_result.pop(result_id, ()):
+            self._drop(key)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "serving": len(self._serving),
+            "total_bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "bytes_served": self.bytes_served
+        }
+
+report_cache = ReportCache()
+
+class CachedReportResponse(FileResponse):
+    """FileResponse that releases its report cache entry once sent (or if sending fails)"""
+
+    def __init__(self, path: Path, cache_key: str, **kwargs):
+        super().__init__(path, **kwargs)
+        self.cache_key = cache_key
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            report_cache.release(self.cache_key)
+
+async def serve_report_document(reports, filename: str, template_name: Optional[str] = None) -> FileResponse:
+    """Serve reports as one PDF from the report cache, rendering in the process pool on a miss"""
+    cache_key = report_document_cache_key(reports, template_name)
+    report_path = report_cache.get(cache_key)
+    if report_path is None:
+        if len(reports) == 1:
+            pdf_bytes = await report_renderer.render(*reports[0], template_name)
+        else:
+            pdf_bytes = await report_renderer.render_document(reports, template_name)
+        result_ids = [r['id'] for _, _, results in reports for r in results]
+        report_path = await report_cache.put(cache_key, result_ids, pdf_bytes)
+    return CachedReportResponse(report_path, cache_key, media_type='application/pdf', filename=filename)
+
+async def load_report_sources(results: List[Dict[str, Any]]) -> list:
+    """
+    Group results by sample and attach their samples and patients, fetched with one
+    $in query each. Returns (patient, sample, results) tuples in first-seen order.
+    """
+    by_sample: Dict[str, List[Dict[str, Any]]] = {}
+    for result in results:
+        by_sample.setdefault(result['sample_id'], []).append(decode_dates(result, "test_results"))
+    samples = await db.samples.find({"id": {"$in": list(by_sample)}}, {"_id": 0}).to_list(None)
+    samples = {sample['id']: decode_dates(sample, "samples") for sample in samples}
+    patient_ids = list({sample['patient_id'] for sample in samples.values()})
+    patients = await db.patients.find({"id": {"$in": patient_ids}}, {"_id": 0}).to_list(None)
+    patients = {patient['id']: decode_dates(patient, "patients") for patient in patients}
+    
+    reports = []
+    for sample_id, sample_results in by_sample.items():
+        sample = samples.get(sample_id)
+        patient = patients.get(sample['patient_id']) if sample else None
+        if sample and patient:
+            reports.append((patient, sample, sample_results))
+    return reports
+
 @api_router.get("/results/{result_id}/report")
-async def download_report(result_id: str, current_user: User = Depends(get_current_user)):
+async def download_report(result_id: str, template: str = None, current_user: User = Depends(get_current_user)):
     """Generate and download PDF report"""
     # Get result
     result = await db.test_results.find_one({"id": result_id}, {"_id": 0})
@@ -1358,30 +4645,97 @@ async def download_report(result_id: str, current_user: User = Depends(get_curre
     if not sample:
         raise HTTPException(status_code=404, detail="Sample not found")
     
-    # Convert datetime strings
-    if isinstance(result['created_at'], str):
-        result['created_at'] = datetime.fromisoformat(result['created_at'])
-    if isinstance(patient['created_at'], str):
-        patient['created_at'] = datetime.fromisoformat(patient['created_at'])
-    if isinstance(sample['collection_date'], str):
-        sample['collection_date'] = datetime.fromisoformat(sample['collection_date'])
+    # Normalise legacy ISO-string dates
+    decode_dates(result, "test_results")
+    decode_dates(patient, "patients")
+    decode_dates(sample, "samples")
     
-    # Generate PDF
-    pdf_buffer = generate_pdf_report(patient, sample, [result])
+    # Serve the cached PDF, rendering it in the report process pool on a miss
+    response = await serve_report_document([(patient, sample, [result])],
+                                           f'Report_{patient["uhid"]}_{sample["sample_id"]}.pdf', template)
     
     # Log action
     await log_audit(current_user, "DOWNLOAD_REPORT", "test_results", 
                    {"result_id": result_id, "patient_id": patient['id']})
     
-    # Return PDF as streaming response
-    pdf_buffer.seek(0)
-    return StreamingResponse(
-        pdf_buffer,
-        media_type='application/pdf',
-        headers={
-            'Content-Disposition': f'attachment; filename="Report_{patient["uhid"]}_{sample["sample_id"]}.pdf"'
-        }
-    )
+    return response
+
+@api_router.get("/samples/{sample_id}/report")
+async def download_sample_report(sample_id: str, template: str = None, current_user: User = Depends(get_current_user)):
+    """Cumulative report: every result of a sample rendered into one document"""
+    results = await db.test_results.find({"sample_id": sample_id}, {"_id": 0}).sort([("created_at", 1), ("id", 1)]).to_list(None)
+    if not results:
+        raise HTTPException(status_code=404, detail="No results found for sample")
+    
+    reports = await load_report_sources(results)
+    if not reports:
+        raise HTTPException(status_code=404, detail="Sample or patient not found")
+    patient, sample, _ = reports[0]
+    
+    response = await serve_report_document(reports, f'Report_{patient["uhid"]}_{sample["sample_id"]}.pdf', template)
+    
+    await log_audit(current_user, "DOWNLOAD_REPORT", "test_results",
+                   {"sample_id": sample_id, "result_ids": [r['id'] for r in results], "patient_id": patient['id']})
+    return response
+
+@api_router.get("/patients/{patient_id}/report")
+async def download_patient_report(patient_id: str, status: str = None, template: str = None,
+                                  current_user: User = Depends(get_current_user)):
+    """Cumulative report: all of a patient's results, one section per sample"""
+    query = {"patient_id": patient_id}
+    if status:
+        query["status"] = status
+    results = await db.test_results.find(query, {"_id": 0}).sort([("created_at", 1), ("id", 1)]).to_list(None)
+    if not results:
+        raise HTTPException(status_code=404, detail="No results found for patient")
+    
+    reports = await load_report_sources(results)
+    if not reports:
+        raise HTTPException(status_code=404, detail="Samples or patient not found")
+    patient = reports[0][0]
+    
+    response = await serve_report_document(reports, f'Cumulative_Report_{patient["uhid"]}.pdf', template)
+    
+    await log_audit(current_user, "DOWNLOAD_REPORT", "test_results",
+                   {"patient_id": patient_id, "result_ids": [r['id'] for r in results]})
+    return response
+
+@api_router.post("/reports/batch/approved")
+async def print_approved_reports(date: str = None, limit: int = 500, template: str = None,
+                                 current_user: User = Depends(get_current_user), request: Request = None):
+    """
+    Bulk print job: every result approved on `date` (YYYY-MM-DD, default today UTC),
+    rendered as one PDF with one report per sample. Styles and letterhead are built once.
+    """
+    try:
+        day = datetime.strptime(date, "%Y-%m-%d").replace(tzinfo=timezone.utc) if date else \
+            datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="date must be YYYY-MM-DD")
+    
+    # approved_at, not updated_at: a later edit must not move a result into or out of the day's print run
+    results = await db.test_results.find(
+        {"status": "approved", "approved_at": {"$gte": day, "$lt": day + timedelta(days=1)}}, {"_id": 0}
+    ).sort([("approved_at", 1), ("id", 1)]).limit(limit).to_list(limit)
+    if not results:
+        raise HTTPException(status_code=404, detail="No approved results for this date")
+    
+    reports = await load_report_sources(results)
+    response = await serve_report_document(reports, f'Approved_Reports_{day.strftime("%Y-%m-%d")}.pdf', template)
+    
+    await log_audit(current_user, "PRINT_REPORTS", "test_results",
+                   {"date": day.strftime("%Y-%m-%d"), "reports": len(reports), "results": len(results)}, request)
+    return response
+
+@api_router.get("/reports/renderer/stats")
+async def get_report_renderer_stats(current_user: User = Depends(get_current_user)):
+    """Queue depth, concurrency and render latency of the report process pool"""
+    return report_renderer.stats()
+
+@api_router.get("/reports/cache/stats")
+async def get_report_cache_stats(current_user: User = Depends(get_current_user)):
+    """Hit ratio and byte volume of the rendered-report cache"""
+    return report_cache.stats()
 
 # ==================== INCLUDE ROUTER ====================
 
@@ -1393,6 +4747,7 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 logging.basicConfig(
@@ -1401,6 +4756,28 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def startup_services():
+    # Index builds run in the background so a large build never delays startup
+    asyncio.create_task(ensure_indexes())
+    await seed_id_sequences()
+    await test_catalog.load()
+    audit_writer.start()
+    autoverifier.start()
+    await tat_monitor.load()
+    tat_monitor.start()
+    tat_rollup.start()
+    dashboard_counters.start()
+    report_renderer.start()
+    report_cache.load()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await autoverifier.stop()
+    await tat_monitor.stop()
+    await tat_rollup.stop()
+    await dashboard_counters.stop()
+    await audit_writer.stop()
+    password_hasher.shutdown()
+    report_renderer.shutdown()
     client.close()
\ No newline at end of file
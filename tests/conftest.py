@@ -0,0 +1,78 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+# server.py reads these at import time; the tests swap its collections for in-memory ones
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "lis_test")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402  (needs the environment and path above)
+
+
+@pytest.fixture
+def api_user():
+    return server.User(email="qa@example.com", name="QA", role="admin")
+
+
+@pytest.fixture
+def api_client(api_user):
+    """The app without its startup tasks, authenticated as api_user"""
+    server.app.dependency_overrides[server.get_current_user] = lambda: api_user
+    try:
+        yield TestClient(server.app)
+    finally:
+        server.app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def lab_db(monkeypatch):
+    """A fresh in-memory database, with server.db and the subsystems that hold collections pointed at it"""
+    database = AsyncMongoMockClient()["lis_test"]
+    monkeypatch.setattr(server, "db", database)
+    subsystems = {
+        "audit_writer": server.AuditLogWriter(database.audit_logs),
+        "id_sequencer": server.IDSequencer(database.counters),
+        "dashboard_counters": server.DashboardCounters(database.dashboard_counters, database),
+        "tat_monitor": server.TATMonitor(database.samples, database.tat_breaches),
+        "delta_checker": server.DeltaChecker(database.delta_index),
+        "test_catalog": server.TestCatalog(database.test_configs, database.counters),
+        "qc_engine": server.QCEngine(database.qc_entries, database.qc_series),
+        "autoverifier": server.AutoVerifier(database.test_results, database.qc_entries),
+        "tat_rollup": server.TATRollup(database.test_results, database.samples, database.tat_rollups),
+    }
+    for name, subsystem in subsystems.items():
+        monkeypatch.setattr(server, name, subsystem)
+    return database
+
+
+CATALOG = [
+    {"test_code": "CBC001", "test_name": "Complete Blood Count", "category": "Hematology", "price": 300, "tat_hours": 4,
+     "sample_type": "Blood", "parameters": [
+         {"parameter_name": "Hemoglobin", "unit": "g/dL", "ref_range_male": "13.0-17.0", "ref_range_female": "12.0-15.5",
+          "ref_range_child": "11.0-14.0", "critical_low": 7.0, "critical_high": 20.0, "delta_abs": 2.0},
+         {"parameter_name": "WBC", "unit": "10^3/uL", "ref_range_male": "4.0-11.0", "ref_range_female": "4.0-11.0"},
+     ]},
+    {"test_code": "GLU001", "test_name": "Blood Glucose Fasting", "category": "Biochemistry", "price": 80, "tat_hours": 2,
+     "sample_type": "Blood", "parameters": [
+         {"parameter_name": "Glucose", "unit": "mg/dL", "ref_range_male": "70-110", "ref_range_female": "70-110",
+          "critical_low": 40.0, "critical_high": 400.0, "delta_percent": 50.0},
+     ]},
+]
+
+
+@pytest.fixture
+def catalog(lab_db):
+    """lab_db with CATALOG in test_configs and loaded into server.test_catalog"""
+    async def load():
+        await lab_db.test_configs.insert_many([server.TestConfig(**test).model_dump() for test in CATALOG])
+        await server.test_catalog.load()
+
+    asyncio.run(load())
+    return server.test_catalog
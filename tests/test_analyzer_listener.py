@@ -0,0 +1,152 @@
+import asyncio
+
+import pytest
+
+import analyzer_listener
+import server
+from analyzer_listener import ACK, ENQ, EOT, NAK, ASTMReceiver, ResultIngestor, hl7_ack, parse_astm, parse_hl7
+from analyzer_simulator import astm_frames
+
+ASTM_TEXT = "\r".join([
+    "H|\\^&|||XN-1000^00-21|||||||P|1|20250101120000",
+    "P|1",
+    "O|1|000100000001^01^5||^^^HGB\\^^^WBC|R||||||N",
+    "R|1|^^^HGB|14.2|g/dL|13.0-17.0|N||F||||20250101120000",
+    "R|2|^^^WBC^1|12.5|10^3/uL|4.0-11.0|H||F",
+    "R|3|^^^PLT||||||X",
+    "L|1|N",
+]) + "\r"
+
+HL7_TEXT = "\r".join([
+    "MSH|^~\\&|COBAS|LAB|LIS|HOSPITAL|20250101120000||ORU^R01|4711|P|2.3.1",
+    "PID|1",
+    "OBR|1|PLACER|000100000002|PANEL",
+    "OBX|1|NM|GLU^Glucose||182|mg/dL|70-110|HH|||F",
+    "OBX|2|NM|CREA^Creatinine||1.1|mg/dL|0.6-1.2||||D",
+]) + "\r"
+
+
+def test_parse_astm():
+    [message] = parse_astm(ASTM_TEXT)
+    assert message['instrument'] == "XN-1000"
+    assert message['results'] == [
+        {"barcode": "000100000001", "code": "HGB", "value": "14.2", "unit": "g/dL", "ref_range": "13.0-17.0", "flag": "N"},
+        {"barcode": "000100000001", "code": "WBC", "value": "12.5", "unit": "10^3/uL", "ref_range": "4.0-11.0", "flag": "H"},
+    ]
+
+
+def test_parse_astm_takes_delimiters_from_each_header():
+    other_delimiters = ASTM_TEXT.replace("|", "!").replace("^", "@")
+    messages = parse_astm(other_delimiters + ASTM_TEXT)
+    assert [message['instrument'] for message in messages] == ["XN-1000", "XN-1000"]
+    assert [(r['barcode'], r['code'], r['value']) for r in messages[0]['results']] == \
+           [(r['barcode'], r['code'], r['value']) for r in messages[1]['results']]
+
+
+def test_parse_hl7():
+    message = parse_hl7(HL7_TEXT)
+    assert (message['control_id'], message['instrument']) == ("4711", "COBAS")
+    assert message['results'] == [
+        {"barcode": "000100000002", "code": "GLU", "value": "182", "unit": "mg/dL", "ref_range": "70-110", "flag": "HH"},
+    ]
+
+
+def test_parse_hl7_rejects_a_message_without_msh():
+    with pytest.raises(ValueError):
+        parse_hl7("PID|1\rOBX|1|NM|GLU||5|||||F\r")
+
+
+def test_hl7_ack():
+    msh, msa = hl7_ack(parse_hl7(HL7_TEXT), "AE", "No result matched").rstrip("\r").split("\r")
+    fields = msh.split("|")
+    assert (fields[4], fields[5], fields[8], fields[9], fields[11]) == ("COBAS", "LAB", "ACK^R01", "ACK4711", "2.3.1")
+    assert msa == "MSA|AE|4711|No result matched"
+    assert hl7_ack(None, "AR").rstrip("\r").split("\r")[1] == "MSA|AR|"
+
+
+def test_astm_receiver_reassembles_frames_split_across_reads():
+    receiver = ASTMReceiver()
+    stream = ENQ + b"".join(astm_frames(ASTM_TEXT, size=40)) + EOT
+    replies, transmissions = b"", []
+    for start in range(0, len(stream), 7):
+        reply, done = receiver.feed(stream[start:start + 7])
+        replies += reply
+        transmissions += done
+    assert replies == ACK * (1 + len(astm_frames(ASTM_TEXT, size=40)))
+    assert transmissions == [ASTM_TEXT]
+
+
+def test_astm_receiver_keeps_a_retransmitted_frame_once():
+    first, second, third = astm_frames(ASTM_TEXT, size=len(ASTM_TEXT) // 3 + 1)
+    receiver = ASTMReceiver()
+    replies = b""
+    # The ACK for frame 2 was lost, so the analyzer sends it again
+    for chunk in (ENQ, first, second, second, third, EOT):
+        reply, transmissions = receiver.feed(chunk)
+        replies += reply
+    assert replies == ACK * 5
+    assert transmissions == [ASTM_TEXT]
+    assert receiver.repeated == 1
+
+
+def test_astm_receiver_naks_bad_checksums_and_skipped_frames():
+    first, second, third = astm_frames(ASTM_TEXT, size=len(ASTM_TEXT) // 3 + 1)
+    corrupt = first[:-4] + (b"00" if first[-4:-2] != b"00" else b"01") + b"\r\n"
+    receiver = ASTMReceiver()
+    assert receiver.feed(ENQ + corrupt)[0] == ACK + NAK
+    assert receiver.feed(first + third)[0] == ACK + NAK
+    replies, transmissions = receiver.feed(second + third + EOT)
+    assert replies == ACK + ACK
+    assert transmissions == [ASTM_TEXT]
+
+
+@pytest.fixture
+def ingestor(catalog, lab_db, monkeypatch):
+    """A ResultIngestor on lab_db, with one patient and one received sample (barcode 000100000001)"""
+    for name in ("test_catalog", "delta_checker", "dashboard_counters"):
+        monkeypatch.setattr(analyzer_listener, name, getattr(server, name))
+    cbc = catalog.by_code("CBC001")
+
+    async def seed():
+        await lab_db.patients.insert_one({"id": "patient-1", "age": 40, "gender": "male"})
+        await lab_db.samples.insert_one({"id": "sample-1", "sample_id": "SMP100000001", "barcode": "000100000001",
+                                         "patient_id": "patient-1", "status": "received",
+                                         "tests": [{"test_id": cbc['id'], "test_name": cbc['test_name']}]})
+
+    asyncio.run(seed())
+    return ResultIngestor(lab_db, analyzer_listener.AnalyzerCodeMap({"HGB": {"test_code": "CBC001", "parameter": "Hemoglobin"},
+                                                                     "WBC": {"test_code": "CBC001", "parameter": "WBC"}}))
+
+
+def hemoglobin(value: str):
+    return [{"barcode": "000100000001", "code": "HGB", "value": value, "unit": "", "ref_range": "", "flag": ""}]
+
+
+def test_repeated_messages_update_one_draft_result(ingestor, lab_db):
+    async def scenario():
+        stored = [await ingestor.write([("XN-1000", hemoglobin("14.0"), None)]) for _ in range(2)]
+        stored.append(await ingestor.write([("XN-1000", hemoglobin("14.5"), None), ("XN-1000", hemoglobin("14.6"), None)]))
+        return stored, await lab_db.test_results.find({}, {"_id": 0}).to_list(None), await lab_db.samples.find_one({"id": "sample-1"})
+
+    stored, results, sample = asyncio.run(scenario())
+    assert stored == [[1], [1], [1, 1]]
+    [result] = results
+    assert result['status'] == "draft"
+    assert [(p['parameter_name'], p['value']) for p in result['parameters']] == [("Hemoglobin", "14.6")]
+    assert sample['status'] == "under_validation"
+
+
+def test_results_that_are_not_stored_leave_the_delta_history_alone(ingestor, lab_db):
+    async def scenario():
+        await ingestor.write([("XN-1000", hemoglobin("14.0"), None)])
+        await lab_db.test_results.update_one({}, {"$set": {"status": "approved"}})
+        before = await lab_db.delta_index.find_one({"_id": "patient-1"})
+        locked = await ingestor.write([("XN-1000", hemoglobin("9.0"), None)])
+        after = await lab_db.delta_index.find_one({"_id": "patient-1"})
+        return before, locked, after
+
+    before, locked, after = asyncio.run(scenario())
+    assert locked == [0]
+    assert ingestor.locked == 1
+    assert after == before
+    assert after['parameters'][server.DeltaChecker.key("Complete Blood Count", "Hemoglobin")]['value'] == 14.0
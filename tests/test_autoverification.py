@@ -0,0 +1,68 @@
+import asyncio
+
+import server
+
+CBC = "Complete Blood Count"
+
+
+def cbc_result(result_id: str, delta_failure: bool = False, test_name: str = CBC):
+    result = server.TestResult(id=result_id, sample_id=f"sample-{result_id}", patient_id="patient-1", test_name=test_name,
+                               entered_by="technician", has_delta_failures=delta_failure, parameters=[
+                                   {"parameter_name": "Hemoglobin", "value": "14.0", "unit": "g/dL", "ref_range": "13.0-17.0",
+                                    "status": "normal", "delta_flag": delta_failure, "previous_value": 9.0 if delta_failure else None},
+                               ])
+    return result.model_dump()
+
+
+def qc_run(test_name: str = CBC, measured: float = 14.0):
+    return {"test_name": test_name, "qc_type": "internal", "level": "L1", "lot_number": "LOT-1",
+            "parameter": "Hemoglobin", "target_value": 14.0, "measured_value": measured}
+
+
+def decisions(database):
+    async def read():
+        return {doc['id']: (doc['status'], (doc.get('autoverification') or {}).get('reasons'))
+                async for doc in database.test_results.find({}, {"_id": 0})}
+
+    return asyncio.run(read())
+
+
+def test_result_held_only_for_qc_is_approved_once_qc_passes(lab_db, api_client):
+    asyncio.run(lab_db.test_results.insert_many([cbc_result("qc-only"), cbc_result("other-test", test_name="Lipid Profile")]))
+    asyncio.run(server.autoverifier.sweep())
+    assert decisions(lab_db) == {"qc-only": ("draft", ["qc"]), "other-test": ("draft", ["qc"])}
+
+    assert api_client.post("/api/qc", json=qc_run()).json()['status'] == "pass"
+    assert server.autoverifier.released == 1
+    asyncio.run(server.autoverifier.sweep())
+    assert decisions(lab_db) == {"qc-only": ("approved", []), "other-test": ("draft", ["qc"])}
+
+
+def test_result_held_for_qc_and_a_delta_failure_stays_held(lab_db, api_client):
+    asyncio.run(lab_db.test_results.insert_one(cbc_result("qc-and-delta", delta_failure=True)))
+    asyncio.run(server.autoverifier.sweep())
+    assert decisions(lab_db) == {"qc-and-delta": ("draft", ["delta", "qc"])}
+
+    api_client.post("/api/qc", json=qc_run())
+    assert server.autoverifier.released == 0
+    assert asyncio.run(server.autoverifier.sweep())['evaluated'] == 0
+    assert decisions(lab_db) == {"qc-and-delta": ("draft", ["delta", "qc"])}
+
+
+def test_failed_qc_releases_nothing(lab_db, api_client):
+    asyncio.run(lab_db.test_results.insert_one(cbc_result("qc-only")))
+    asyncio.run(server.autoverifier.sweep())
+    assert api_client.post("/api/qc", json=qc_run(measured=20.0)).json()['status'] == "fail"
+    assert server.autoverifier.released == 0
+    assert decisions(lab_db) == {"qc-only": ("draft", ["qc"])}
+
+
+def test_holds_of_another_rules_version_are_released(lab_db):
+    asyncio.run(lab_db.test_results.insert_many([cbc_result("held-under-v1"), cbc_result("delta", delta_failure=True)]))
+    asyncio.run(server.autoverifier.sweep())
+    assert asyncio.run(server.autoverifier.release_stale_holds()) == 0
+
+    server.autoverifier.rules = server.AutoVerificationRules(require_qc=False, version="2")
+    assert asyncio.run(server.autoverifier.release_stale_holds()) == 2
+    asyncio.run(server.autoverifier.sweep())
+    assert decisions(lab_db) == {"held-under-v1": ("approved", []), "delta": ("draft", ["delta"])}
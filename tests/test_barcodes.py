@@ -0,0 +1,28 @@
+import server
+
+
+def test_render_barcode_is_served_from_memory_on_repeat(monkeypatch, tmp_path):
+    monkeypatch.setattr(server, "BARCODE_CACHE_DIR", str(tmp_path))
+    server.render_barcode.cache_clear()
+    first = server.render_barcode("000100000001", "svg")
+    (tmp_path / next(tmp_path.iterdir()).name).unlink()  # a disk read would now re-render and re-write it
+    second = server.render_barcode("000100000001", "svg")
+
+    info = server.render_barcode.cache_info()
+    assert second == first
+    assert (info.hits, info.misses) == (1, 1)
+    assert list(tmp_path.iterdir()) == []
+    assert not hasattr(server.write_file_atomic, "cache_info")
+
+
+def test_barcode_cache_stats_endpoint(monkeypatch, api_client):
+    monkeypatch.setattr(server, "BARCODE_CACHE_DIR", None)
+    server.render_barcode.cache_clear()
+    server.render_barcode("000100000002", "png")
+    server.render_barcode("000100000002", "png")
+    response = api_client.get("/api/barcodes/cache/stats")
+
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["hits"], body["misses"], body["size"]) == (1, 1, 1)
+    assert body["maxsize"] == server.BARCODE_CACHE_SIZE
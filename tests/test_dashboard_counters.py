@@ -0,0 +1,49 @@
+import asyncio
+
+import server
+
+
+def create_samples(api_client, catalog, count: int):
+    patient = api_client.post("/api/patients", json={"name": "Asha", "age": 34, "gender": "female", "phone": "9999999999",
+                                                      "patient_type": "OPD"}).json()
+    cbc = catalog.by_code("CBC001")
+    item = {"test_id": cbc['id'], "test_name": cbc['test_name'], "price": cbc['price'], "tat_hours": cbc['tat_hours']}
+    return patient, [api_client.post("/api/samples", json={"patient_id": patient['id'], "tests": [item], "sample_type": "Blood"}).json()
+                     for _ in range(count)]
+
+
+def test_incremental_counters_match_a_fresh_reconcile(catalog, lab_db, api_client):
+    patient, samples = create_samples(api_client, catalog, 5)
+    for sample, statuses in zip(samples, (["received", "processing"], ["received"], ["received", "processing", "approved"], [], [])):
+        for status in statuses:
+            assert api_client.put(f"/api/samples/{sample['id']}/status", json={"status": status}).status_code == 200
+    api_client.post(f"/api/samples/{samples[3]['id']}/reject", json={"rejection_reason": "Haemolysed"})
+
+    result_ids = []
+    for sample, value in zip(samples[:3], ("14.0", "5.0", "15.0")):
+        result_ids.append(api_client.post("/api/results", json={
+            "sample_id": sample['id'], "patient_id": patient['id'], "test_name": "Complete Blood Count",
+            "parameters": [{"parameter_name": "Hemoglobin", "value": value, "unit": "g/dL", "ref_range": ""}]}).json()['id'])
+    for result_id, statuses in zip(result_ids, (["under_review", "approved"], ["approved", "finalized"], [])):
+        for status in statuses:
+            assert api_client.put(f"/api/results/{result_id}", json={"status": status}).status_code == 200
+    # The second result was critical but is finalized; an edit makes the third one critical
+    api_client.put(f"/api/results/{result_ids[2]}", json={"parameters": [
+        {"parameter_name": "Hemoglobin", "value": "6.0", "unit": "g/dL", "ref_range": ""}]})
+
+    stored = asyncio.run(lab_db.dashboard_counters.find_one({"_id": server.DashboardCounters.KEY}))
+    assert stored['patients'] == 1
+    assert stored['samples']['status'] == {"collected": 1, "received": 1, "processing": 1, "approved": 1, "rejected": 1}
+    assert stored['results']['status'] == {"draft": 1, "under_review": 0, "approved": 1, "finalized": 1}
+    assert stored['results']['critical_open'] == 1
+
+    assert asyncio.run(server.dashboard_counters.reconcile()) == {}
+
+
+def test_reconcile_reports_and_corrects_drift(catalog, lab_db, api_client):
+    _, [sample] = create_samples(api_client, catalog, 1)
+    asyncio.run(lab_db.samples.update_one({"id": sample['id']}, {"$set": {"status": "received"}}))  # written without counters
+
+    assert asyncio.run(server.dashboard_counters.reconcile()) == {"samples.status.collected": -1, "samples.status.received": 1}
+    assert asyncio.run(server.dashboard_counters.reconcile()) == {}
+    assert api_client.get("/api/dashboard/stats").json()['samples_by_status']['received'] == 1
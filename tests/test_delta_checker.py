@@ -0,0 +1,96 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from pymongo.errors import PyMongoError
+
+import server
+
+CBC, GLUCOSE = "Complete Blood Count", "Blood Glucose Fasting"
+
+
+def parameter(name: str, value: str):
+    return {"parameter_name": name, "value": value, "unit": "", "ref_range": "", "status": "normal"}
+
+
+def run_checks(checks):
+    """(result_id, test_name, parameter, value, hours after the first) in order; returns (flagged, previous_value) per check"""
+    async def scenario():
+        start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        outcomes = []
+        for result_id, test_name, name, value, hours in checks:
+            parameters = [parameter(name, value)]
+            flagged, entries = await server.delta_checker.check("patient-1", result_id, test_name, parameters,
+                                                                start + timedelta(hours=hours))
+            await server.delta_checker.record("patient-1", entries)
+            outcomes.append((flagged, parameters[0]['previous_value']))
+        return outcomes
+
+    return asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("test_name, name, first, second, flagged", [
+    (CBC, "Hemoglobin", "14.0", "15.9", False),  # delta_abs 2.0
+    (CBC, "Hemoglobin", "14.0", "16.0", True),
+    (CBC, "Hemoglobin", "14.0", "12.0", True),
+    (GLUCOSE, "Glucose", "100", "149", False),  # delta_percent 50
+    (GLUCOSE, "Glucose", "100", "150", True),
+    (GLUCOSE, "Glucose", "100", "<50", True),
+])
+def test_delta_thresholds(catalog, test_name, name, first, second, flagged):
+    outcomes = run_checks([("r1", test_name, name, first, 0), ("r2", test_name, name, second, 1)])
+    assert outcomes[0] == (0, None)
+    assert outcomes[1] == ((1, float(first)) if flagged else (0, None))
+
+
+def test_previous_values_outside_the_window_are_not_compared(catalog):
+    window = server.DELTA_CHECK_WINDOW_HOURS
+    outcomes = run_checks([("r1", CBC, "Hemoglobin", "14.0", 0), ("r2", CBC, "Hemoglobin", "9.0", window + 1)])
+    assert outcomes[1] == (0, None)
+
+
+def test_an_edit_is_compared_with_the_result_before_it(catalog):
+    outcomes = run_checks([("r1", CBC, "Hemoglobin", "14.0", 0), ("r2", CBC, "Hemoglobin", "14.5", 1),
+                           ("r2", CBC, "Hemoglobin", "16.5", 2)])
+    assert outcomes[2] == (1, 14.0)
+
+
+def test_history_is_kept_per_test_and_parameter(catalog, lab_db):
+    async def add_anemia_profile():
+        await lab_db.test_configs.insert_one(server.TestConfig(
+            test_code="ANE001", test_name="Anemia.Profile", category="Hematology", price=500, tat_hours=6, sample_type="Blood",
+            parameters=[{"parameter_name": "Hemoglobin", "unit": "g/dL", "ref_range_male": "13-17",
+                         "ref_range_female": "12-15.5", "delta_abs": 2.0}]).model_dump())
+        await catalog.load()
+
+    asyncio.run(add_anemia_profile())
+    outcomes = run_checks([("r1", CBC, "Hemoglobin", "14.0", 0), ("r2", "Anemia.Profile", "Hemoglobin", "9.0", 1)])
+    assert outcomes[1] == (0, None)
+
+    history = asyncio.run(lab_db.delta_index.find_one({"_id": "patient-1"}))['parameters']
+    assert set(history) == {"complete blood count|hemoglobin", "anemia_profile|hemoglobin"}
+    assert server.DeltaChecker.key(" Anemia.Profile ", "$Hb") == "anemia_profile|_hb"
+
+
+def test_parameters_without_a_delta_rule_cost_no_write(catalog, lab_db):
+    outcomes = run_checks([("r1", CBC, "WBC", "5.0", 0), ("r2", CBC, "WBC", "15.0", 1)])
+    assert outcomes == [(0, None), (0, None)]
+    assert asyncio.run(lab_db.delta_index.count_documents({})) == 0
+
+
+def test_failed_result_insert_leaves_no_delta_history(catalog, lab_db, api_client, monkeypatch):
+    body = {"sample_id": "sample-1", "patient_id": "patient-1", "test_name": CBC,
+            "parameters": [{"parameter_name": "Hemoglobin", "value": "14.0", "unit": "g/dL", "ref_range": ""}]}
+
+    async def failing_insert(self, document, *args, **kwargs):
+        raise PyMongoError("insert failed")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(type(lab_db.test_results), "insert_one", failing_insert)
+        with pytest.raises(PyMongoError):
+            api_client.post("/api/results", json=body)
+    assert asyncio.run(lab_db.delta_index.count_documents({})) == 0
+
+    assert api_client.post("/api/results", json=body).status_code == 200
+    history = asyncio.run(lab_db.delta_index.find_one({"_id": "patient-1"}))['parameters']
+    assert history["complete blood count|hemoglobin"]['value'] == 14.0
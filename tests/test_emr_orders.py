@@ -0,0 +1,121 @@
+import asyncio
+
+import server
+
+
+def patient_details(emr_patient_id: str, phone: str):
+    return {"emr_patient_id": emr_patient_id, "name": f"Patient {emr_patient_id}", "age": 40, "gender": "male",
+            "phone": phone}
+
+
+def order(emr_order_id: str, **fields):
+    return {"emr_order_id": emr_order_id, "sample_type": "Blood", "test_codes": ["CBC001"], "ordered_by": "Dr. Rao",
+            **fields}
+
+
+def test_bulk_order_failures_are_isolated_per_order(catalog, lab_db, api_client):
+    asyncio.run(server.ensure_indexes(lab_db))
+    # Takes the sample ID the second accepted order would get, so only that insert fails
+    asyncio.run(lab_db.samples.insert_one({"id": "legacy", "sample_id": server.format_sample_id(2),
+                                           "barcode": "legacy"}))
+    orders = [
+        order("ORD-1", patient_details=patient_details("EMR-1", "9000000001")),
+        order("ORD-2", uhid="UHID999999"),
+        order("ORD-3", emr_patient_id="EMR-1", test_codes=["NOPE001"]),
+        order("ORD-4", emr_patient_id="EMR-1"),
+        order("ORD-5"),
+        order("ORD-6", emr_patient_id="EMR-1", test_codes=["GLU001", "NOPE001"]),
+        order("ORD-1", patient_details=patient_details("EMR-1", "9000000001")),
+    ]
+
+    response = api_client.post("/api/emr/lab-order/bulk", json={"orders": orders})
+    assert response.status_code == 200
+    body = response.json()
+    assert [(r['index'], r['emr_order_id'], r['status']) for r in body['results']] == [
+        (0, "ORD-1", "success"), (1, "ORD-2", "error"), (2, "ORD-3", "error"), (3, "ORD-4", "error"),
+        (4, "ORD-5", "error"), (5, "ORD-6", "success"), (6, "ORD-1", "success")]
+    assert [r.get('error') for r in body['results'][1:5]] == [
+        "Patient not found with given UHID", "No valid tests found for given test codes",
+        "Sample could not be created", "Patient information required"]
+    assert {key: body[key] for key in ("status", "total", "created", "replayed", "failed")} == {
+        "status": "partial", "total": 7, "created": 2, "replayed": 1, "failed": 4}
+
+    first, glucose, repeat = body['results'][0], body['results'][5], body['results'][6]
+    assert repeat == {**first, "index": 6, "replayed": True}
+    assert [t['test_name'] for t in glucose['tests']] == ["Blood Glucose Fasting"]
+    assert first['patient_id'] == glucose['patient_id']
+    assert asyncio.run(lab_db.patients.count_documents({})) == 1
+    stored = asyncio.run(lab_db.samples.find({"emr_order_id": {"$exists": True}}, {"_id": 0, "emr_order_id": 1}).to_list(None))
+    assert sorted(s['emr_order_id'] for s in stored) == ["ORD-1", "ORD-6"]
+
+
+def test_bulk_order_with_every_order_failing(catalog, lab_db, api_client):
+    body = api_client.post("/api/emr/lab-order/bulk", json={"orders": [order("ORD-1"), order("ORD-2", uhid="UHID0")]}).json()
+    assert (body['status'], body['created'], body['failed']) == ("failed", 0, 2)
+    assert asyncio.run(lab_db.samples.count_documents({})) == 0
+
+
+def test_bulk_order_limit(catalog, api_client, monkeypatch):
+    monkeypatch.setattr(server, "EMR_BULK_MAX_ORDERS", 2)
+    response = api_client.post("/api/emr/lab-order/bulk", json={"orders": [order(f"ORD-{i}") for i in range(3)]})
+    assert response.status_code == 400
+
+
+def test_retried_order_replays_the_stored_response(catalog, lab_db, api_client):
+    asyncio.run(server.ensure_indexes(lab_db))
+    payload = order("ORD-1", patient_details=patient_details("EMR-1", "9000000001"))
+    created = api_client.post("/api/emr/lab-order/create", json=payload).json()
+    retried = api_client.post("/api/emr/lab-order/create", json={**payload, "test_codes": ["GLU001"]}).json()
+
+    assert created['status'] == "success" and "replayed" not in created
+    assert retried == {**created, "replayed": True}
+    assert asyncio.run(lab_db.samples.count_documents({})) == 1
+    assert asyncio.run(lab_db.patients.count_documents({})) == 1
+
+    # The bulk route answers the same order from the same stored response
+    bulk = api_client.post("/api/emr/lab-order/bulk", json={"orders": [order("ORD-2", emr_patient_id="EMR-1"), payload]}).json()
+    assert (bulk['created'], bulk['replayed']) == (1, 1)
+    assert bulk['results'][1] == {**created, "index": 1, "replayed": True}
+    assert asyncio.run(lab_db.samples.count_documents({})) == 2
+
+
+def test_order_stored_before_snapshots_is_replayed_from_the_sample(catalog, lab_db, api_client):
+    created = api_client.post("/api/emr/lab-order/create", json=order(
+        "ORD-1", patient_details=patient_details("EMR-1", "9000000001"))).json()
+    asyncio.run(lab_db.samples.update_one({"emr_order_id": "ORD-1"}, {"$unset": {server.EMR_SNAPSHOT_FIELD: ""}}))
+
+    replayed = api_client.post("/api/emr/lab-order/create", json=order("ORD-1", emr_patient_id="EMR-1")).json()
+    # Rebuilt from the stored sample, whose deadline Mongo keeps to the millisecond
+    deadline = server.parse_datetime(created.pop('tat_deadline'))
+    assert server.parse_datetime(replayed.pop('tat_deadline')) == deadline.replace(microsecond=deadline.microsecond // 1000 * 1000)
+    assert replayed == {**created, "replayed": True}
+
+
+def test_order_losing_an_insert_race_returns_the_winner(catalog, lab_db, api_client, monkeypatch):
+    asyncio.run(server.ensure_indexes(lab_db))
+    winner = api_client.post("/api/emr/lab-order/create", json=order(
+        "ORD-1", patient_details=patient_details("EMR-1", "9000000001"))).json()
+    # The retry checks for a stored order before the first request has written it
+    original = server.emr_order_replays
+    checks = []
+
+    async def late_replays(ids):
+        checks.append(ids)
+        return {} if len(checks) == 1 else await original(ids)
+
+    monkeypatch.setattr(server, "emr_order_replays", late_replays)
+    retried = api_client.post("/api/emr/lab-order/create", json=order("ORD-1", emr_patient_id="EMR-1")).json()
+    assert retried == {**winner, "replayed": True}
+    assert len(checks) == 2
+    assert asyncio.run(lab_db.samples.count_documents({})) == 1
+
+
+def test_patient_registration_is_idempotent(lab_db, api_client):
+    asyncio.run(server.ensure_indexes(lab_db))
+    details = patient_details("EMR-7", "9000000007")
+    created = api_client.post("/api/emr/patient/register", json=details).json()
+    again = api_client.post("/api/emr/patient/register", json=details).json()
+
+    assert created['status'] == "created"
+    assert again == {**created, "status": "exists", "message": "Patient already registered"}
+    assert asyncio.run(lab_db.patients.count_documents({})) == 1
@@ -0,0 +1,63 @@
+import asyncio
+
+from mongomock_motor import AsyncMongoMockClient
+
+import server
+
+
+def fresh_db():
+    return AsyncMongoMockClient()["lis_test"]
+
+
+def test_concurrent_next_has_no_duplicates_or_gaps():
+    async def scenario():
+        counters = fresh_db().counters
+        # Two workers sharing one counters collection, small blocks to force many reservations
+        workers = [server.IDSequencer(counters, block_size=7), server.IDSequencer(counters, block_size=7)]
+        numbers = await asyncio.gather(*(workers[i % 2].next("samples") for i in range(1000)))
+        return numbers, workers, counters
+
+    numbers, workers, counters = asyncio.run(scenario())
+    assert len(set(numbers)) == len(numbers)
+    # Only the unused tail of each worker's current block may be missing
+    issued = sorted(numbers)
+    assert issued[0] == 1
+    unused = sum(block[1] - block[0] + 1 for worker in workers for block in worker._blocks.values())
+    assert issued[-1] - len(issued) <= unused
+
+
+def test_sample_ids_and_barcodes_are_unique(monkeypatch):
+    async def scenario():
+        monkeypatch.setattr(server, "id_sequencer", server.IDSequencer(fresh_db().counters, block_size=3))
+        pairs = await asyncio.gather(*(server.next_sample_ids() for _ in range(500)))
+        uhids = await asyncio.gather(*(server.next_uhid() for _ in range(500)))
+        return pairs, uhids
+
+    pairs, uhids = asyncio.run(scenario())
+    assert len({sample_id for sample_id, _ in pairs}) == 500
+    assert len({barcode for _, barcode in pairs}) == 500
+    assert len(set(uhids)) == 500
+
+
+def test_take_returns_consecutive_numbers_across_blocks():
+    async def scenario():
+        sequencer = server.IDSequencer(fresh_db().counters, block_size=4)
+        return [await sequencer.take("patients", count) for count in (3, 5, 1)]
+
+    assert asyncio.run(scenario()) == [[1, 2, 3], [4, 5, 6, 7, 8], [9]]
+
+
+def test_seed_uses_numeric_maximum(monkeypatch):
+    async def scenario():
+        database = fresh_db()
+        monkeypatch.setattr(server, "db", database)
+        monkeypatch.setattr(server, "id_sequencer", server.IDSequencer(database.counters))
+        await database.patients.insert_many([{"uhid": "UHID999999"}, {"uhid": "UHID1000000"}, {"uhid": "UHID000042"}])
+        await database.samples.insert_many([{"sample_id": "SMP99999999"}, {"sample_id": "SMP100000000"}])
+        await server.seed_id_sequences()
+        return await server.next_uhid(), await server.next_sample_ids()
+
+    uhid, (sample_id, barcode) = asyncio.run(scenario())
+    assert uhid == "UHID1000001"
+    assert sample_id == "SMP100000001"
+    assert barcode == "000100000001"
@@ -0,0 +1,51 @@
+import asyncio
+import os
+import uuid
+
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import server
+
+# explain() needs a real server; mongomock has no query planner
+TEST_MONGO_URL = os.environ.get("TEST_MONGO_URL")
+
+
+def leading_keys(index, count):
+    return [field for field, _ in list(index.document["key"].items())[:count]]
+
+
+def declared_index_can_serve(collection, query, sort):
+    """A declared index starts with a filtered field, or with the sort keys (either direction)"""
+    for index in server.INDEXES.get(collection, []):
+        keys = list(index.document["key"].items())
+        if keys[0][0] in query:
+            return True
+        if sort and len(keys) >= len(sort):
+            directions = [keys[i][1] * direction for i, (_, direction) in enumerate(sort)]
+            if leading_keys(index, len(sort)) == [field for field, _ in sort] and len(set(directions)) == 1:
+                return True
+    return False
+
+
+def test_every_query_shape_has_a_candidate_index():
+    unserved = [(collection, query, sort) for collection, query, sort in server.INDEX_QUERY_SHAPES
+                if not declared_index_can_serve(collection, query, sort)]
+    assert unserved == []
+
+
+@pytest.mark.skipif(not TEST_MONGO_URL, reason="set TEST_MONGO_URL to a MongoDB server to explain the query shapes")
+def test_no_query_shape_falls_back_to_collscan():
+    async def scenario():
+        client = AsyncIOMotorClient(TEST_MONGO_URL, tz_aware=True, serverSelectionTimeoutMS=5000)
+        database = client[f"lis_index_plans_{uuid.uuid4().hex[:8]}"]
+        try:
+            await server.ensure_indexes(database)
+            return await server.index_drift(database), await server.find_collscans(database)
+        finally:
+            await client.drop_database(database.name)
+            client.close()
+
+    drift, collscans = asyncio.run(scenario())
+    assert drift == {}
+    assert collscans == []
@@ -0,0 +1,71 @@
+import asyncio
+import random
+
+import numpy as np
+import pytest
+
+import server
+
+# z-score patterns that trip each Westgard rule, spliced into random in-control runs
+RULE_PATTERNS = {
+    "1-2s": [2.5],
+    "1-3s": [3.5],
+    "2-2s": [2.3, 2.4],
+    "R-4s": [2.5, -2.5],
+    "4-1s": [1.2, 1.5, 1.3, 1.1],
+    "10x": [0.5] * 10,
+}
+
+
+def generated_z_scores(seed: int = 20250101):
+    rng = random.Random(seed)
+    scores = []
+    for pattern in RULE_PATTERNS.values():
+        scores += [rng.gauss(0, 0.6) * (-1) ** i for i in range(6)]  # alternating signs break any streak
+        scores += pattern
+    return scores + [rng.gauss(0, 1) for _ in range(40)]
+
+
+def qc_run(z: float, target_sd=5.0, lot_number: str = "LOT-1"):
+    return server.QCEntryCreate(test_name="Blood Glucose Fasting", qc_type="internal", level="L1", lot_number=lot_number,
+                                parameter="Glucose", target_value=100.0, target_sd=target_sd, measured_value=100.0 + 5.0 * z)
+
+
+def record_all(runs):
+    async def scenario():
+        recorded = [await server.qc_engine.record(run, "qc-officer") for run in runs]
+        state = await server.db.qc_series.find_one({})
+        return recorded, state
+
+    return asyncio.run(scenario())
+
+
+def test_vectorised_reevaluation_matches_incremental_verdicts(lab_db):
+    recorded, incremental_state = record_all([qc_run(z) for z in generated_z_scores()])
+    entries = [entry.model_dump() for entry in recorded]
+
+    verdicts, state = server.qc_engine._judge_vectorised(entries)
+    assert verdicts == [(entry.z_score, entry.rules_violated, entry.status) for entry in recorded]
+    for rule in server.WESTGARD_RULES:
+        assert any(rule in entry.rules_violated for entry in recorded), f"series never trips {rule}"
+    assert state['n'] == incremental_state['n']
+    assert state['streaks'] == incremental_state['streaks']
+    assert state['mean'] == pytest.approx(incremental_state['mean'])
+    assert state['m2'] == pytest.approx(incremental_state['m2'])
+
+    outcome = asyncio.run(server.qc_engine.reevaluate("Blood Glucose Fasting", "Glucose", "L1", "LOT-1"))
+    assert outcome['changed'] == 0
+    assert outcome['entries'] == len(recorded)
+
+
+@pytest.mark.parametrize("target_sd", [5.0, None])
+def test_welford_statistics_match_numpy(lab_db, target_sd):
+    rng = random.Random(7)
+    recorded, state = record_all([qc_run(rng.gauss(0, 1.5), target_sd) for _ in range(200)])
+    accepted = np.array([entry.measured_value for entry in recorded if entry.status != "fail"])
+
+    assert state['n'] == len(accepted)
+    assert state['mean'] == pytest.approx(np.mean(accepted), rel=1e-12)
+    assert np.sqrt(state['m2'] / (state['n'] - 1)) == pytest.approx(np.std(accepted, ddof=1), rel=1e-9)
+    if target_sd is None:
+        assert any(entry.status == "fail" for entry in recorded)  # rejected runs were left out of the lot's SD
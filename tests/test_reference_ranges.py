@@ -0,0 +1,93 @@
+import math
+
+import numpy as np
+import pytest
+
+import server
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("13.0-17.0", (13.0, 17.0)),
+    ("13.0 - 17.0 g/dL", (13.0, 17.0)),
+    ("13.0–17.0", (13.0, 17.0)),
+    ("4 to 11", (4.0, 11.0)),
+    ("-2.5-2.5", (-2.5, 2.5)),
+    ("<200", (-math.inf, 200.0)),
+    ("< 200 mg/dL", (-math.inf, 200.0)),
+    ("<=5", (-math.inf, 5.0)),
+    ("≤ 5.0", (-math.inf, 5.0)),
+    ("Up to 40", (-math.inf, 40.0)),
+    (">60 mL/min", (60.0, math.inf)),
+    (">= 60", (60.0, math.inf)),
+    ("≥60", (60.0, math.inf)),
+    ("Negative", None),
+    ("Non-reactive", None),
+    ("", None),
+    (None, None),
+])
+def test_parse_reference_range(text, expected):
+    assert server.parse_reference_range(text) == expected
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("14.2", 14.2),
+    (" 14 ", 14.0),
+    ("<0.5", 0.5),
+    (">= 1000", 1000.0),
+    ("Positive", None),
+    ("nan", None),
+    (None, None),
+])
+def test_parse_result_value(value, expected):
+    assert server.parse_result_value(value) == expected
+
+
+# Hemoglobin: male 13.0-17.0, female 12.0-15.5, child 11.0-14.0, critical below 7.0 or above 20.0
+@pytest.mark.parametrize("value, age, gender, status", [
+    ("13.0", 40, "male", "normal"),
+    ("17.0", 40, "male", "normal"),
+    ("12.99", 40, "male", "low"),
+    ("17.01", 40, "male", "high"),
+    ("7.0", 40, "male", "low"),
+    ("6.99", 40, "male", "critical"),
+    ("20.0", 40, "male", "high"),
+    ("20.01", 40, "male", "critical"),
+    ("12.5", 40, "female", "normal"),
+    ("15.6", 40, "Female", "high"),
+    ("14.0", 12, "male", "normal"),
+    ("14.1", 12, "male", "high"),
+    ("10.9", 12, "female", "low"),
+    ("12.0", 40, None, "normal"),
+    ("17.0", 40, "other", "normal"),
+    ("11.9", 40, None, "low"),
+    ("<6", 40, "male", "critical"),
+])
+def test_hemoglobin_classification(catalog, value, age, gender, status):
+    result = {"patient_id": "p", "test_name": "Complete Blood Count",
+              "parameters": [{"parameter_name": "Hemoglobin", "value": value, "ref_range": "", "status": "normal"}]}
+    assert server.evaluate_results([result], {"p": {"id": "p", "age": age, "gender": gender}}) == 1
+    assert result['parameters'][0]['status'] == status
+
+
+def test_server_flags_override_client_flags_and_fill_blank_ranges(catalog):
+    result = {"patient_id": "p", "test_name": "Complete Blood Count", "parameters": [
+        {"parameter_name": "Hemoglobin", "value": "15.0", "ref_range": "", "status": "critical"},
+        {"parameter_name": "WBC", "value": "12.0", "ref_range": "4-11 (lab)", "status": "normal"},
+        {"parameter_name": "Hemoglobin", "value": "Clotted", "ref_range": "", "status": "low"},
+        {"parameter_name": "Reticulocytes", "value": "9.0", "ref_range": "0.5-2.5", "status": "high"},
+    ]}
+    assert server.evaluate_results([result], {"p": {"id": "p", "age": 40, "gender": "male"}}) == 2
+    assert [(p['status'], p['ref_range']) for p in result['parameters']] == [
+        ("normal", "13.0-17.0"),
+        ("high", "4-11 (lab)"),  # a range the client sent is kept
+        ("low", ""),  # text values keep the status they came with
+        ("high", "0.5-2.5"),  # no configured range
+    ]
+
+
+def test_classify_values_boundaries():
+    values = np.array([9.0, 10.0, 20.0, 21.0, 5.0, 4.0, 31.0, 1e9])
+    count = len(values)
+    statuses = server.classify_values(values, np.full(count, 10.0), np.full(count, 20.0),
+                                      np.array([5.0] * 7 + [np.nan]), np.array([30.0] * 7 + [np.nan]))
+    assert list(statuses) == ["low", "normal", "normal", "high", "low", "critical", "critical", "high"]
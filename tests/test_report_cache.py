@@ -0,0 +1,42 @@
+import asyncio
+
+import server
+
+
+def test_report_put_again_after_eviction_is_written_to_disk(tmp_path):
+    async def scenario():
+        cache = server.ReportCache(tmp_path, max_bytes=1500)
+        cache.load()
+        for key in ("report", "other"):
+            await cache.put(key, [f"{key}-result"], b"%PDF" + key.encode() * 200)
+            cache.release(key)
+        assert not cache.path("report").exists()  # evicted to stay under max_bytes
+        await cache.put("report", ["report-result"], b"%PDF" + b"report" * 200)
+        cache.release("report")
+        path = cache.get("report")
+        cache.release("report")
+        return path
+
+    path = asyncio.run(scenario())
+    assert path is not None
+    assert path.read_bytes() == b"%PDF" + b"report" * 200
+
+
+def test_evicted_report_stays_on_disk_until_released(tmp_path):
+    async def scenario():
+        cache = server.ReportCache(tmp_path, max_bytes=1500)
+        cache.load()
+        await cache.put("served", [], b"a" * 1000)
+        cache.release("served")
+        served = cache.get("served")
+        await cache.put("newer", [], b"b" * 1000)
+        cache.release("newer")
+        still_there = served.exists()
+        cache.release("served")
+        return cache, served, still_there
+
+    cache, served, still_there = asyncio.run(scenario())
+    assert still_there
+    assert not served.exists()
+    assert cache.get("served") is None
+    assert list(tmp_path.glob("*.tmp")) == []
@@ -0,0 +1,61 @@
+from datetime import datetime, timezone
+
+import pytest
+from reportlab.platypus.doctemplate import ActionFlowable
+
+import server
+
+
+class LayoutRecorder(server.SimpleDocTemplate):
+    """SimpleDocTemplate that records where every flowable was placed"""
+
+    documents = []
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.placements = []
+        self.flowables = []
+        LayoutRecorder.documents.append(self)
+
+    def afterFlowable(self, flowable):
+        # Skip the page breaks between reports and ReportLab's own (reused) action markers
+        if isinstance(flowable, (server.PageBreak, ActionFlowable)):
+            return
+        self.flowables.append(flowable)
+        self.placements.append((self.page, type(flowable).__name__, round(self.frame._y, 3)))
+
+
+@pytest.fixture
+def recorder(monkeypatch):
+    LayoutRecorder.documents = []
+    monkeypatch.setattr(server, "SimpleDocTemplate", LayoutRecorder)
+    return LayoutRecorder.documents
+
+
+def report(index: int, results: int):
+    """A report whose result tables push it over one page once `results` is large enough"""
+    patient = {"uhid": f"UHID{index:06d}", "name": f"Patient {index}", "age": 30 + index, "gender": "female",
+               "phone": "9999999999"}
+    sample = {"sample_id": f"SMP{index:08d}", "sample_type": "Blood",
+              "collection_date": datetime(2025, 3, 1, 9, 30, tzinfo=timezone.utc)}
+    parameters = [{"parameter_name": f"Parameter {n}", "value": str(n), "unit": "mg/dL", "ref_range": "1-10",
+                   "status": ("normal", "high", "low", "critical")[n % 4]} for n in range(6)]
+    return patient, sample, [{"id": f"result-{index}-{n}", "test_name": f"Test {n}", "parameters": parameters,
+                              "interpretation": "Within limits" if n % 2 else None} for n in range(results)]
+
+
+def test_batch_lays_out_each_report_like_its_single_render(recorder):
+    reports = [report(1, 1), report(2, 6), report(3, 2), report(4, 6)]
+    server.generate_report_document(reports)
+    batch = recorder.pop()
+
+    expected = []
+    for patient, sample, results in reports:
+        server.generate_pdf_report(patient, sample, results)
+        single = recorder.pop()
+        offset = expected[-1][0] if expected else 0
+        expected.extend((page + offset, kind, y) for page, kind, y in single.placements)
+
+    assert batch.page > len(reports)  # some reports run over a page
+    assert batch.placements == expected
+    assert len({id(flowable) for flowable in batch.flowables}) == len(batch.flowables)
@@ -0,0 +1,88 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import server
+
+
+@pytest.fixture
+def events(monkeypatch):
+    """TAT events published while the test runs, as (topic, sample code)"""
+    published = []
+
+    def publish(topic, data):
+        if topic.startswith("tat."):
+            published.append((topic, data['sample_id']))
+
+    monkeypatch.setattr(server.event_bus, "publish", publish)
+    return published
+
+
+def open_sample(code: str, deadline: datetime):
+    return {"id": code.lower(), "sample_id": code, "status": "received", "tat_deadline": deadline,
+            "created_at": deadline - timedelta(hours=4), "tests": [{"test_name": "Complete Blood Count"}]}
+
+
+def test_events_fire_in_deadline_order_and_closed_samples_stay_quiet(lab_db, events):
+    now = datetime.now(timezone.utc)
+    samples = [open_sample("A", now + timedelta(minutes=60)), open_sample("B", now + timedelta(minutes=20)),
+               open_sample("C", now + timedelta(minutes=120)), open_sample("D", now + timedelta(minutes=90))]
+    monitor = server.TATMonitor(lab_db.samples, lab_db.tat_breaches, warning_minutes=30)
+
+    async def scenario():
+        await lab_db.samples.insert_many([dict(sample) for sample in samples])
+        for sample in samples:
+            monitor.track(sample, now)
+        first = monitor._heap[0]
+        fired = [await monitor.fire_due(now + timedelta(minutes=minutes)) for minutes in (10, 35)]
+
+        # C is rejected through the API path, D by another worker (only the stored status changes)
+        await lab_db.samples.update_one({"id": "c"}, {"$set": {"status": "rejected"}})
+        await monitor.sample_updated({**samples[2], "status": "rejected"})
+        await lab_db.samples.update_one({"id": "d"}, {"$set": {"status": "rejected"}})
+        fired.append(await monitor.fire_due(now + timedelta(minutes=300)))
+        return first, fired, await lab_db.tat_breaches.find({}, {"_id": 0}).to_list(None)
+
+    first, fired, breaches = asyncio.run(scenario())
+    assert first[0] == now + timedelta(minutes=20) and first[2:] == ("breached", "b")
+    assert fired == [0, 2, 2]
+    assert events == [("tat.approaching", "A"), ("tat.breach", "B"), ("tat.breach", "A")]
+    assert sorted(breach['sample_code'] for breach in breaches) == ["A", "B"]
+    assert (monitor.approaching, monitor.breached, monitor.skipped) == (1, 2, 1)
+    assert monitor._deadlines == {}
+
+
+def test_rejecting_a_breached_sample_closes_its_breach(lab_db, events):
+    now = datetime.now(timezone.utc)
+    sample = open_sample("E", now - timedelta(minutes=45))
+    monitor = server.TATMonitor(lab_db.samples, lab_db.tat_breaches)
+
+    async def scenario():
+        await lab_db.samples.insert_one(dict(sample))
+        await monitor.load()  # already overdue: recorded without an alert
+        await monitor.sample_updated({**sample, "status": "rejected"})
+        return await lab_db.tat_breaches.find_one({"sample_id": "e"}), await lab_db.dashboard_counters.find_one({})
+
+    breach, counters = asyncio.run(scenario())
+    assert events == []
+    assert breach['closed_status'] == "rejected"
+    assert breach['overdue_minutes'] >= 45
+    assert counters['tat_breaches'] == 0
+    assert monitor.closed_late == 1
+
+
+def test_rejected_samples_are_not_loaded_or_counted_as_breached(lab_db):
+    now = datetime.now(timezone.utc)
+    rejected = {**open_sample("F", now - timedelta(minutes=5)), "status": "rejected"}
+    monitor = server.TATMonitor(lab_db.samples, lab_db.tat_breaches)
+
+    async def scenario():
+        await lab_db.samples.insert_one(dict(rejected))
+        await monitor.load()
+        return await lab_db.tat_breaches.count_documents({}), await server.dashboard_counters.count(now)
+
+    recorded, counted = asyncio.run(scenario())
+    assert recorded == 0
+    assert counted['tat_breaches'] == 0
+    assert monitor._deadlines == {}
@@ -0,0 +1,93 @@
+import asyncio
+import random
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+import server
+
+START = datetime(2025, 1, 15, tzinfo=timezone.utc)
+END = datetime(2025, 3, 10, tzinfo=timezone.utc)
+TESTS = ["Complete Blood Count", "Lipid Profile", "Complete Blood Count, Lipid Profile"]
+
+
+def approvals(count: int = 1500, seed: int = 24):
+    """Samples and approved results spread over START..END (plus some outside it), with log-normal TATs"""
+    rng = random.Random(seed)
+    samples, results, exact = [], [], []
+    for index in range(count):
+        approved = START - timedelta(days=5) + timedelta(minutes=rng.uniform(0, (END - START).days + 10) * 1440)
+        minutes = max(2.0, rng.lognormvariate(5.5, 1.0))
+        collected = approved - timedelta(minutes=minutes)
+        sample_type = rng.choice(["Blood", "Serum"])
+        test_name = rng.choice(TESTS)
+        samples.append({"id": f"s{index}", "sample_type": sample_type, "collection_date": collected,
+                        "created_at": collected, "tat_deadline": collected + timedelta(hours=6)})
+        results.append({"id": f"r{index}", "sample_id": f"s{index}", "test_name": test_name, "status": "approved",
+                        "approved_at": approved, "updated_at": approved})
+        if START <= approved.replace(hour=0, minute=0, second=0, microsecond=0) <= END:
+            for name in server.result_test_names({"test_name": test_name}):
+                exact.append({"minutes": (approved - collected).total_seconds() / 60, "test": name, "sample_type": sample_type,
+                              "day": approved.strftime("%Y-%m-%d"), "month": approved.strftime("%Y-%m"),
+                              "breached": minutes > 360})
+    return samples, results, exact
+
+
+@pytest.fixture(scope="module")
+def rolled_up():
+    """A TATRollup over its own in-memory database, built once for the module"""
+    database = AsyncMongoMockClient()["lis_test"]
+    samples, results, exact = approvals()
+    rollup = server.TATRollup(database.test_results, database.samples, database.tat_rollups, batch_size=400)
+
+    async def load():
+        await database.samples.insert_many(samples)
+        await database.test_results.insert_many(results)
+        return await rollup.rebuild()
+
+    assert asyncio.run(load()) == len(results)
+    return rollup, exact
+
+
+@pytest.mark.parametrize("group_by, field", [("none", None), ("test", "test"), ("sample_type", "sample_type"),
+                                              ("month", "month"), ("day", "day")])
+def test_merged_histogram_percentiles_stay_within_one_bucket(rolled_up, group_by, field):
+    rollup, exact = rolled_up
+    report = asyncio.run(rollup.report(START, END, group_by))
+    expected = {}
+    for row in exact:
+        expected.setdefault(row[field] if field else "all", []).append(row)
+
+    assert {group['group'] for group in report['groups']} == set(expected)
+    growth = server.TAT_HISTOGRAM_GROWTH
+    for group in report['groups']:
+        rows = expected[group['group']]
+        minutes = np.array([row['minutes'] for row in rows])
+        assert group['count'] == len(rows)
+        assert group['breaches'] == sum(row['breached'] for row in rows)
+        assert group['mean_minutes'] == pytest.approx(minutes.mean(), abs=0.05)
+        for quantile, key in ((0.5, "p50_minutes"), (0.9, "p90_minutes"), (0.99, "p99_minutes")):
+            true_value = np.quantile(minutes, quantile, method="inverted_cdf")
+            # The reported value is the middle of the bucket holding the true percentile
+            assert true_value / growth <= group[key] <= true_value * growth, (group['group'], key)
+
+
+def test_rolled_up_results_are_counted_once(rolled_up):
+    rollup, exact = rolled_up
+    assert asyncio.run(rollup.run_once()) == 0
+    report = asyncio.run(rollup.report(START, END))
+    assert report['groups'][0]['count'] == len(exact)
+
+
+def test_tat_bucket_edges():
+    growth = server.TAT_HISTOGRAM_GROWTH
+    assert server.tat_bucket(0.5) == 0
+    assert server.tat_bucket(1.0) == 1
+    for bucket in (2, 50, 200):
+        low = growth ** (bucket - 1) * 1.0001
+        assert server.tat_bucket(low) == bucket
+        middle = float(server.tat_bucket_minutes(np.array(bucket)))
+        assert low <= middle < growth ** bucket
+    assert server.tat_bucket(1e12) == server.TAT_HISTOGRAM_BUCKETS - 1
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+import server
+
+LIPID = {"test_code": "LIP001", "test_name": "Lipid Profile", "category": "Biochemistry", "price": 500, "tat_hours": 6,
+         "sample_type": "Serum", "parameters": [
+             {"parameter_name": "Total Cholesterol", "unit": "mg/dL", "ref_range_male": "<200", "ref_range_female": "<200"}]}
+
+
+def test_unchanged_catalog_answers_304(catalog, api_client):
+    first = api_client.get("/api/tests")
+    etag = first.headers['etag']
+    assert first.status_code == 200
+    assert [test['test_code'] for test in first.json()] == ["CBC001", "GLU001"]
+
+    for header in (etag, f"W/{etag}", f'"other", {etag}', "*"):
+        again = api_client.get("/api/tests", headers={"If-None-Match": header})
+        assert (again.status_code, again.content, again.headers['etag']) == (304, b"", etag)
+    assert api_client.get("/api/tests", headers={"If-None-Match": '"tests-0-stale"'}).status_code == 200
+
+
+def test_creating_a_test_bumps_the_version_and_etag(catalog, api_client):
+    before = api_client.get("/api/tests")
+    version = catalog.version
+
+    created = api_client.post("/api/tests", json=LIPID).json()
+    after = api_client.get("/api/tests", headers={"If-None-Match": before.headers['etag']})
+
+    assert catalog.version == version + 1
+    assert after.status_code == 200
+    assert after.headers['etag'] != before.headers['etag']
+    assert after.headers['etag'].startswith(f'"tests-{version + 1}-')
+    assert [test['test_code'] for test in after.json()] == ["CBC001", "GLU001", "LIP001"]
+    assert api_client.get(f"/api/tests/{created['id']}").json()['test_name'] == "Lipid Profile"
+    assert api_client.get("/api/tests", headers={"If-None-Match": after.headers['etag']}).status_code == 304
+
+
+def test_other_workers_reload_only_after_the_version_moves(catalog, lab_db, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(server.time, "monotonic", lambda: clock[0])
+    worker = server.TestCatalog(lab_db.test_configs, lab_db.counters, check_interval=5.0)
+
+    async def scenario():
+        await worker.refresh()
+        loaded = (worker.reloads, worker.version_checks)
+        await lab_db.test_configs.insert_one(server.TestConfig(**LIPID).model_dump())
+        await catalog.bump()
+
+        await worker.refresh()  # within check_interval: not even the version is read
+        stale = (worker.by_code("LIP001"), worker.version_checks)
+        clock[0] += 5.0
+        await worker.refresh()
+        moved = (worker.by_code("LIP001")['test_name'], worker.version, worker.etag == catalog.etag)
+        clock[0] += 5.0
+        await worker.refresh()  # version unchanged: checked but not reloaded
+        return loaded, stale, moved, (worker.reloads, worker.version_checks)
+
+    loaded, stale, moved, counts = asyncio.run(scenario())
+    assert loaded == (1, 1)
+    assert stale == (None, 1)
+    assert moved == ("Lipid Profile", catalog.version, True)
+    assert counts == (2, 3)
+
+
+@pytest.mark.parametrize("header, matches", [
+    (None, False), ("", False), ('"a"', True), ('W/"a"', True), ('"b", "a"', True), ("*", True), ('"b"', False)])
+def test_etag_matches(header, matches):
+    assert server.etag_matches(header, '"a"') is matches
@@ -0,0 +1,87 @@
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Moves time.monotonic forward by clock[0] seconds (event loops keep a clock that only advances)"""
+    offset = [0.0]
+    real = time.monotonic
+    monkeypatch.setattr(server.time, "monotonic", lambda: real() + offset[0])
+    return offset
+
+
+@pytest.fixture
+def client(lab_db, monkeypatch):
+    """The app with real token authentication and empty user/token caches"""
+    monkeypatch.setattr(server, "user_cache", server.TTLCache(16, 30.0))
+    monkeypatch.setattr(server, "token_cache", server.TTLCache(16, 3600.0))
+    return TestClient(server.app)
+
+
+def sign_in(lab_db, email: str, role: str):
+    """A stored user and the headers of a token issued to it"""
+    user = server.User(email=email, name=email.split("@")[0], role=role)
+    asyncio.run(lab_db.users.insert_one({**user.model_dump(), "password": "unused"}))
+    return user, {"Authorization": f"Bearer {server.create_access_token({'sub': user.id})}"}
+
+
+def test_entries_expire_after_their_ttl(clock):
+    cache = server.TTLCache(4, 30.0)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=60.0)
+    cache.set("c", 3, ttl=0)
+    clock[0] = 29.0
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, 2, None)
+    clock[0] = 30.0
+    assert (cache.get("a"), cache.get("b")) == (None, 2)
+    clock[0] = 60.0
+    assert cache.get("b") is None
+    assert cache.stats() == {"size": 0, "maxsize": 4, "hits": 3, "misses": 3, "hit_ratio": 0.5}
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = server.TTLCache(2, 30.0)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+    assert cache.pop("a") == 1 and cache.get("a") is None
+
+
+def test_role_change_and_deactivation_apply_to_the_next_request(lab_db, client):
+    _, admin = sign_in(lab_db, "admin@example.com", "admin")
+    user, headers = sign_in(lab_db, "tech@example.com", "technician")
+    assert client.get("/api/auth/me", headers=headers).json()['role'] == "technician"
+
+    updated = client.put(f"/api/users/{user.id}", json={"role": "pathologist"}, headers=admin)
+    assert updated.json()['role'] == "pathologist"
+    assert "password" not in updated.json()
+    assert client.get("/api/auth/me", headers=headers).json()['role'] == "pathologist"
+
+    assert client.post(f"/api/users/{user.id}/deactivate", headers=admin).json()['is_active'] is False
+    response = client.get("/api/auth/me", headers=headers)
+    assert (response.status_code, response.json()['detail']) == (401, "Account is inactive")
+
+
+def test_user_routes_reject_unknown_users_and_empty_updates(lab_db, client):
+    user, headers = sign_in(lab_db, "admin@example.com", "admin")
+    assert client.put("/api/users/missing", json={"role": "admin"}, headers=headers).status_code == 404
+    assert client.post("/api/users/missing/deactivate", headers=headers).status_code == 404
+    assert client.put(f"/api/users/{user.id}", json={}, headers=headers).status_code == 400
+
+
+def test_database_edits_reach_a_cached_user_when_the_ttl_runs_out(lab_db, client, clock):
+    user, headers = sign_in(lab_db, "tech@example.com", "technician")
+    assert client.get("/api/auth/me", headers=headers).status_code == 200
+    asyncio.run(lab_db.users.update_one({"id": user.id}, {"$set": {"is_active": False}}))
+
+    assert client.get("/api/auth/me", headers=headers).status_code == 200  # still cached
+    clock[0] = 30.0
+    assert client.get("/api/auth/me", headers=headers).status_code == 401